@@ -22,12 +22,13 @@ from utils import (
 )
 import os
 import sys
+import threading
 from dotenv import load_dotenv
 import asyncio
 import json
 from PIL import Image
 from food_vision import NutriNetVision
-from services.rag_service import init_rag
+from services.rag_service import init_rag, warmup as warmup_rag
 from services.agent_service import build_agent
 from components.agent_trace import render_agent_trace
 from ui_pages.plan_page import render_plan_page
@@ -98,6 +99,21 @@ except Exception:
     # Defer import errors to UI when initializing RAG
     pass
 
+
+@st.cache_resource(show_spinner=False)
+def _start_rag_warmup():
+    """Once per process: build the RAG clients on a background thread so the first chat
+    request doesn't pay for client construction and the langchain imports behind it."""
+    if os.getenv("DISABLE_RAG", "").lower() in ("1", "true", "yes"):
+        return None
+    cfg_path = os.path.join(os.path.dirname(__file__), "rag", "config.yaml")
+    thread = threading.Thread(target=warmup_rag, args=(cfg_path,), name="rag-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+_start_rag_warmup()
+
 # Page configuration moved to top to satisfy Streamlit requirement
 
 # Initialize managers
@@ -111,7 +127,7 @@ if "chat_manager" not in st.session_state:
 auth_manager = st.session_state.auth_manager
 db_manager = st.session_state.db_manager
 # If code changed and the cached instance lacks new methods, refresh it
-if not hasattr(db_manager, "save_user_preferences"):
+if not hasattr(db_manager, "save_meal_with_analysis"):
     st.session_state.db_manager = DatabaseManager()
     db_manager = st.session_state.db_manager
 chat_manager = st.session_state.chat_manager
@@ -5,14 +5,19 @@ Replaces Gemini with AssemblyAI LeMUR for Q&A/plan generation while retaining Vo
 """
 
 import argparse
+import hashlib
 import json
 import os
+import pickle
 import queue
+import re
 import sys
-import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Dict
 
+import numpy as np
 import sounddevice as sd
 
 # Add the utils directory to the path
@@ -20,14 +25,148 @@ utils_path = os.path.join(os.path.dirname(__file__), "utils")
 if utils_path not in sys.path:
     sys.path.insert(0, utils_path)
 
+from audio_ring import AudioRingBuffer
 from stt_vosk import VoskSTT
 from tts_pyttsx3 import TTS
 
+try:
+    from vad_silero import SileroVAD
+except Exception:
+    SileroVAD = None
+
+try:
+    from semantic_cache import SemanticCache, load_encoder
+except Exception:
+    SemanticCache = load_encoder = None
+
+try:
+    from food_embeddings import FoodEmbeddingIndex
+except Exception:
+    FoodEmbeddingIndex = None
+
 try:
     import assemblyai as aai
 except Exception:
     aai = None
 
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except Exception:
+    _json_loads = json.loads
+
+try:
+    from cachetools import TTLCache
+except Exception:
+    TTLCache = None
+
+# Optional: on-disk tier for LeMUR answers, so repeats are served across restarts
+try:
+    import diskcache
+except Exception:
+    diskcache = None
+
+# Optional: Hyperscan (x86 SIMD multi-pattern matcher) for KB term scanning
+try:
+    import hyperscan
+except Exception:
+    hyperscan = None
+
+# Optional: pyahocorasick, a portable one-pass multi-term matcher when Hyperscan is missing
+try:
+    import ahocorasick
+except Exception:
+    ahocorasick = None
+
+LEMUR_ERROR_REPLY = "I'm sorry, I'm having trouble connecting to my nutrition service. Please try again later."
+PLAN_ERROR_REPLY = "I'm sorry, I couldn't create a plan right now. Please try again."
+LEMUR_EMPTY_REPLY = "I'm sorry, I couldn't generate a response."
+PLAN_EMPTY_REPLY = "I could not create a plan right now."
+# Control tokens and failure replies; never stored in the reply cache
+_UNCACHED_REPLIES = frozenset(
+    {"__STOP__", LEMUR_ERROR_REPLY, PLAN_ERROR_REPLY, LEMUR_EMPTY_REPLY, PLAN_EMPTY_REPLY}
+)
+
+# Persistent LeMUR answer cache; LEMUR_DISK_CACHE=0 disables it
+LEMUR_DISK_CACHE_ENABLED = os.getenv("LEMUR_DISK_CACHE", "1") != "0"
+LEMUR_CACHE_DIR = os.getenv("LEMUR_CACHE_DIR", ".lemur_cache")
+LEMUR_CACHE_TTL_S = 7 * 24 * 3600
+
+# Bump when the derived KB index format changes so stale pickles are rebuilt
+KB_CACHE_VERSION = 2
+
+# Nutrient words -> (KB key, unit); insertion order is the match priority
+NUTRIENT_WORDS = {
+    "calorie": ("calories", ""),
+    "calories": ("calories", ""),
+    "protein": ("protein", "g"),
+    "proteins": ("protein", "g"),
+    "carb": ("carbs", "g"),
+    "carbs": ("carbs", "g"),
+    "carbohydrate": ("carbs", "g"),
+    "carbohydrates": ("carbs", "g"),
+    "fat": ("fat", "g"),
+    "fats": ("fat", "g"),
+    "fiber": ("fiber", "g"),
+    "fibre": ("fiber", "g"),
+    "sugar": ("sugar", "g"),
+    "sugars": ("sugar", "g"),
+}
+MACRO_SUMMARY_WORDS = frozenset({"nutrition", "nutritional", "nutrients", "macros", "values"})
+
+_WORD_RE = re.compile(r"[a-z]+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def extract_wake_query(text: str, lower_text: str) -> Optional[str]:
+    """Return the query following the wake word ("ryan" / "hey ryan"), or None if absent."""
+    i = lower_text.find("ryan")
+    if i < 0:
+        return None
+    if i >= 4 and lower_text.startswith("hey ", i - 4):
+        wake_index, phrase = i - 4, "hey ryan"
+    else:
+        wake_index, phrase = i, "ryan"
+    return text[wake_index + len(phrase) :].lstrip(" ,.:;!?-")
+
+
+def compile_keywords(keywords) -> "re.Pattern[str]":
+    """Compile literal keywords into one alternation; longest first so overlaps match greedily."""
+    unique = sorted(set(keywords), key=len, reverse=True)
+    return re.compile("|".join(re.escape(k) for k in unique))
+
+
+# Intent keyword sets, compiled once at import; exact matches use frozensets
+_GREETINGS = frozenset({"hi", "hello", "hey"})
+_GREETING_PHRASES_RE = compile_keywords(["good morning", "good evening", "good afternoon"])
+_PLAN_PHRASES_RE = compile_keywords(
+    [
+        "diet plan",
+        "meal plan",
+        "workout plan",
+        "gym plan",
+        "weekly plan",
+        "7-day plan",
+        "7 day plan",
+        "seven day plan",
+        "seven-day plan",
+        "routine",
+        "program",
+    ]
+)
+_PLAN_TOPICS_RE = compile_keywords(["diet", "meal", "workout", "gym", "training"])
+_PLAN_GOALS_RE = compile_keywords(
+    ["weight gain", "gain weight", "weight loss", "lose weight", "bulking", "cutting"]
+)
+_GOAL_CONTEXT_RE = compile_keywords(["plan", "diet", "workout", "gym"])
+
+
+def normalize_query(text: str) -> str:
+    """Canonical cache key for a user query: trimmed, single-spaced, lowercase."""
+    return _WHITESPACE_RE.sub(" ", (text or "").strip()).lower()
+
 
 class AssemblyNutritionAssistant:
     def __init__(
@@ -37,10 +176,51 @@ class AssemblyNutritionAssistant:
         nutrition_kb_path: str = "models/accurate_nutrition_kb.json",
         device_index: int = 0,
         log_callback=None,
+        blocksize: int = 1600,
+        use_vad: bool = True,
+        prewarm: bool = True,
+        semantic_cache: bool = False,
+        semantic_food_match: bool = False,
     ):
-        self.stt = VoskSTT(model_path=model_path, samplerate=16000)
+        # Load the Vosk model in the background while the KB is parsed and indexed below
+        self.stt = None
+        stt_error = []
+
+        def load_stt():
+            try:
+                self.stt = VoskSTT(model_path=model_path, samplerate=16000)
+            except Exception as e:
+                stt_error.append(e)
+
+        stt_thread = threading.Thread(target=load_stt, name="vosk-load", daemon=True)
+        stt_thread.start()
+
+        # Optional speech gate: only voiced audio is decoded by Vosk
+        self.vad = None
+        if use_vad and SileroVAD is not None:
+            try:
+                self.vad = SileroVAD(samplerate=16000)
+            except Exception as e:
+                print(f"⚠️  Silero VAD unavailable, decoding all audio: {e}")
         self.tts = TTS(rate=200)
+        # Replies (LeMUR round-trips) run here so the audio consumer never blocks on the network
+        self._exec = ThreadPoolExecutor(max_workers=2, thread_name_prefix="reply")
+        # Sentence pipeline: replies are split into sentences and spoken by a
+        # dedicated worker, so playback starts as soon as the first one is queued
+        self._speech_queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._speaking = threading.Event()
+        # Set during playback: the audio callback drops blocks instead of the stream being restarted
+        self._muted = threading.Event()
+        self.is_listening = False
+        self._speech_thread = threading.Thread(target=self._speech_worker, daemon=True)
+        self._speech_thread.start()
+        # Reply futures in utterance order; one consumer delivers them, so a fast KB answer
+        # never overtakes an earlier LeMUR call still in flight on the pool
+        self._reply_queue: "queue.Queue[Optional[Future]]" = queue.Queue()
+        self._reply_thread = threading.Thread(target=self._reply_worker, name="reply-delivery", daemon=True)
+        self._reply_thread.start()
         self.device_index = device_index
+        self.blocksize = blocksize
         self.log_callback = log_callback
 
         if not assembly_key:
@@ -51,8 +231,58 @@ class AssemblyNutritionAssistant:
             )
 
         aai.settings.api_key = assembly_key
+        # One LeMUR handle for all requests so the SDK's pooled HTTP client is reused
+        self._lemur = aai.Lemur()
+
+        self._load_kb_index(nutrition_kb_path)
 
-        self.nutrition_data = self.load_nutrition_kb(nutrition_kb_path)
+        # Reply caches (LRU + TTL) keyed on the normalized query; disabled if cachetools is missing
+        self._cache_lock = threading.Lock()
+        self._reply_cache = TTLCache(maxsize=512, ttl=3600) if TTLCache else None
+        self._lemur_cache = TTLCache(maxsize=512, ttl=3600) if TTLCache else None
+        self._lemur_disk = None
+        if diskcache is not None and LEMUR_DISK_CACHE_ENABLED:
+            try:
+                self._lemur_disk = diskcache.Cache(LEMUR_CACHE_DIR)
+            except Exception as e:
+                print(f"⚠️  LeMUR disk cache unavailable: {e}")
+        # Both semantic features share one (int8 ONNX when available) MiniLM encoder
+        encoder = None
+        if (semantic_cache or semantic_food_match) and load_encoder is not None:
+            try:
+                encoder = load_encoder()
+            except Exception as e:
+                print(f"⚠️  Sentence encoder unavailable: {e}")
+        # Opt-in: near-duplicate questions about the same food reuse a cached LeMUR answer
+        self._semantic_cache = None
+        if semantic_cache:
+            if encoder is None:
+                print("⚠️  Semantic cache needs sentence-transformers; using exact-match caching only")
+            else:
+                self._semantic_cache = SemanticCache(encoder=encoder)
+        # Opt-in: foods the substring scan misses are matched by embedding similarity. The KB
+        # names are encoded (or the saved faiss index loaded) in the background; lookups use
+        # the index once it is ready.
+        self._food_emb_index = None
+        self._food_index_building = threading.Event()
+        if semantic_food_match:
+            if encoder is None or FoodEmbeddingIndex is None:
+                print("⚠️  Semantic food match needs sentence-transformers; using keyword matching only")
+            else:
+                names = [food["name"] for food in self.nutrition_data]
+
+                def build_food_index():
+                    try:
+                        self._food_emb_index = FoodEmbeddingIndex(
+                            names, encoder=encoder, cache_prefix=nutrition_kb_path
+                        )
+                    except Exception as e:
+                        print(f"⚠️  Semantic food match unavailable: {e}")
+                    finally:
+                        self._food_index_building.clear()
+
+                self._food_index_building.set()
+                threading.Thread(target=build_food_index, name="food-embed", daemon=True).start()
 
         # Allowed intents keywords
         self.nutrition_keywords = [
@@ -194,85 +424,7 @@ class AssemblyNutritionAssistant:
             "smoking",
         ]
 
-    def log(self, message, log_type="system"):
-        """Log a message to both console and UI"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        formatted_message = f"[{timestamp}] {message}"
-
-        # Print to console
-        print(formatted_message)
-
-        # Send to UI callback if available
-        if self.log_callback:
-            self.log_callback(message, log_type)
-
-    def load_nutrition_kb(self, kb_path: str) -> list:
-        try:
-            if not os.path.exists(kb_path):
-                print(f"⚠️  Nutrition knowledge base not found at {kb_path}")
-                print("💡 Run 'py simple_accurate_trainer.py' first to create it")
-                return []
-            with open(kb_path, "r") as f:
-                data = json.load(f)
-            print(f"✅ Loaded nutrition knowledge base with {len(data)} items")
-            return data
-        except Exception as e:
-            print(f"❌ Error loading nutrition knowledge base: {e}")
-            return []
-
-    def is_plan_request(self, text: str) -> bool:
-        t = text.lower()
-        plan_tokens = [
-            "diet plan",
-            "meal plan",
-            "workout plan",
-            "gym plan",
-            "weekly plan",
-            "7-day plan",
-            "7 day plan",
-            "seven day plan",
-            "seven-day plan",
-            "routine",
-            "program",
-        ]
-        goals = [
-            "weight gain",
-            "gain weight",
-            "weight loss",
-            "lose weight",
-            "bulking",
-            "cutting",
-        ]
-        if any(p in t for p in plan_tokens):
-            return True
-        if ("plan" in t) and (
-            "diet" in t
-            or "meal" in t
-            or "workout" in t
-            or "gym" in t
-            or "training" in t
-        ):
-            return True
-        if any(g in t for g in goals) and (
-            "plan" in t or "diet" in t or "workout" in t or "gym" in t
-        ):
-            return True
-        if ("weekly" in t and "plan" in t) and (
-            "diet" in t or "meal" in t or "workout" in t or "gym" in t
-        ):
-            return True
-        return False
-
-    def is_nutrition_query(self, text: str) -> bool:
-        text_lower = text.lower()
-        has_nutrition_keyword = any(
-            keyword in text_lower for keyword in self.nutrition_keywords
-        )
-        has_gym_keyword = any(keyword in text_lower for keyword in self.gym_keywords)
-        has_health_keyword = any(
-            keyword in text_lower for keyword in self.health_keywords
-        )
-        question_patterns = [
+        self.question_patterns = [
             "how many",
             "how much",
             "what are",
@@ -288,22 +440,8 @@ class AssemblyNutritionAssistant:
             "amount in",
             "ingredients in",
         ]
-        has_question_pattern = any(
-            pattern in text_lower for pattern in question_patterns
-        )
-        return (
-            has_nutrition_keyword
-            or has_gym_keyword
-            or has_health_keyword
-            or has_question_pattern
-        )
 
-    def is_blocked_query(self, text: str) -> bool:
-        text_lower = text.lower()
-        if self.is_plan_request(text_lower):
-            return False
-        has_blocked_topic = any(topic in text_lower for topic in self.blocked_topics)
-        non_nutrition_patterns = [
+        self.non_nutrition_patterns = [
             "what time",
             "what date",
             "what day",
@@ -318,58 +456,252 @@ class AssemblyNutritionAssistant:
             "define",
             "meaning of",
         ]
-        has_non_nutrition_pattern = any(
-            pattern in text_lower for pattern in non_nutrition_patterns
+        self._blocked_re = compile_keywords(self.blocked_topics + self.non_nutrition_patterns)
+
+        # All in-scope keywords as one alternation, scanned by the C regex engine in a single pass
+        self._nutrition_re = compile_keywords(
+            self.nutrition_keywords
+            + self.gym_keywords
+            + self.health_keywords
+            + self.question_patterns
         )
-        return has_blocked_topic or has_non_nutrition_pattern
-
-    def find_food_in_query(self, text: str) -> Optional[Dict]:
-        text_lower = text.lower()
-        best_match = None
-        best_score = 0
-        for food in self.nutrition_data:
-            score = 0
+
+        stt_thread.join()
+        if stt_error:
+            raise stt_error[0]
+
+        if prewarm:
+            # Throwaway LeMUR request: pays TLS handshake/cold start before the first real question
+            self._exec.submit(self._prewarm_lemur)
+
+    def _prewarm_lemur(self) -> None:
+        try:
+            self._lemur.task(
+                input_text="ping",
+                prompt="Reply with: ok",
+                final_model="anthropic/claude-3-haiku",
+            )
+        except Exception:
+            pass
+
+    def log(self, message, log_type="system"):
+        """Log a message to both console and UI"""
+        timestamp = datetime.now().strftime("%H:%M:%S")
+        formatted_message = f"[{timestamp}] {message}"
+
+        # Print to console
+        print(formatted_message)
+
+        # Send to UI callback if available
+        if self.log_callback:
+            self.log_callback(message, log_type)
+
+    def load_nutrition_kb(self, kb_path: str) -> list:
+        try:
+            if not os.path.exists(kb_path):
+                print(f"⚠️  Nutrition knowledge base not found at {kb_path}")
+                print("💡 Run 'py simple_accurate_trainer.py' first to create it")
+                return []
+            with open(kb_path, "rb") as f:
+                data = _json_loads(f.read())
+            print(f"✅ Loaded nutrition knowledge base with {len(data)} items")
+            return data
+        except Exception as e:
+            print(f"❌ Error loading nutrition knowledge base: {e}")
+            return []
+
+    def _load_kb_index(self, kb_path: str) -> None:
+        """Load the KB and its term arrays, reusing `<kb_path>.pkl` while it matches the KB's mtime/size."""
+        cache_path = kb_path + ".pkl"
+        try:
+            st = os.stat(kb_path)
+            stamp = (KB_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+        cached = None
+        if stamp is not None and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "rb") as f:
+                    cached = pickle.load(f)
+                if cached.get("stamp") != stamp:
+                    cached = None
+            except Exception:
+                cached = None
+
+        if cached is not None:
+            self.nutrition_data = cached["data"]
+            index = cached["index"]
+            print(f"✅ Loaded nutrition knowledge base with {len(self.nutrition_data)} items (cached)")
+        else:
+            self.nutrition_data = self.load_nutrition_kb(kb_path)
+            index = self._flatten_food_terms(self.nutrition_data)
+            if stamp is not None and self.nutrition_data:
+                try:
+                    with open(cache_path, "wb") as f:
+                        pickle.dump(
+                            {"stamp": stamp, "data": self.nutrition_data, "index": index},
+                            f,
+                            protocol=pickle.HIGHEST_PROTOCOL,
+                        )
+                except Exception as e:
+                    print(f"⚠️  Could not write KB cache {cache_path}: {e}")
+        self._set_food_index(*index)
+
+    def _build_food_index(self, data: list) -> None:
+        self._set_food_index(*self._flatten_food_terms(data))
+
+    @staticmethod
+    def _flatten_food_terms(data: list) -> tuple:
+        """Flatten the KB into parallel arrays (term, food index, weight) for scoring.
+        Every term is lowercased here, once, so queries never re-lower KB strings.
+        Weights mirror the matching rules: search term 1, name 2, synonym 1.5."""
+        terms, food_idx, weights = [], [], []
+        for i, food in enumerate(data):
             for term in food.get("search_terms", []):
-                if term in text_lower:
-                    score += 1
-            if food["name"].lower() in text_lower:
-                score += 2
+                terms.append(term.lower())
+                food_idx.append(i)
+                weights.append(1.0)
+            terms.append(food["name"].lower())
+            food_idx.append(i)
+            weights.append(2.0)
             for synonym in food.get("synonyms", []):
-                if synonym.lower() in text_lower:
-                    score += 1.5
-            if score > best_score:
-                best_score = score
-                best_match = {"food_item": food, "confidence": min(score / 3, 1.0)}
-        return best_match if best_score > 0 else None
+                terms.append(synonym.lower())
+                food_idx.append(i)
+                weights.append(1.5)
+        return (
+            terms,
+            np.array(food_idx, dtype=np.int32),
+            np.array(weights, dtype=np.float32),
+        )
+
+    def _set_food_index(self, terms: list, food_idx: np.ndarray, weights: np.ndarray) -> None:
+        self._kb_terms = terms
+        self._kb_term_food = food_idx
+        self._kb_term_weight = weights
+        self._kb_hs_db = self._compile_hyperscan(terms)
+        self._kb_hs_lock = threading.Lock()
+        self._kb_ac = self._build_automaton(terms) if self._kb_hs_db is None else None
+
+    def _compile_hyperscan(self, terms: list):
+        """Compile all KB terms into one Hyperscan block-mode database (None if unavailable)."""
+        if hyperscan is None or not terms:
+            return None
+        try:
+            db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+            db.compile(
+                expressions=[re.escape(t).encode("utf-8") for t in terms],
+                ids=list(range(len(terms))),
+                elements=len(terms),
+                flags=[hyperscan.HS_FLAG_SINGLEMATCH] * len(terms),
+            )
+            return db
+        except Exception as e:
+            print(f"⚠️  Hyperscan compile failed, using Python term scan: {e}")
+            return None
+
+    @staticmethod
+    def _build_automaton(terms: list):
+        """Aho-Corasick automaton over the KB terms, each key mapping to the indices of every
+        occurrence of that term in `terms` (None if pyahocorasick is unavailable)."""
+        if ahocorasick is None or not terms:
+            return None
+        ids_by_term: Dict[str, list] = {}
+        for i, term in enumerate(terms):
+            if term:
+                ids_by_term.setdefault(term, []).append(i)
+        automaton = ahocorasick.Automaton()
+        for term, ids in ids_by_term.items():
+            automaton.add_word(term, np.array(ids, dtype=np.intp))
+        automaton.make_automaton()
+        return automaton
+
+    def _match_kb_terms(self, text_lower: str) -> np.ndarray:
+        """Boolean mask over self._kb_terms: which terms occur in the text."""
+        if self._kb_hs_db is not None:
+            hits = np.zeros(len(self._kb_terms), dtype=bool)
+
+            def on_match(term_id, start, end, flags, context):
+                hits[term_id] = True
+
+            # Hyperscan scratch space is per-database and not thread-safe
+            with self._kb_hs_lock:
+                self._kb_hs_db.scan(text_lower.encode("utf-8"), match_event_handler=on_match)
+            return hits
+        if self._kb_ac is not None:
+            hits = np.zeros(len(self._kb_terms), dtype=bool)
+            # One pass over the text reports every (possibly overlapping) term occurrence
+            for _, ids in self._kb_ac.iter(text_lower):
+                hits[ids] = True
+            return hits
+        terms = self._kb_terms
+        return np.fromiter((term in text_lower for term in terms), dtype=bool, count=len(terms))
+
+    def is_plan_request(self, t_lower: str) -> bool:
+        """Expects already-lowercased text."""
+        t = t_lower
+        if _PLAN_PHRASES_RE.search(t):
+            return True
+        if "plan" in t and _PLAN_TOPICS_RE.search(t):
+            return True
+        # (The former "weekly ... plan" + topic rule is a special case of the one above)
+        return _PLAN_GOALS_RE.search(t) is not None and _GOAL_CONTEXT_RE.search(t) is not None
+
+    def is_nutrition_query(self, t_lower: str) -> bool:
+        """Expects already-lowercased text."""
+        return self._nutrition_re.search(t_lower) is not None
+
+    def is_blocked_query(self, t_lower: str) -> bool:
+        """Expects already-lowercased text."""
+        if self.is_plan_request(t_lower):
+            return False
+        return self._blocked_re.search(t_lower) is not None
+
+    def find_food_in_query(self, text: str, t_lower: Optional[str] = None) -> Optional[Dict]:
+        text_lower = t_lower if t_lower is not None else text.lower()
+        if not self._kb_terms:
+            return None
+        hits = self._match_kb_terms(text_lower)
+        if not hits.any():
+            return self._find_food_semantic(text)
+        scores = np.bincount(
+            self._kb_term_food[hits],
+            weights=self._kb_term_weight[hits],
+            minlength=len(self.nutrition_data),
+        )
+        # argmax keeps the first food on ties, like the original strict '>' scan
+        best = int(np.argmax(scores))
+        best_score = float(scores[best])
+        return {
+            "food_item": self.nutrition_data[best],
+            "confidence": min(best_score / 3, 1.0),
+        }
+
+    def _find_food_semantic(self, text: str) -> Optional[Dict]:
+        index = self._food_emb_index
+        if index is None:
+            return None
+        try:
+            match = index.match(text)
+        except Exception:
+            return None
+        if match is None:
+            return None
+        best, score = match
+        return {"food_item": self.nutrition_data[best], "confidence": score}
 
     def generate_kb_answer(
-        self, question: str, food_data: Optional[Dict]
+        self, q_lower: str, food_data: Optional[Dict]
     ) -> Optional[str]:
-        """Fast path: answer directly from local KB when possible (no API call)."""
+        """Fast path: answer directly from local KB when possible (no API call).
+        Expects the already-lowercased question."""
         if not food_data:
             return None
-        q = question.lower()
+        q = q_lower
         item = food_data["food_item"]
-        # Map nutrient keywords to KB keys and units
-        nutrient_map = {
-            "calorie": ("calories", ""),
-            "calories": ("calories", ""),
-            "protein": ("protein", "g"),
-            "carb": ("carbs", "g"),
-            "carbs": ("carbs", "g"),
-            "fat": ("fat", "g"),
-            "fiber": ("fiber", "g"),
-            "sugar": ("sugar", "g"),
-        }
-        # Detect which nutrient is asked for (or all)
-        selected = None
-        for key in nutrient_map.keys():
-            if key in q:
-                selected = key
-                break
-        if selected is None and any(
-            k in q for k in ["nutrition", "nutrients", "macros", "values"]
-        ):
+        # Tokenize once; nutrient detection is then a set lookup per known word
+        tokens = set(_WORD_RE.findall(q))
+        selected = next((w for w in NUTRIENT_WORDS if w in tokens), None)
+        if selected is None and not tokens.isdisjoint(MACRO_SUMMARY_WORDS):
             # Return compact macro summary
             return (
                 f"Per 100g, {item['name']} has: "
@@ -380,15 +712,66 @@ class AssemblyNutritionAssistant:
             if "how many" in q or "how much" in q:
                 selected = "calories"
         if selected:
-            kb_key, unit = nutrient_map[selected]
+            kb_key, unit = NUTRIENT_WORDS[selected]
             value = item.get(kb_key)
             if value is not None:
                 unit_str = f" {unit}" if unit else ""
                 return f"According to the nutrition data provided, 100g of {item['name']} contains {value}{unit_str} {kb_key}."
         return None
 
+    def _cache_get(self, cache, key):
+        if cache is None:
+            return None
+        with self._cache_lock:
+            return cache.get(key)
+
+    def _cache_put(self, cache, key, value: str) -> None:
+        if cache is None:
+            return
+        with self._cache_lock:
+            cache[key] = value
+
+    @staticmethod
+    def _disk_key(key: tuple) -> str:
+        return hashlib.blake2b(json.dumps(key).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _lemur_cache_get(self, key: tuple) -> Optional[str]:
+        """In-memory LeMUR answer, else the on-disk one (promoted to memory)."""
+        cached = self._cache_get(self._lemur_cache, key)
+        if cached is None and self._lemur_disk is not None:
+            try:
+                cached = self._lemur_disk.get(self._disk_key(key))
+            except Exception:
+                cached = None
+            if cached is not None:
+                self._cache_put(self._lemur_cache, key, cached)
+        return cached
+
+    def _lemur_cache_put(self, key: tuple, answer: str) -> None:
+        self._cache_put(self._lemur_cache, key, answer)
+        if self._lemur_disk is not None:
+            try:
+                self._lemur_disk.set(self._disk_key(key), answer, expire=LEMUR_CACHE_TTL_S)
+            except Exception:
+                pass
+
     def lemur_ask(self, question: str, food_data: Optional[Dict] = None) -> str:
         """Use LeMUR to generate a response. We pass the nutrition rules as system prompt."""
+        food_name = food_data["food_item"]["name"] if food_data else ""
+        cache_key = ("ask", normalize_query(question), food_name)
+        cached = self._lemur_cache_get(cache_key)
+        if cached is not None:
+            return cached
+        question_emb = None
+        if self._semantic_cache is not None:
+            try:
+                cached, question_emb = self._semantic_cache.get(question, food_name)
+            except Exception:
+                cached = None
+            if cached is not None:
+                self._cache_put(self._lemur_cache, cache_key, cached)
+                return cached
+
         prompt = (
             "You are a helpful wellness assistant. You can answer questions about: \n"
             "- Food and nutrition (calories, protein, carbs, fat, vitamins, minerals)\n"
@@ -416,20 +799,28 @@ class AssemblyNutritionAssistant:
             )
 
         try:
-            # LeMUR uses aai.Lemur for text tasks; content can be provided as input_text
-            task = aai.Lemur().task(
+            # LeMUR text task; content is provided as input_text
+            task = self._lemur.task(
                 input_text=user_prompt,
                 prompt=prompt,
                 final_model="anthropic/claude-3-haiku",
             )
-            return (
-                task.response or ""
-            ).strip() or "I'm sorry, I couldn't generate a response."
+            answer = (task.response or "").strip()
+            if not answer:
+                return LEMUR_EMPTY_REPLY
+            self._lemur_cache_put(cache_key, answer)
+            if question_emb is not None:
+                self._semantic_cache.put(question_emb, food_name, answer)
+            return answer
         except Exception as e:
             print(f"❌ AssemblyAI LeMUR Error: {e}")
-            return "I'm sorry, I'm having trouble connecting to my nutrition service. Please try again later."
+            return LEMUR_ERROR_REPLY
 
     def lemur_plan(self, question: str) -> str:
+        cache_key = ("plan", normalize_query(question))
+        cached = self._lemur_cache_get(cache_key)
+        if cached is not None:
+            return cached
         try:
             prompt = (
                 "You are a helpful nutrition and gym planning assistant. Stay within general wellness. "
@@ -440,19 +831,36 @@ class AssemblyNutritionAssistant:
                 "- Emphasize hydration and recovery. Include brief safety notes.\n"
                 "- Keep total response under 220 words."
             )
-            task = aai.Lemur().task(
+            task = self._lemur.task(
                 input_text=question,
                 prompt=prompt,
                 final_model="anthropic/claude-3-haiku",
             )
-            return (
-                task.response or ""
-            ).strip() or "I could not create a plan right now."
+            plan = (task.response or "").strip()
+            if not plan:
+                return PLAN_EMPTY_REPLY
+            self._lemur_cache_put(cache_key, plan)
+            return plan
         except Exception as e:
             print(f"❌ AssemblyAI LeMUR Error (plan): {e}")
-            return "I'm sorry, I couldn't create a plan right now. Please try again."
+            return PLAN_ERROR_REPLY
 
     def generate_reply(self, text: str) -> str:
+        """Return the reply for an utterance, served from the reply cache when possible."""
+        cache_key = normalize_query(text)
+        cached = self._cache_get(self._reply_cache, cache_key)
+        if cached is not None:
+            return cached
+        # Read before generating: a reply computed while the semantic food index was still
+        # building may have missed a food it will match later, so it is not cached either
+        index_building = self._food_index_building.is_set()
+        reply = self._generate_reply(text)
+        # Never cache control tokens or transient service failures
+        if reply and reply not in _UNCACHED_REPLIES and not index_building:
+            self._cache_put(self._reply_cache, cache_key, reply)
+        return reply
+
+    def _generate_reply(self, text: str) -> str:
         t = text.lower().strip()
         if "stop listening" in t or t == "stop":
             return "__STOP__"
@@ -464,16 +872,14 @@ class AssemblyNutritionAssistant:
                 "Please ask me about calories, protein, vitamins, or a weekly meal/gym plan."
             )
         if self.is_nutrition_query(t):
-            food_data = self.find_food_in_query(text)
+            food_data = self.find_food_in_query(text, t)
             # Try fast KB answer first
-            kb_answer = self.generate_kb_answer(text, food_data)
+            kb_answer = self.generate_kb_answer(t, food_data)
             if kb_answer:
                 return kb_answer
             # Fallback to LLM
             return self.lemur_ask(text, food_data)
-        if t in {"hi", "hello", "hey"} or any(
-            x in t for x in ["good morning", "good evening", "good afternoon"]
-        ):
+        if t in _GREETINGS or _GREETING_PHRASES_RE.search(t):
             return "Hello! I can help with nutrition facts, general health tips, and simple gym plans. What would you like to know?"
         if "your name" in t:
             return "I'm your nutrition assistant. I specialize in nutrition info and simple weekly meal/workout plans."
@@ -484,24 +890,125 @@ class AssemblyNutritionAssistant:
             "Try: 'Ryan, calories in oats' or 'Ryan, a 3-day beginner workout'."
         )
 
+    def _transcribe(self, data: bytes) -> str:
+        """Feed one audio block through the VAD gate and Vosk; return a final transcript or ''."""
+        if self.vad is None:
+            if self.stt.accept_waveform(data):
+                return self.stt.get_result().get("text", "").strip()
+            return ""
+        speech, ended = self.vad.process(data)
+        if speech and self.stt.accept_waveform(speech):
+            return self.stt.get_result().get("text", "").strip()
+        if ended:
+            return self.stt.get_final_result().get("text", "").strip()
+        return ""
+
+    def _speech_worker(self) -> None:
+        while True:
+            sentence = self._speech_queue.get()
+            if sentence is None:
+                break
+            if not self._speaking.is_set():
+                self._speaking.set()
+                self._pause_input()
+            try:
+                self.tts.speak(sentence)
+            except Exception as e:
+                self.log(f"TTS Error: {e}", "error")
+                continue
+            finally:
+                if self._speech_queue.empty():
+                    self._resume_input()
+                    self._speaking.clear()
+            if self._speech_queue.empty():
+                self.log("✅ Speech completed", "system")
+
+    def _pause_input(self) -> None:
+        """Mute mic input during playback so TTS is not captured and the buffer cannot back up.
+        The stream keeps running; stopping it would pay PortAudio re-setup on every reply.
+        """
+        self._muted.set()
+
+    def _resume_input(self) -> None:
+        """Drop audio captured around playback and unmute the mic."""
+        if hasattr(self, "audio_buffer"):
+            self.audio_buffer.clear()
+        self._muted.clear()
+
+    def is_speaking(self) -> bool:
+        """Non-blocking check for queued/ongoing reply playback (safe to call from the audio thread)."""
+        return self._speaking.is_set()
+
+    def speak_sentences(self, text: str) -> None:
+        """Queue text for playback one sentence at a time."""
+        for sentence in _SENTENCE_SPLIT_RE.split((text or "").strip()):
+            if sentence:
+                self._speech_queue.put(sentence)
+
+    def _handle_utterance(self, text: str) -> Optional[str]:
+        """Handle one final transcript: stop command, wake-word gating, then reply generation.
+        Returns the reply to speak, "__STOP__" for a stop command, or None if there is nothing to say.
+        """
+        lower_text = text.lower()
+        if "stop listening" in lower_text or lower_text == "stop":
+            return "__STOP__"
+
+        # Wake-word gating: ignore everything that is not addressed to the assistant
+        query_raw = extract_wake_query(text, lower_text)
+        if query_raw is None:
+            return None
+        if not query_raw:
+            # Returned rather than spoken here, so it is played in order with other replies
+            return "Yes? Please ask your question."
+
+        self.log(query_raw, "user")
+        return self.generate_reply(query_raw)
+
+    def _reply_worker(self) -> None:
+        while True:
+            fut = self._reply_queue.get()
+            if fut is None:
+                break
+            self._deliver_reply(fut)
+
+    def _deliver_reply(self, fut: Future) -> None:
+        """Wait for a submitted _handle_utterance, then log and speak the result."""
+        try:
+            reply = fut.result()
+        except Exception as e:
+            self.log(f"Reply error: {e}", "error")
+            return
+        if not reply:
+            return
+        if reply == "__STOP__":
+            self.log("Okay, Have a great day. Bye bye.", "tts")
+            # Through the speech worker, so the goodbye follows any sentences already queued
+            self.speak_sentences("Okay, Have a great day. Bye bye.")
+            self.stop_listening()
+            return
+        try:
+            self.log(reply, "assistant")
+            self.log(reply, "tts")
+            self.speak_sentences(reply)
+        except Exception as e:
+            error_msg = f"TTS Error: {e}"
+            self.log(error_msg, "error")
+
     def start_listening(self):
         """Start listening for voice input in a separate thread"""
-        import threading
-        import queue
-
-        self.audio_queue = queue.Queue()
+        self.audio_buffer = AudioRingBuffer(blocksize=self.blocksize)
         self.is_listening = True
 
         def audio_callback(indata, frames, time_info, status):
             if status:
                 print(f"Audio status: {status}", file=sys.stderr)
-            if self.is_listening:
-                self.audio_queue.put(bytes(indata))
+            if self.is_listening and not self._muted.is_set():
+                self.audio_buffer.write(indata)
 
         try:
             self.stream = sd.RawInputStream(
                 samplerate=16000,
-                blocksize=3000,
+                blocksize=self.blocksize,
                 device=self.device_index,
                 dtype="int16",
                 channels=1,
@@ -513,74 +1020,19 @@ class AssemblyNutritionAssistant:
                 with self.stream:
                     while self.is_listening:
                         try:
-                            data = self.audio_queue.get(timeout=0.1)
-                            if self.stt.accept_waveform(data):
-                                result = self.stt.get_result()
-                                text = result.get("text", "").strip()
-                                if not text:
-                                    continue
-
-                                lower_text = text.lower()
-
-                                # Check for stop commands
-                                if (
-                                    "stop listening" in lower_text
-                                    or lower_text == "stop"
-                                ):
-                                    self.tts.speak("Okay, Have a great day. Bye bye.")
-                                    self.is_listening = False
-                                    break
-
-                                # Check for wake word
-                                has_ryan = ("hey ryan" in lower_text) or (
-                                    "ryan" in lower_text
-                                )
-                                if not has_ryan:
-                                    continue
-
-                                try:
-                                    idx_hey_ryan = lower_text.find("hey ryan")
-                                    idx_ryan = lower_text.find("ryan")
-                                    indices = [
-                                        i for i in [idx_hey_ryan, idx_ryan] if i != -1
-                                    ]
-                                    wake_index = min(indices) if indices else 0
-                                    phrase = (
-                                        "hey ryan"
-                                        if idx_hey_ryan != -1
-                                        and (wake_index == idx_hey_ryan)
-                                        else "ryan"
-                                    )
-                                    query_raw = text[wake_index + len(phrase) :]
-                                    query_raw = query_raw.lstrip(" ,.:;!?-")
-                                except Exception:
-                                    query_raw = text
-
-                                if not query_raw:
-                                    self.tts.speak("Yes? Please ask your question.")
-                                    continue
-
-                                self.log(query_raw, "user")
-                                reply = self.generate_reply(query_raw)
-                                if not reply:
-                                    continue
-                                if reply == "__STOP__":
-                                    self.log("Okay, Have a great day. Bye bye.", "tts")
-                                    self.tts.speak("Okay, Have a great day. Bye bye.")
-                                    self.is_listening = False
-                                    break
-
-                                try:
-                                    self.log(reply, "assistant")
-                                    self.log(reply, "tts")
-                                    self.tts.speak(reply)
-                                    self.log("✅ Speech completed", "system")
-                                except Exception as e:
-                                    error_msg = f"TTS Error: {e}"
-                                    self.log(error_msg, "error")
-
-                        except queue.Empty:
-                            continue
+                            data = self.audio_buffer.read()
+                            if data is None:
+                                break
+                            text = self._transcribe(data)
+                            if not text:
+                                continue
+
+                            # Drop our own TTS picked up by the mic before any scanning
+                            if self.is_speaking():
+                                continue
+
+                            self._reply_queue.put(self._exec.submit(self._handle_utterance, text))
+
                         except Exception as e:
                             print(f"Error processing audio: {e}")
                             continue
@@ -596,6 +1048,9 @@ class AssemblyNutritionAssistant:
     def stop_listening(self):
         """Stop listening for voice input"""
         self.is_listening = False
+        if hasattr(self, "audio_buffer"):
+            # Wakes the blocked listen_loop so it exits without polling
+            self.audio_buffer.close()
         if hasattr(self, "stream"):
             try:
                 self.stream.stop()
@@ -605,6 +1060,9 @@ class AssemblyNutritionAssistant:
     def cleanup(self):
         try:
             self.stop_listening()
+            self._exec.shutdown(wait=False, cancel_futures=True)
+            self._reply_queue.put(None)
+            self._speech_queue.put(None)
             self.tts.cleanup()
         except Exception:
             pass
@@ -636,12 +1094,49 @@ def main():
     parser.add_argument(
         "--device", type=int, default=None, help="sounddevice input device index"
     )
+    parser.add_argument(
+        "--blocksize",
+        type=int,
+        default=1600,
+        help="Audio frames per callback block (1600 = 100 ms at 16 kHz). Smaller blocks cut "
+        "buffering latency but wake the STT loop more often and raise the risk of input overruns",
+    )
+    parser.add_argument(
+        "--latency-budget-ms",
+        type=float,
+        default=None,
+        help="Per-block buffering latency in milliseconds; overrides --blocksize",
+    )
+    parser.add_argument(
+        "--no-prewarm",
+        action="store_true",
+        help="Skip the startup LeMUR request that warms the connection",
+    )
+    parser.add_argument(
+        "--semantic-cache",
+        action="store_true",
+        help="Reuse LeMUR answers for near-duplicate questions about the same food "
+        "(needs sentence-transformers)",
+    )
+    parser.add_argument(
+        "--semantic-food-match",
+        action="store_true",
+        help="Match foods by sentence-embedding similarity when no KB name or synonym "
+        "appears in the query (needs sentence-transformers)",
+    )
+    parser.add_argument(
+        "--no-vad",
+        action="store_true",
+        help="Disable the Silero VAD gate and feed all audio to Vosk",
+    )
     parser.add_argument(
         "--list-devices",
         action="store_true",
         help="List available audio devices and exit",
     )
     args = parser.parse_args()
+    if args.latency_budget_ms is not None:
+        args.blocksize = max(1, int(args.latency_budget_ms / 1000 * args.samplerate))
 
     if args.list_devices:
         print("Available audio devices:")
@@ -663,7 +1158,14 @@ def main():
 
         print("Initializing AssemblyAI-Powered Nutrition Voice Assistant...")
         assistant = AssemblyNutritionAssistant(
-            args.model, assembly_key, args.nutrition_kb
+            args.model,
+            assembly_key,
+            args.nutrition_kb,
+            blocksize=args.blocksize,
+            use_vad=not args.no_vad,
+            prewarm=not args.no_prewarm,
+            semantic_cache=args.semantic_cache,
+            semantic_food_match=args.semantic_food_match,
         )
 
         if args.device is None:
@@ -713,17 +1215,20 @@ def main():
                 print(f"Error while auto-selecting microphone: {e2}")
                 return
 
-        q = queue.Queue()
+        ring = AudioRingBuffer(blocksize=args.blocksize)
+        # Set while the reply plays; the stream keeps running and the callback drops input
+        muted = threading.Event()
 
         def audio_callback(indata, frames, time_info, status):
             if status:
                 print(f"Audio status: {status}", file=sys.stderr)
-            q.put(bytes(indata))
+            if not muted.is_set():
+                ring.write(indata)
 
         print(f"Setting up audio stream with device {args.device}...")
         stream = sd.RawInputStream(
             samplerate=args.samplerate,
-            blocksize=3000,
+            blocksize=args.blocksize,
             device=args.device,
             dtype="int16",
             channels=1,
@@ -746,95 +1251,66 @@ def main():
     )
     print("🛑 Say 'stop listening' anytime to exit.\n")
 
+    # Replies are generated on the assistant's worker threads while this thread keeps decoding
+    # audio; the playback thread speaks them in the order the utterances were heard
+    pending: "queue.Queue[Optional[Future]]" = queue.Queue()
+
+    def playback_loop():
+        while True:
+            fut = pending.get()
+            if fut is None:
+                break
+            try:
+                reply = fut.result()
+            except Exception as e:
+                print(f"Error generating reply: {e}")
+                continue
+            if not reply:
+                continue
+            if reply == "__STOP__":
+                assistant.tts.speak("Okay, Have a great day. Bye bye.")
+                # Wakes the main loop's blocked read so it exits
+                ring.close()
+                break
+            try:
+                # Mute mic while speaking to avoid feedback and re-triggers
+                muted.set()
+                print(f"🤖 Nutrition Assistant: {reply}")
+                # Blocks until playback has finished, so unmuting below never overlaps speech
+                assistant.tts.speak(reply)
+            except Exception as e:
+                print(f"❌ TTS Error: {e}")
+            finally:
+                # Discard anything captured during playback before resuming
+                ring.clear()
+                muted.clear()
+
+    playback_thread = threading.Thread(target=playback_loop, name="playback", daemon=True)
+    playback_thread.start()
+
     try:
         with stream:
             last_reminder_ts = 0.0
             while True:
                 try:
-                    data = q.get()
-                    if assistant.stt.accept_waveform(data):
-                        result = assistant.stt.get_result()
-                        text = result.get("text", "").strip()
-                        if not text:
-                            continue
-                        lower_text = text.lower()
-
-                        # Allow global stop
-                        if "stop listening" in lower_text or lower_text == "stop":
-                            assistant.tts.speak("Okay, Have a great day. Bye bye.")
-                            break
-
-                        # Mid-speech interrupt ("stop" or "stop ryan")
-                        if (
-                            "stop ryan" in lower_text
-                            or "ryan stop" in lower_text
-                            or "stop" in lower_text
-                        ) and assistant.tts.is_speaking():
-                            assistant.tts.stop()
-                            continue
-
-                        # Wake-word gating: ignore all audio unless it contains the wake word
-                        has_ryan = ("hey ryan" in lower_text) or ("ryan" in lower_text)
-                        if not has_ryan:
-                            # Do not print or speak anything; just keep listening
-                            continue
-
-                        try:
-                            idx_hey_ryan = lower_text.find("hey ryan")
-                            idx_ryan = lower_text.find("ryan")
-                            indices = [i for i in [idx_hey_ryan, idx_ryan] if i != -1]
-                            wake_index = min(indices) if indices else 0
-                            phrase = (
-                                "hey ryan"
-                                if idx_hey_ryan != -1 and (wake_index == idx_hey_ryan)
-                                else "ryan"
-                            )
-                            query_raw = text[wake_index + len(phrase) :]
-                            query_raw = query_raw.lstrip(" ,.:;!?-")
-                        except Exception:
-                            query_raw = text
-
-                        if not query_raw:
-                            try:
-                                assistant.tts.speak("Yes? Please ask your question.")
-                            except Exception:
-                                pass
-                            continue
-
-                        print(f"📝 You: {query_raw}")
-                        reply = assistant.generate_reply(query_raw)
-                        if not reply:
-                            continue
-                        if reply == "__STOP__":
-                            assistant.tts.speak("Okay, Have a great day. Bye bye.")
-                            break
-                        try:
-                            # Pause mic while speaking to avoid feedback and re-triggers
-                            try:
-                                stream.stop()
-                            except Exception:
-                                pass
-                            print(f"🤖 Nutrition Assistant: {reply}")
-                            assistant.tts.speak(reply)
-                            # Wait for speech to finish (with a max cap)
-                            wait_start = time.time()
-                            while (
-                                assistant.tts.is_speaking()
-                                and (time.time() - wait_start) < 8.0
-                            ):
-                                time.sleep(0.05)
-                        except Exception as e:
-                            print(f"❌ TTS Error: {e}")
-                        finally:
-                            try:
-                                stream.start()
-                            except Exception:
-                                pass
-                    else:
-                        # No final result yet; keep collecting audio
+                    data = ring.read()
+                    if data is None:
+                        break
+                    text = assistant._transcribe(data)
+                    if not text:
                         continue
-                except queue.Empty:
-                    continue
+                    lower_text = text.lower()
+
+                    # Mid-speech interrupt ("stop" or "stop ryan")
+                    if (
+                        "stop ryan" in lower_text
+                        or "ryan stop" in lower_text
+                        or "stop" in lower_text
+                    ) and assistant.tts.is_speaking():
+                        assistant.tts.stop()
+                        continue
+
+                    pending.put(assistant._exec.submit(assistant._handle_utterance, text))
                 except Exception as e:
                     print(f"Error processing audio: {e}")
                     continue
@@ -851,6 +1327,7 @@ def main():
         print(f"Unexpected error: {e}")
         print("Please check your audio setup and try again.")
     finally:
+        pending.put(None)
         try:
             assistant.cleanup()
         except Exception:
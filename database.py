@@ -1,172 +1,683 @@
 import streamlit as st
 import uuid
 import os
-from datetime import datetime
-from typing import List, Dict, Optional
+import json
+import heapq
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Iterator, List, Dict, Optional
 import sqlalchemy as sa
 from sqlalchemy import create_engine, text
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Every statement the manager issues, wrapped in text() once as
+# DatabaseManager._stmts so call sites never re-parse SQL.
+# created_at is clock_timestamp(), not NOW(): NOW() is the transaction start, so every row of
+# a batched insert would share it. Pages order on (created_at, id) so equal times still page stably.
+_SQL = {
+    # Bulk-capable INSERTs: executed with a list of parameter dicts, SQLAlchemy's
+    # insertmanyvalues batching turns N rows into one multi-row INSERT per page.
+    'insert_chat': """
+        INSERT INTO chat_history (id, user_id, user_message, assistant_response, session_id, created_at)
+        VALUES (:id, :user_id, :user_message, :assistant_response, :session_id, clock_timestamp())
+    """,
+    'insert_meal': """
+        INSERT INTO meal_logs (id, user_id, meal_description, meal_time, image_path, created_at)
+        VALUES (:id, :user_id, :meal_description, NOW(), :image_path, clock_timestamp())
+    """,
+    'insert_nutri': """
+        INSERT INTO nutrition_analysis (id, meal_log_id, calories, protein_g, carbs_g, fat_g, sugar_g, fiber_g, recommendation, created_at)
+        VALUES (:id, :meal_log_id, :calories, :protein_g, :carbs_g, :fat_g, :sugar_g, :fiber_g, :recommendation, clock_timestamp())
+    """,
+    # Meal + its analysis in one statement; the analysis takes the id the CTE returns
+    'insert_meal_with_analysis': """
+        WITH m AS (
+            INSERT INTO meal_logs (id, user_id, meal_description, meal_time, image_path, created_at)
+            VALUES (:meal_log_id, :user_id, :meal_description, NOW(), :image_path, clock_timestamp())
+            RETURNING id
+        )
+        INSERT INTO nutrition_analysis (id, meal_log_id, calories, protein_g, carbs_g, fat_g, sugar_g, fiber_g, recommendation, created_at)
+        SELECT :id, m.id, :calories, :protein_g, :carbs_g, :fat_g, :sugar_g, :fiber_g, :recommendation, clock_timestamp()
+        FROM m
+    """,
+    # Chat pages: newest `limit` rows (LIMIT NULL = all), optionally strictly older than
+    # the `before` message; the caller reverses each page back to chronological order
+    'select_chat_by_user_session': """
+        SELECT id, user_id, user_message, assistant_response, session_id, created_at
+        FROM chat_history 
+        WHERE user_id = :user_id AND session_id = :session_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit
+    """,
+    'select_chat_by_user_session_before': """
+        SELECT id, user_id, user_message, assistant_response, session_id, created_at
+        FROM chat_history 
+        WHERE user_id = :user_id AND session_id = :session_id
+          AND (created_at, id) < (SELECT created_at, id FROM chat_history WHERE id = :before)
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit
+    """,
+    'select_chat_by_user': """
+        SELECT id, user_id, user_message, assistant_response, session_id, created_at
+        FROM chat_history 
+        WHERE user_id = :user_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit
+    """,
+    'select_chat_by_user_before': """
+        SELECT id, user_id, user_message, assistant_response, session_id, created_at
+        FROM chat_history 
+        WHERE user_id = :user_id
+          AND (created_at, id) < (SELECT created_at, id FROM chat_history WHERE id = :before)
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit
+    """,
+    'select_chat_sessions': """
+        SELECT id, title, category, created_at, updated_at, is_pinned
+        FROM chat_sessions 
+        WHERE user_id = :user_id 
+        ORDER BY is_pinned DESC, updated_at DESC, id DESC
+        LIMIT :limit
+    """,
+    # Keyset cursor over the same (is_pinned DESC, updated_at DESC, id DESC) order the index serves
+    'select_chat_sessions_before': """
+        SELECT id, title, category, created_at, updated_at, is_pinned
+        FROM chat_sessions 
+        WHERE user_id = :user_id 
+          AND (is_pinned, updated_at, id) < (SELECT is_pinned, updated_at, id FROM chat_sessions WHERE id = :before)
+        ORDER BY is_pinned DESC, updated_at DESC, id DESC
+        LIMIT :limit
+    """,
+    'select_meal_logs': """
+        SELECT id, user_id, meal_description, meal_time, image_path, created_at
+        FROM meal_logs 
+        WHERE user_id = :user_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT :limit OFFSET :offset
+    """,
+    'get_nutri': """
+        SELECT id, meal_log_id, calories, protein_g, carbs_g, fat_g, sugar_g, fiber_g, recommendation, created_at
+        FROM nutrition_analysis
+        WHERE meal_log_id = :meal_log_id
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1
+    """,
+    # One statement: the CTE removes the meal (data-modifying CTEs always run), the outer
+    # DELETE its analyses (FK checks run at end of statement, so the order inside is safe)
+    'delete_meal': """
+        WITH del_meal AS (
+            DELETE FROM meal_logs WHERE id = :meal_log_id
+        )
+        DELETE FROM nutrition_analysis WHERE meal_log_id = :meal_log_id
+    """,
+    'delete_meals_not_today': """
+        WITH del_meals AS (
+            DELETE FROM meal_logs
+            WHERE user_id = :user_id AND CAST(meal_time AS DATE) <> CAST(:today AS DATE)
+            RETURNING id
+        )
+        DELETE FROM nutrition_analysis
+        WHERE meal_log_id IN (SELECT id FROM del_meals)
+    """,
+    'nutrition_summary': """
+        SELECT COUNT(DISTINCT ml.id), AVG(na.calories), AVG(na.protein_g),
+               AVG(na.carbs_g), AVG(na.fat_g)
+        FROM nutrition_analysis na
+        JOIN meal_logs ml ON ml.id = na.meal_log_id
+        WHERE ml.user_id = :user_id
+          AND ml.created_at > NOW() - make_interval(days => :days)
+    """,
+    'upsert_prefs': """
+        INSERT INTO user_preferences (user_id, preferences, updated_at)
+        VALUES (:user_id, :preferences, NOW())
+        ON CONFLICT (user_id)
+        DO UPDATE SET preferences = EXCLUDED.preferences, updated_at = NOW()
+    """,
+    'get_prefs': """
+        SELECT preferences
+        FROM user_preferences
+        WHERE user_id = :user_id
+    """,
+}
+
+def _iso(value) -> str:
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+# Bulk insert statement per table
+_INSERT_STMT = {
+    'chat_history': 'insert_chat',
+    'meal_logs': 'insert_meal',
+    'nutrition_analysis': 'insert_nutri',
+}
+
+# Tables and indexes this module creates itself (the core tables are provisioned in Supabase).
+# Run once per process by DatabaseManager._ensure_schema().
+_SCHEMA_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        user_id uuid PRIMARY KEY,
+        preferences jsonb NOT NULL DEFAULT '{}'::jsonb,
+        updated_at timestamptz NOT NULL DEFAULT NOW()
+    )
+    """,
+    # Serves get_user_chat_sessions' filter + ORDER BY straight from the index
+    """
+    CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_pinned_updated_id
+    ON chat_sessions (user_id, is_pinned DESC, updated_at DESC, id DESC)
+    INCLUDE (title, category, created_at)
+    """,
+    # get_chat_history: WHERE user_id [AND session_id] ORDER BY created_at, id
+    "CREATE INDEX IF NOT EXISTS idx_chat_user_session_time_id ON chat_history (user_id, session_id, created_at, id)",
+    # get_user_meal_logs: WHERE user_id ORDER BY created_at DESC, id DESC LIMIT n
+    "CREATE INDEX IF NOT EXISTS idx_meal_user_created_id ON meal_logs (user_id, created_at DESC, id DESC)",
+    # get_nutrition_analysis_by_meal: latest analysis per meal
+    "CREATE INDEX IF NOT EXISTS idx_nutri_meal_time_id ON nutrition_analysis (meal_log_id, created_at DESC, id DESC)",
+    # Superseded by the (..., id) indexes above
+    "DROP INDEX IF EXISTS idx_chat_sessions_user_pinned_updated",
+    "DROP INDEX IF EXISTS idx_chat_user_session_time",
+    "DROP INDEX IF EXISTS idx_meal_user_created",
+    "DROP INDEX IF EXISTS idx_nutri_meal_time",
+)
+
+# Parents before children so buffered analyses never precede their meal log
+_FLUSH_ORDER = ('meal_logs', 'nutrition_analysis', 'chat_history')
+
+# Background rows whose insert fails are retried with later batches, this many times in all,
+# no sooner than the delay after the failure
+_WRITE_MAX_ATTEMPTS = 5
+_WRITE_RETRY_DELAY_S = 5.0
+
+
+@st.cache_resource(show_spinner=False)
+def _get_engine():
+    """One pooled engine per process, shared by every session's DatabaseManager and rerun."""
+    url = os.getenv('DATABASE_URL')
+    if not url:
+        return None
+    # Small warm pool: pre_ping drops connections Supabase closed while idle,
+    # recycle keeps them under the pooler's idle timeout
+    return create_engine(
+        url,
+        insertmanyvalues_page_size=1000,
+        pool_size=5,
+        pool_pre_ping=True,
+        pool_recycle=300,
+    )
+
+
+def _json_adapter(engine):
+    """Driver-native JSON parameter wrapper for `engine`, falling back to a JSON string."""
+    try:
+        if engine.dialect.driver == 'psycopg':
+            from psycopg.types.json import Jsonb
+            return Jsonb
+        if engine.dialect.driver == 'psycopg2':
+            from psycopg2.extras import Json
+            return Json
+    except ImportError:
+        pass
+    return json.dumps
+
+
+# Hot reads cached across Streamlit reruns (engine mode only; the session-state
+# fallback is already in memory). `_db` is left unhashed, so entries are keyed
+# on the query arguments alone. DatabaseManager writers clear the matching cache;
+# the TTL bounds staleness from writers elsewhere (e.g. ChatManager).
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_chat_history(_db: "DatabaseManager", user_id: str, session_id: Optional[str],
+                         limit: Optional[int], before: Optional[str]) -> List[Dict]:
+    return list(_db.iter_chat_history(user_id, session_id, limit, before))
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_chat_sessions(_db: "DatabaseManager", user_id: str,
+                          limit: Optional[int], before: Optional[str]) -> List[Dict]:
+    return _db._query_chat_sessions(user_id, limit, before)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_meal_logs(_db: "DatabaseManager", user_id: str, limit: int, offset: int) -> List[Dict]:
+    return list(_db.iter_user_meal_logs(user_id, limit, offset))
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_user_preferences(_db: "DatabaseManager", user_id: str) -> Dict:
+    return _db._query_user_preferences(user_id)
+
+
+# Read caches made stale by a write to each table
+_TABLE_CACHES = {
+    'chat_history': (_cached_chat_history,),
+    'meal_logs': (_cached_meal_logs,),
+    'nutrition_analysis': (),
+    'user_preferences': (_cached_user_preferences,),
+}
+
+
 class DatabaseManager:
+    # Set once the DDL in _SCHEMA_DDL has run in this process
+    _schema_ready: bool = False
+    # Parsed once per process; see _SQL
+    _stmts = {name: text(sql) for name, sql in _SQL.items()}
+    # Fire-and-forget writes: (engine, table, row, attempts) drained by one process-wide daemon thread
+    _write_queue: "queue.Queue" = queue.Queue()
+    _writer_thread: Optional[threading.Thread] = None
+    _writer_lock = threading.Lock()
+    # Rows from failed writes awaiting a retry (writer thread only), due at _retry_at
+    _retry_rows: List[tuple] = []
+    _retry_at: float = 0.0
+
     def __init__(self):
-        self.database_url = os.getenv('DATABASE_URL')
-        if self.database_url:
-            self.engine = create_engine(self.database_url)
+        # Rows queued via buffer_* and written in bulk by flush()
+        self._pending = {table: [] for table in _FLUSH_ORDER}
+        # Connection held by the outermost _conn() block; nested blocks reuse it
+        self._active_conn = None
+        # user_id -> preferences as last read or written by this session; skips even the cache_data lookup
+        self._prefs_cache: Dict[str, Dict] = {}
+        self.engine = _get_engine()
+        if self.engine:
+            if not DatabaseManager._schema_ready:
+                self._ensure_schema()
+            self._start_writer()
+            # Lets the driver adapt preferences dicts itself instead of sending pre-dumped text
+            self._json_param = _json_adapter(self.engine)
         else:
-            self.engine = None
             # Initialize session state for simulating database storage
             if 'chat_history' not in st.session_state:
                 st.session_state.chat_history = []
+            # Meals keyed by id and analyses keyed by meal id, so lookups and deletes are O(1)
             if 'meal_logs' not in st.session_state:
-                st.session_state.meal_logs = []
-            if 'nutrition_analysis' not in st.session_state:
-                st.session_state.nutrition_analysis = []
+                st.session_state.meal_logs = {}
+            if 'nutrition_analysis_by_meal' not in st.session_state:
+                st.session_state.nutrition_analysis_by_meal = {}
+            if 'sessions_index' not in st.session_state:
+                # session_id -> summary, kept current by _index_chat_rows so the sidebar never rescans history
+                st.session_state.sessions_index = {}
+                self._index_chat_rows(st.session_state.chat_history)
     
+    def _ensure_schema(self) -> None:
+        """Create module-owned tables in one transaction; later managers skip this."""
+        try:
+            with self.engine.begin() as conn:
+                for ddl in _SCHEMA_DDL:
+                    conn.execute(text(ddl))
+            DatabaseManager._schema_ready = True
+        except Exception as e:
+            st.error(f"Error preparing database schema: {str(e)}")
+
+    @contextmanager
+    def _conn(self):
+        """Check out one pooled connection for the enclosing reads.
+        Nested calls share it, so a page that issues several queries pays for one checkout.
+        Writes use engine.begin() so BEGIN/COMMIT wrap the statement in one block.
+        """
+        if self._active_conn is not None:
+            yield self._active_conn
+            return
+        with self.engine.connect() as conn:
+            self._active_conn = conn
+            try:
+                yield conn
+            finally:
+                self._active_conn = None
+
+    # -------------------------
+    # Bulk writes
+    # -------------------------
+    @staticmethod
+    def _invalidate(*tables: str) -> None:
+        """Drop cached reads that a write to `tables` has made stale."""
+        for table in tables:
+            for cached in _TABLE_CACHES[table]:
+                cached.clear()
+
+    def _insert_many(self, table: str, rows: List[Dict]) -> None:
+        """Insert rows into `table` in one round-trip (engine) or append them to session state."""
+        if not rows:
+            return
+        if self.engine:
+            with self.engine.begin() as conn:
+                conn.execute(self._stmts[_INSERT_STMT[table]], rows)
+            self._invalidate(table)
+        else:
+            now = datetime.now().isoformat()
+            records = [dict(row, created_at=now) for row in rows]
+            if table == 'meal_logs':
+                for record in records:
+                    record['meal_time'] = now
+                    st.session_state.meal_logs[record['id']] = record
+            elif table == 'nutrition_analysis':
+                # Latest analysis per meal, as the engine-backed lookup returns
+                for record in records:
+                    st.session_state.nutrition_analysis_by_meal[record['meal_log_id']] = record
+            else:
+                st.session_state.chat_history.extend(records)
+                self._index_chat_rows(records)
+
+    @staticmethod
+    def _index_chat_rows(records: List[Dict]) -> None:
+        """Fold chat records into st.session_state.sessions_index (fallback mode only)."""
+        index = st.session_state.sessions_index
+        for chat in records:
+            summary = index.get(chat['session_id'])
+            if summary is None:
+                summary = index[chat['session_id']] = {
+                    'session_id': chat['session_id'],
+                    'user_id': chat['user_id'],
+                    'created_at': chat['created_at'],
+                    'message_count': 0,
+                    'last_message': ''
+                }
+            summary['message_count'] += 1
+            summary['last_message'] = chat['user_message'][:50] + '...'
+
+    # -------------------------
+    # Background writes
+    # -------------------------
+    @classmethod
+    def _start_writer(cls) -> None:
+        with cls._writer_lock:
+            if cls._writer_thread is None:
+                cls._writer_thread = threading.Thread(target=cls._writer_loop, name="db-writer", daemon=True)
+                cls._writer_thread.start()
+                atexit.register(cls._drain_writes)
+
+    def _enqueue(self, table: str, row: Dict) -> None:
+        """Hand a row to the writer thread; the caller does not wait for the round-trip."""
+        self._write_queue.put((self.engine, table, row, 0))
+
+    @classmethod
+    def _writer_loop(cls) -> None:
+        while True:
+            # With rows awaiting a retry, wake up when they are due even if nothing new arrives
+            timeout = max(0.0, cls._retry_at - time.monotonic()) if cls._retry_rows else None
+            try:
+                batch = [cls._write_queue.get(timeout=timeout)]
+            except queue.Empty:
+                batch = []
+            if cls._retry_rows and time.monotonic() >= cls._retry_at:
+                batch = cls._retry_rows + batch
+                cls._retry_rows = []
+            # Coalesce whatever arrives in the next 250 ms (up to 500 rows) into one transaction
+            deadline = time.monotonic() + 0.25
+            while batch and len(batch) < 500:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(cls._write_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            if batch:
+                cls._write_batch(batch)
+
+    @classmethod
+    def _write_batch(cls, batch: List[tuple]) -> None:
+        """Insert queued rows: one transaction per engine, one multi-row INSERT per table.
+        If the transaction fails, its rows are retried one by one so a single bad row cannot
+        roll back the others; rows that still fail are kept for a later batch."""
+        grouped: Dict = {}
+        for item in batch:
+            grouped.setdefault(item[0], {}).setdefault(item[1], []).append(item)
+        for engine, tables in grouped.items():
+            try:
+                with engine.begin() as conn:
+                    for table in _FLUSH_ORDER:
+                        if table in tables:
+                            conn.execute(cls._stmts[_INSERT_STMT[table]], [item[2] for item in tables[table]])
+                cls._invalidate(*tables)
+            except Exception as e:
+                # No script context on this thread, so st.error would not render
+                print(f"Background database write failed ({sum(map(len, tables.values()))} rows), "
+                      f"retrying row by row: {e}")
+                cls._write_rows(engine, tables)
+
+    @classmethod
+    def _write_rows(cls, engine, tables: Dict[str, List[tuple]]) -> None:
+        """Insert each row in its own transaction, deferring the ones that fail."""
+        written = set()
+        deferred = 0
+        connection_lost = False
+        last_error = None
+        for table in _FLUSH_ORDER:
+            for item in tables.get(table, ()):
+                if not connection_lost:
+                    try:
+                        with engine.begin() as conn:
+                            conn.execute(cls._stmts[_INSERT_STMT[table]], item[2])
+                        written.add(table)
+                        continue
+                    except Exception as e:
+                        last_error = e
+                        # Database unreachable: defer the rest instead of failing them one by one
+                        connection_lost = isinstance(e, (sa.exc.OperationalError, sa.exc.InterfaceError)) or getattr(
+                            e, 'connection_invalidated', False
+                        )
+                deferred += cls._defer_row(item, last_error)
+        if written:
+            cls._invalidate(*written)
+        if deferred:
+            cls._retry_at = time.monotonic() + _WRITE_RETRY_DELAY_S
+            print(f"{deferred} background database rows deferred for retry: {last_error}")
+
+    @classmethod
+    def _defer_row(cls, item: tuple, error: Exception) -> int:
+        engine, table, row, attempts = item
+        if attempts + 1 >= _WRITE_MAX_ATTEMPTS:
+            print(f"Dropping {table} row {row.get('id')} after {attempts + 1} failed writes: {error}")
+            return 0
+        cls._retry_rows.append((engine, table, row, attempts + 1))
+        return 1
+
+    @classmethod
+    def _drain_writes(cls) -> None:
+        """Write anything still queued (or awaiting a retry) at interpreter exit."""
+        batch, cls._retry_rows = cls._retry_rows, []
+        while True:
+            try:
+                batch.append(cls._write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            cls._write_batch(batch)
+
+    def flush_chat_messages(self, rows: List[Dict]) -> bool:
+        """Insert many chat rows at once. Rows use the keys produced by `_chat_row`."""
+        try:
+            self._insert_many('chat_history', rows)
+            return True
+        except Exception as e:
+            st.error(f"Error saving chat messages: {str(e)}")
+            return False
+
+    def flush_meal_logs(self, rows: List[Dict]) -> bool:
+        """Insert many meal log rows at once. Rows use the keys produced by `_meal_row`."""
+        try:
+            self._insert_many('meal_logs', rows)
+            return True
+        except Exception as e:
+            st.error(f"Error saving meal logs: {str(e)}")
+            return False
+
+    def flush_nutrition_analyses(self, rows: List[Dict]) -> bool:
+        """Insert many nutrition analysis rows at once. Rows use the keys produced by `_analysis_row`."""
+        try:
+            self._insert_many('nutrition_analysis', rows)
+            return True
+        except Exception as e:
+            st.error(f"Error saving nutrition analyses: {str(e)}")
+            return False
+
+    def buffer_chat_message(self, user_id: str, user_message: str, assistant_response: str, session_id: str) -> None:
+        """Queue a chat message for the next flush() (bulk paths such as transcript replays)."""
+        self._pending['chat_history'].append(
+            self._chat_row(user_id, user_message, assistant_response, session_id)
+        )
+
+    def buffer_nutrition_analysis(self, meal_log_id: str, calories: float, protein: float,
+                                  carbs: float, fat: float, recommendation: str,
+                                  sugar: float = 0.0, fiber: float = 0.0) -> None:
+        """Queue a nutrition analysis for the next flush()."""
+        self._pending['nutrition_analysis'].append(
+            self._analysis_row(meal_log_id, calories, protein, carbs, fat, recommendation, sugar, fiber)
+        )
+
+    def flush(self) -> bool:
+        """Write all buffered rows, one multi-row INSERT per table inside a single transaction."""
+        try:
+            if self.engine:
+                with self.engine.begin() as conn:
+                    for table in _FLUSH_ORDER:
+                        if self._pending[table]:
+                            conn.execute(self._stmts[_INSERT_STMT[table]], self._pending[table])
+                self._invalidate(*_FLUSH_ORDER)
+            else:
+                for table in _FLUSH_ORDER:
+                    self._insert_many(table, self._pending[table])
+            for table in _FLUSH_ORDER:
+                self._pending[table] = []
+            return True
+        except Exception as e:
+            st.error(f"Error flushing buffered writes: {str(e)}")
+            return False
+
+    @staticmethod
+    def _chat_row(user_id: str, user_message: str, assistant_response: str, session_id: str) -> Dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "user_message": user_message,
+            "assistant_response": assistant_response,
+            "session_id": session_id
+        }
+
+    @staticmethod
+    def _meal_row(meal_log_id: str, user_id: str, meal_description: str, image_path: Optional[str]) -> Dict:
+        return {
+            "id": meal_log_id,
+            "user_id": user_id,
+            "meal_description": meal_description,
+            "image_path": image_path
+        }
+
+    @staticmethod
+    def _analysis_row(meal_log_id: str, calories: float, protein: float, carbs: float, fat: float,
+                      recommendation: str, sugar: float = 0.0, fiber: float = 0.0) -> Dict:
+        return {
+            "id": str(uuid.uuid4()),
+            "meal_log_id": meal_log_id,
+            "calories": calories,
+            "protein_g": protein,
+            "carbs_g": carbs,
+            "fat_g": fat,
+            "sugar_g": sugar,
+            "fiber_g": fiber,
+            "recommendation": recommendation
+        }
+
     def save_chat_message(self, user_id: str, user_message: str, assistant_response: str, session_id: str) -> bool:
         """Save chat message to database"""
         try:
+            row = self._chat_row(user_id, user_message, assistant_response, session_id)
             if self.engine:
-                # Use Supabase database
-                with self.engine.connect() as conn:
-                    conn.execute(
-                        text("""
-                            INSERT INTO chat_history (id, user_id, user_message, assistant_response, session_id, created_at)
-                            VALUES (:id, :user_id, :user_message, :assistant_response, :session_id, NOW())
-                        """),
-                        {
-                            "id": str(uuid.uuid4()),
-                            "user_id": user_id,
-                            "user_message": user_message,
-                            "assistant_response": assistant_response,
-                            "session_id": session_id
-                        }
-                    )
-                    conn.commit()
-                    return True
+                self._enqueue('chat_history', row)
             else:
-                # Fallback to session state
-                chat_record = {
-                    'id': str(uuid.uuid4()),
-                    'user_id': user_id,
-                    'user_message': user_message,
-                    'assistant_response': assistant_response,
-                    'session_id': session_id,
-                    'created_at': datetime.now().isoformat()
-                }
-                
-                st.session_state.chat_history.append(chat_record)
-                return True
-            
+                self._insert_many('chat_history', [row])
+            return True
         except Exception as e:
             st.error(f"Error saving chat message: {str(e)}")
             return False
     
-    def get_chat_history(self, user_id: str, session_id: Optional[str] = None) -> List[Dict]:
-        """Retrieve chat history for a user"""
+    def iter_chat_history(self, user_id: str, session_id: Optional[str] = None,
+                          limit: Optional[int] = 50, before: Optional[str] = None) -> Iterator[Dict]:
+        """Yield one page of a user's chat messages, oldest first.
+        The page holds the newest `limit` messages (all when None) older than message id `before`.
+        """
+        if self.engine:
+            # Use Supabase database
+            name = 'select_chat_by_user_session' if session_id else 'select_chat_by_user'
+            if before:
+                name += '_before'
+            params = {"user_id": user_id, "session_id": session_id, "limit": limit, "before": before}
+            with self._conn() as conn:
+                # Options on the statement, not the connection: a shared connection would keep
+                # server-side cursors for every later query in the same _conn() block
+                result = conn.execute(self._stmts[name].execution_options(stream_results=True, yield_per=200), params)
+                # Column names already match the dict keys; only ids and timestamps need fixing up
+                page = []
+                for rec in result.mappings():
+                    row = dict(rec)
+                    row['id'] = str(row['id'])
+                    row['user_id'] = str(row['user_id'])
+                    row['created_at'] = _iso(row['created_at'])
+                    page.append(row)
+            yield from reversed(page)
+        else:
+            # Fallback to session state
+            chat_history = st.session_state.chat_history
+            
+            # Filter by user_id
+            user_chats = [chat for chat in chat_history if chat['user_id'] == user_id]
+            
+            # Filter by session_id if provided
+            if session_id:
+                user_chats = [chat for chat in user_chats if chat['session_id'] == session_id]
+            
+            user_chats.sort(key=lambda x: (x['created_at'], x['id']))
+            if before:
+                cutoff = next(((chat['created_at'], chat['id']) for chat in user_chats if chat['id'] == before), None)
+                if cutoff is not None:
+                    user_chats = [chat for chat in user_chats if (chat['created_at'], chat['id']) < cutoff]
+            yield from (user_chats[-limit:] if limit else user_chats)
+
+    def get_chat_history(self, user_id: str, session_id: Optional[str] = None,
+                         limit: Optional[int] = 50, before: Optional[str] = None) -> List[Dict]:
+        """Retrieve chat history for a user, oldest first. Pass the oldest message's id as
+        `before` to page further back; `limit=None` returns the whole history."""
         try:
             if self.engine:
-                # Use Supabase database
-                with self.engine.connect() as conn:
-                    if session_id:
-                        result = conn.execute(
-                            text("""
-                                SELECT id, user_id, user_message, assistant_response, session_id, created_at
-                                FROM chat_history 
-                                WHERE user_id = :user_id AND session_id = :session_id
-                                ORDER BY created_at
-                            """),
-                            {"user_id": user_id, "session_id": session_id}
-                        )
-                    else:
-                        result = conn.execute(
-                            text("""
-                                SELECT id, user_id, user_message, assistant_response, session_id, created_at
-                                FROM chat_history 
-                                WHERE user_id = :user_id
-                                ORDER BY created_at
-                            """),
-                            {"user_id": user_id}
-                        )
-                    
-                    return [
-                        {
-                            'id': str(row[0]),
-                            'user_id': str(row[1]),
-                            'user_message': row[2],
-                            'assistant_response': row[3],
-                            'session_id': row[4],
-                            'created_at': row[5].isoformat() if hasattr(row[5], 'isoformat') else str(row[5])
-                        }
-                        for row in result
-                    ]
-            else:
-                # Fallback to session state
-                chat_history = st.session_state.chat_history
-                
-                # Filter by user_id
-                user_chats = [chat for chat in chat_history if chat['user_id'] == user_id]
-                
-                # Filter by session_id if provided
-                if session_id:
-                    user_chats = [chat for chat in user_chats if chat['session_id'] == session_id]
-                
-                return sorted(user_chats, key=lambda x: x['created_at'])
-            
+                return _cached_chat_history(self, user_id, session_id, limit, before)
+            return list(self.iter_chat_history(user_id, session_id, limit, before))
         except Exception as e:
             st.error(f"Error retrieving chat history: {str(e)}")
             return []
     
-    def get_user_chat_sessions(self, user_id: str) -> List[Dict]:
-        """Get all chat sessions for a user"""
+    def _query_chat_sessions(self, user_id: str, limit: Optional[int] = 50, before: Optional[str] = None) -> List[Dict]:
+        name = 'select_chat_sessions_before' if before else 'select_chat_sessions'
+        params = {"user_id": user_id, "limit": limit, "before": before}
+        with self._conn() as conn:
+            rows = conn.execute(self._stmts[name], params).mappings().all()
+            
+            sessions = [dict(row) for row in rows]
+            for session in sessions:
+                session['id'] = str(session['id'])
+            
+            return sessions
+
+    def get_user_chat_sessions(self, user_id: str, limit: Optional[int] = 50,
+                               before: Optional[str] = None) -> List[Dict]:
+        """Get a page of chat sessions for a user; pass the last session's id as `before` for the next page"""
         try:
             if self.engine:
                 # Use Supabase database
-                with self.engine.connect() as conn:
-                    result = conn.execute(
-                        text("""
-                            SELECT id, title, category, created_at, updated_at, is_pinned
-                            FROM chat_sessions 
-                            WHERE user_id = :user_id 
-                            ORDER BY is_pinned DESC, updated_at DESC
-                        """),
-                        {"user_id": user_id}
-                    )
-                    
-                    sessions = []
-                    for row in result:
-                        sessions.append({
-                            'id': str(row[0]),
-                            'title': row[1],
-                            'category': row[2],
-                            'created_at': row[3],
-                            'updated_at': row[4],
-                            'is_pinned': row[5]
-                        })
-                    
-                    return sessions
+                return _cached_chat_sessions(self, user_id, limit, before)
             else:
-                # Fallback to session state
-                chat_history = st.session_state.chat_history
-                user_chats = [chat for chat in chat_history if chat['user_id'] == user_id]
-                
-                # Group by session_id
-                sessions = {}
-                for chat in user_chats:
-                    session_id = chat['session_id']
-                    if session_id not in sessions:
-                        sessions[session_id] = {
-                            'session_id': session_id,
-                            'created_at': chat['created_at'],
-                            'message_count': 0,
-                            'last_message': ''
-                        }
-                    
-                    sessions[session_id]['message_count'] += 1
-                    sessions[session_id]['last_message'] = chat['user_message'][:50] + '...'
-                
-                return list(sessions.values())
+                # Fallback to session state: summaries are maintained on write
+                sessions = [
+                    summary for summary in st.session_state.sessions_index.values()
+                    if summary['user_id'] == user_id
+                ]
+                if before:
+                    ids = [summary['session_id'] for summary in sessions]
+                    sessions = sessions[ids.index(before) + 1:] if before in ids else sessions
+                return sessions[:limit] if limit else sessions
             
         except Exception as e:
             st.error(f"Error retrieving chat sessions: {str(e)}")
@@ -176,38 +687,8 @@ class DatabaseManager:
         """Save meal log to database"""
         try:
             meal_log_id = str(uuid.uuid4())
-            
-            if self.engine:
-                # Use Supabase database
-                with self.engine.connect() as conn:
-                    conn.execute(
-                        text("""
-                            INSERT INTO meal_logs (id, user_id, meal_description, meal_time, image_path, created_at)
-                            VALUES (:id, :user_id, :meal_description, NOW(), :image_path, NOW())
-                        """),
-                        {
-                            "id": meal_log_id,
-                            "user_id": user_id,
-                            "meal_description": meal_description,
-                            "image_path": image_path
-                        }
-                    )
-                    conn.commit()
-                    return meal_log_id
-            else:
-                # Fallback to session state
-                meal_record = {
-                    'id': meal_log_id,
-                    'user_id': user_id,
-                    'meal_description': meal_description,
-                    'meal_time': datetime.now().isoformat(),
-                    'image_path': image_path,
-                    'created_at': datetime.now().isoformat()
-                }
-                
-                st.session_state.meal_logs.append(meal_record)
-                return meal_log_id
-            
+            self._insert_many('meal_logs', [self._meal_row(meal_log_id, user_id, meal_description, image_path)])
+            return meal_log_id
         except Exception as e:
             st.error(f"Error saving meal log: {str(e)}")
             return ""
@@ -217,76 +698,50 @@ class DatabaseManager:
                                sugar: float = 0.0, fiber: float = 0.0) -> bool:
         """Save nutrition analysis results"""
         try:
+            row = self._analysis_row(meal_log_id, calories, protein, carbs, fat, recommendation, sugar, fiber)
             if self.engine:
-                # Use Supabase database
-                with self.engine.connect() as conn:
-                    conn.execute(
-                        text("""
-                            INSERT INTO nutrition_analysis (id, meal_log_id, calories, protein_g, carbs_g, fat_g, sugar_g, fiber_g, recommendation, created_at)
-                            VALUES (:id, :meal_log_id, :calories, :protein_g, :carbs_g, :fat_g, :sugar_g, :fiber_g, :recommendation, NOW())
-                        """),
-                        {
-                            "id": str(uuid.uuid4()),
-                            "meal_log_id": meal_log_id,
-                            "calories": calories,
-                            "protein_g": protein,
-                            "carbs_g": carbs,
-                            "fat_g": fat,
-                            "sugar_g": sugar,
-                            "fiber_g": fiber,
-                            "recommendation": recommendation
-                        }
-                    )
-                    conn.commit()
-                    return True
+                # The meal log was committed synchronously, so the FK is already satisfied
+                self._enqueue('nutrition_analysis', row)
             else:
-                # Fallback to session state
-                analysis_record = {
-                    'id': str(uuid.uuid4()),
-                    'meal_log_id': meal_log_id,
-                    'calories': calories,
-                    'protein_g': protein,
-                    'carbs_g': carbs,
-                    'fat_g': fat,
-                    'sugar_g': sugar,
-                    'fiber_g': fiber,
-                    'recommendation': recommendation,
-                    'created_at': datetime.now().isoformat()
-                }
-                
-                st.session_state.nutrition_analysis.append(analysis_record)
-                return True
-            
+                self._insert_many('nutrition_analysis', [row])
+            return True
         except Exception as e:
             st.error(f"Error saving nutrition analysis: {str(e)}")
             return False
 
+    def save_meal_with_analysis(self, user_id: str, meal_description: str, image_path: Optional[str],
+                                calories: float, protein: float, carbs: float, fat: float,
+                                recommendation: str, sugar: float = 0.0, fiber: float = 0.0) -> str:
+        """Save a meal log and its nutrition analysis in one round-trip. Returns the meal log id."""
+        try:
+            meal_log_id = str(uuid.uuid4())
+            meal = self._meal_row(meal_log_id, user_id, meal_description, image_path)
+            analysis = self._analysis_row(meal_log_id, calories, protein, carbs, fat, recommendation, sugar, fiber)
+            if self.engine:
+                params = dict(analysis, user_id=user_id, meal_description=meal_description, image_path=image_path)
+                with self.engine.begin() as conn:
+                    conn.execute(self._stmts['insert_meal_with_analysis'], params)
+                self._invalidate('meal_logs', 'nutrition_analysis')
+            else:
+                self._insert_many('meal_logs', [meal])
+                self._insert_many('nutrition_analysis', [analysis])
+            return meal_log_id
+        except Exception as e:
+            st.error(f"Error saving meal: {str(e)}")
+            return ""
+
     def delete_meal_log(self, meal_log_id: str) -> bool:
         """Delete a meal log and its associated nutrition analysis records."""
         try:
             if self.engine:
-                with self.engine.connect() as conn:
-                    # Delete analyses first (if FK constraints exist)
-                    conn.execute(
-                        text("DELETE FROM nutrition_analysis WHERE meal_log_id = :meal_log_id"),
-                        {"meal_log_id": meal_log_id},
-                    )
-                    conn.execute(
-                        text("DELETE FROM meal_logs WHERE id = :meal_log_id"),
-                        {"meal_log_id": meal_log_id},
-                    )
-                    conn.commit()
-                    return True
+                with self.engine.begin() as conn:
+                    conn.execute(self._stmts['delete_meal'], {"meal_log_id": meal_log_id})
+                self._invalidate('meal_logs', 'nutrition_analysis')
+                return True
             else:
                 # Session-state fallback
-                if 'nutrition_analysis' in st.session_state:
-                    st.session_state.nutrition_analysis = [
-                        a for a in st.session_state.nutrition_analysis if a.get('meal_log_id') != meal_log_id
-                    ]
-                if 'meal_logs' in st.session_state:
-                    st.session_state.meal_logs = [
-                        m for m in st.session_state.meal_logs if m.get('id') != meal_log_id
-                    ]
+                st.session_state.meal_logs.pop(meal_log_id, None)
+                st.session_state.nutrition_analysis_by_meal.pop(meal_log_id, None)
                 return True
         except Exception as e:
             st.error(f"Error deleting meal log: {str(e)}")
@@ -296,97 +751,79 @@ class DatabaseManager:
         """Delete all meal logs and analyses for a user that are NOT from the provided ISO date (YYYY-MM-DD)."""
         try:
             if self.engine:
-                with self.engine.connect() as conn:
-                    # Delete analyses referencing non-today meal logs for this user
+                with self.engine.begin() as conn:
+                    # Delete non-today meal logs for this user and, in the same
+                    # statement, the analyses referencing them
                     conn.execute(
-                        text(
-                            """
-                            DELETE FROM nutrition_analysis
-                            WHERE meal_log_id IN (
-                                SELECT id FROM meal_logs
-                                WHERE user_id = :user_id AND CAST(meal_time AS DATE) <> CAST(:today AS DATE)
-                            )
-                            """
-                        ),
+                        self._stmts['delete_meals_not_today'],
                         {"user_id": user_id, "today": today_iso_date},
                     )
-                    # Delete non-today meal logs for this user
-                    conn.execute(
-                        text(
-                            """
-                            DELETE FROM meal_logs
-                            WHERE user_id = :user_id AND CAST(meal_time AS DATE) <> CAST(:today AS DATE)
-                            """
-                        ),
-                        {"user_id": user_id, "today": today_iso_date},
-                    )
-                    conn.commit()
-                    return True
+                self._invalidate('meal_logs', 'nutrition_analysis')
+                return True
             else:
                 # Session-state fallback: keep only today's logs for user
-                meals = st.session_state.get('meal_logs', [])
-                todays_ids = set()
-                keep_meals = []
+                meals = st.session_state.meal_logs
+                kept_ids = set()
+                keep_meals = {}
                 from datetime import datetime as _dt
-                for m in meals:
+                for m in meals.values():
                     if m.get('user_id') != user_id:
-                        keep_meals.append(m)
+                        keep_meals[m['id']] = m
+                        kept_ids.add(m['id'])
                         continue
                     mt = m.get('meal_time')
                     try:
                         dt = _dt.fromisoformat(mt.replace("Z", "+00:00")) if isinstance(mt, str) else _dt.now()
                         if dt.date().isoformat() == today_iso_date:
-                            keep_meals.append(m)
-                            todays_ids.add(m.get('id'))
+                            keep_meals[m['id']] = m
+                            kept_ids.add(m['id'])
                     except Exception:
                         # If cannot parse, treat as non-today and drop
                         pass
                 st.session_state.meal_logs = keep_meals
-                # Drop analyses not linked to today's kept meal ids
-                analyses = st.session_state.get('nutrition_analysis', [])
-                st.session_state.nutrition_analysis = [a for a in analyses if a.get('meal_log_id') in todays_ids]
+                # Drop analyses not linked to a kept meal id
+                analyses = st.session_state.nutrition_analysis_by_meal
+                st.session_state.nutrition_analysis_by_meal = {
+                    mid: a for mid, a in analyses.items() if mid in kept_ids
+                }
                 return True
         except Exception as e:
             st.error(f"Error deleting non-today meals: {str(e)}")
             return False
     
-    def get_user_meal_logs(self, user_id: str, limit: int = 10) -> List[Dict]:
+    def iter_user_meal_logs(self, user_id: str, limit: int = 10, offset: int = 0) -> Iterator[Dict]:
+        """Yield one page of a user's meal logs, newest first, streaming rows from the server."""
+        if self.engine:
+            # Use Supabase database
+            stmt = self._stmts['select_meal_logs'].execution_options(stream_results=True, yield_per=200)
+            # The page is collected inside the block so an abandoned generator never holds
+            # the shared connection
+            page = []
+            with self._conn() as conn:
+                result = conn.execute(stmt, {"user_id": user_id, "limit": limit, "offset": offset})
+                for rec in result.mappings():
+                    row = dict(rec)
+                    row['id'] = str(row['id'])
+                    row['user_id'] = str(row['user_id'])
+                    row['meal_time'] = _iso(row['meal_time'])
+                    row['created_at'] = _iso(row['created_at'])
+                    page.append(row)
+            yield from page
+        else:
+            # Fallback to session state
+            meal_logs = st.session_state.meal_logs
+            user_meals = (meal for meal in meal_logs.values() if meal['user_id'] == user_id)
+            
+            # Partial sort: only the newest offset + limit meals are ordered
+            newest = heapq.nlargest(offset + limit, user_meals, key=lambda x: (x['created_at'], x['id']))
+            yield from newest[offset:]
+
+    def get_user_meal_logs(self, user_id: str, limit: int = 10, offset: int = 0) -> List[Dict]:
         """Get recent meal logs for a user"""
         try:
             if self.engine:
-                # Use Supabase database
-                with self.engine.connect() as conn:
-                    result = conn.execute(
-                        text("""
-                            SELECT id, user_id, meal_description, meal_time, image_path, created_at
-                            FROM meal_logs 
-                            WHERE user_id = :user_id
-                            ORDER BY created_at DESC
-                            LIMIT :limit
-                        """),
-                        {"user_id": user_id, "limit": limit}
-                    )
-                    
-                    return [
-                        {
-                            'id': str(row[0]),
-                            'user_id': str(row[1]),
-                            'meal_description': row[2],
-                            'meal_time': row[3].isoformat() if hasattr(row[3], 'isoformat') else str(row[3]),
-                            'image_path': row[4],
-                            'created_at': row[5].isoformat() if hasattr(row[5], 'isoformat') else str(row[5])
-                        }
-                        for row in result
-                    ]
-            else:
-                # Fallback to session state
-                meal_logs = st.session_state.meal_logs
-                user_meals = [meal for meal in meal_logs if meal['user_id'] == user_id]
-                
-                # Sort by created_at and limit results
-                user_meals = sorted(user_meals, key=lambda x: x['created_at'], reverse=True)
-                return user_meals[:limit]
-            
+                return _cached_meal_logs(self, user_id, limit, offset)
+            return list(self.iter_user_meal_logs(user_id, limit, offset))
         except Exception as e:
             st.error(f"Error retrieving meal logs: {str(e)}")
             return []
@@ -396,19 +833,8 @@ class DatabaseManager:
         try:
             if self.engine:
                 # Use Supabase database (engine-backed): fetch latest analysis for the meal
-                with self.engine.connect() as conn:
-                    result = conn.execute(
-                        text(
-                            """
-                            SELECT id, meal_log_id, calories, protein_g, carbs_g, fat_g, sugar_g, fiber_g, recommendation, created_at
-                            FROM nutrition_analysis
-                            WHERE meal_log_id = :meal_log_id
-                            ORDER BY created_at DESC
-                            LIMIT 1
-                            """
-                        ),
-                        {"meal_log_id": meal_log_id}
-                    )
+                with self._conn() as conn:
+                    result = conn.execute(self._stmts['get_nutri'], {"meal_log_id": meal_log_id})
                     row = result.fetchone()
                     if not row:
                         return None
@@ -426,11 +852,7 @@ class DatabaseManager:
                     }
             else:
                 # Fallback to session state
-                analyses = st.session_state.get('nutrition_analysis', [])
-                for analysis in analyses:
-                    if analysis.get('meal_log_id') == meal_log_id:
-                        return analysis
-                return None
+                return st.session_state.nutrition_analysis_by_meal.get(meal_log_id)
             
         except Exception as e:
             st.error(f"Error retrieving nutrition analysis: {str(e)}")
@@ -439,14 +861,34 @@ class DatabaseManager:
     def get_user_nutrition_summary(self, user_id: str, days: int = 7) -> Dict:
         """Get nutrition summary for the last N days"""
         try:
-            # This would be a complex query in real implementation
-            # For now, return mock summary data
+            if self.engine:
+                # One aggregate round-trip instead of a per-meal analysis lookup
+                with self._conn() as conn:
+                    row = conn.execute(
+                        self._stmts['nutrition_summary'],
+                        {"user_id": user_id, "days": days},
+                    ).fetchone()
+                    total_meals, avg_calories, avg_protein, avg_carbs, avg_fat = row
+            else:
+                # Fallback to session state
+                cutoff = (datetime.now() - timedelta(days=days)).isoformat()
+                by_meal = st.session_state.nutrition_analysis_by_meal
+                analyses = [
+                    by_meal[meal['id']] for meal in st.session_state.meal_logs.values()
+                    if meal['user_id'] == user_id and meal['created_at'] > cutoff and meal['id'] in by_meal
+                ]
+                n = len(analyses)
+                total_meals = len({a['meal_log_id'] for a in analyses})
+                avg_calories, avg_protein, avg_carbs, avg_fat = (
+                    sum(float(a.get(key) or 0) for a in analyses) / n if n else None
+                    for key in ('calories', 'protein_g', 'carbs_g', 'fat_g')
+                )
             return {
-                'total_meals': 21,
-                'avg_calories': 2100,
-                'avg_protein': 120,
-                'avg_carbs': 240,
-                'avg_fat': 70,
+                'total_meals': int(total_meals or 0),
+                'avg_calories': round(float(avg_calories or 0), 1),
+                'avg_protein': round(float(avg_protein or 0), 1),
+                'avg_carbs': round(float(avg_carbs or 0), 1),
+                'avg_fat': round(float(avg_fat or 0), 1),
                 'days': days
             }
             
@@ -457,53 +899,24 @@ class DatabaseManager:
     # -------------------------
     # User Preferences (Nutrition Plan)
     # -------------------------
-    def _ensure_user_preferences_table(self):
-        """Create user_preferences table if it does not exist (engine-backed only)."""
-        if not self.engine:
-            return
-        with self.engine.connect() as conn:
-            conn.execute(
-                text(
-                    """
-                    CREATE TABLE IF NOT EXISTS user_preferences (
-                        user_id uuid PRIMARY KEY,
-                        preferences jsonb NOT NULL DEFAULT '{}'::jsonb,
-                        updated_at timestamptz NOT NULL DEFAULT NOW()
-                    )
-                    """
-                )
-            )
-            conn.commit()
-
     def save_user_preferences(self, user_id: str, preferences: Dict) -> bool:
         """Create or update user preferences in user_preferences table.
         Expects a JSON-capable column named `preferences` and a unique constraint on user_id.
         """
         try:
             if self.engine:
-                # Ensure table exists
-                self._ensure_user_preferences_table()
-                with self.engine.connect() as conn:
+                with self.engine.begin() as conn:
                     # Postgres upsert on user_id
                     conn.execute(
-                        text(
-                            """
-                            INSERT INTO user_preferences (user_id, preferences, updated_at)
-                            VALUES (:user_id, :preferences, NOW())
-                            ON CONFLICT (user_id)
-                            DO UPDATE SET preferences = EXCLUDED.preferences, updated_at = NOW()
-                            """
-                        ),
+                        self._stmts['upsert_prefs'],
                         {
                             "user_id": user_id,
-                            # Serialize to JSON string for portability across drivers
-                            "preferences": __import__("json").dumps(preferences),
+                            "preferences": self._json_param(preferences),
                         }
                     )
-                    # Work around JSON binding by sending as string when needed
-                    # If above fails on some drivers, try string dump
-                    conn.commit()
-                    return True
+                self._invalidate('user_preferences')
+                self._prefs_cache[user_id] = dict(preferences)
+                return True
             else:
                 if 'user_preferences' not in st.session_state:
                     st.session_state.user_preferences = {}
@@ -513,32 +926,26 @@ class DatabaseManager:
             st.error(f"Error saving user preferences: {str(e)}")
             return False
 
+    def _query_user_preferences(self, user_id: str) -> Dict:
+        with self._conn() as conn:
+            res = conn.execute(self._stmts['get_prefs'], {"user_id": user_id})
+            row = res.fetchone()
+            if not row:
+                return {}
+            prefs = row[0]
+            # Some drivers return JSON already as dict, others as str
+            if isinstance(prefs, str):
+                return json.loads(prefs)
+            return dict(prefs) if prefs else {}
+
     def get_user_preferences(self, user_id: str) -> Dict:
         """Fetch user preferences. Returns empty dict if none."""
         try:
             if self.engine:
-                # Ensure table exists
-                self._ensure_user_preferences_table()
-                with self.engine.connect() as conn:
-                    res = conn.execute(
-                        text(
-                            """
-                            SELECT preferences
-                            FROM user_preferences
-                            WHERE user_id = :user_id
-                            """
-                        ),
-                        {"user_id": user_id},
-                    )
-                    row = res.fetchone()
-                    if not row:
-                        return {}
-                    prefs = row[0]
-                    # Some drivers return JSON already as dict, others as str
-                    if isinstance(prefs, str):
-                        import json
-                        return json.loads(prefs)
-                    return dict(prefs) if prefs else {}
+                prefs = self._prefs_cache.get(user_id)
+                if prefs is None:
+                    prefs = self._prefs_cache[user_id] = _cached_user_preferences(self, user_id)
+                return dict(prefs)
             else:
                 return (st.session_state.get('user_preferences') or {}).get(user_id, {})
         except Exception as e:
@@ -5,10 +5,22 @@ Food-101 classifier at model_weights/food101_model.pth.
 """
 
 import os
+import json
+import hashlib
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import nullcontext
 from typing import List, Dict, Tuple, Optional
 
+import numpy as np
 import torch
 import torchvision.transforms as T
+try:
+    from torchvision.transforms import v2
+except Exception:  # torchvision < 0.15
+    v2 = None
 import torchvision.models as models
 from PIL import Image
 
@@ -21,6 +33,139 @@ try:
 except Exception:
     _TIMM_AVAILABLE = False
 
+try:
+    from cachetools import LRUCache
+except Exception:
+    LRUCache = None
+
+# Optional: safetensors for a pickle-free, memory-mapped copy of the weights
+try:
+    from safetensors import safe_open
+    from safetensors.torch import save_file as safetensors_save_file
+    _SAFETENSORS_AVAILABLE = True
+except Exception:
+    _SAFETENSORS_AVAILABLE = False
+
+# Optional: ONNX Runtime for CPU serving of the exported model
+try:
+    import onnxruntime as ort
+    _ORT_AVAILABLE = True
+except Exception:
+    _ORT_AVAILABLE = False
+
+
+# Micro-batching: concurrent classify_food_batched callers arriving within this window share one forward
+MICROBATCH_WINDOW_S = 0.008
+MICROBATCH_MAX = 16
+
+# Result caches for repeat images (re-renders, retries), keyed on the transformed model input
+RESULT_CACHE_SIZE = 128
+
+_CPU_RUNTIME_CONFIGURED = False
+
+
+def _configure_cpu_runtime() -> None:
+    """Size torch's CPU thread pools once per process, before the first model load.
+    Defaults oversubscribe when several Streamlit sessions/workers share the host.
+    NUTRINET_NUM_THREADS overrides; an explicit OMP_NUM_THREADS is left alone.
+    """
+    global _CPU_RUNTIME_CONFIGURED
+    if _CPU_RUNTIME_CONFIGURED:
+        return
+    _CPU_RUNTIME_CONFIGURED = True
+    threads = os.getenv("NUTRINET_NUM_THREADS", "")
+    if threads.isdigit():
+        torch.set_num_threads(max(1, int(threads)))
+    elif not os.getenv("OMP_NUM_THREADS"):
+        torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # inter-op pool already started by other torch work in this process
+
+
+# Basic per-100 g nutrition estimates (extend/replace with your DB as needed), stored column-wise:
+# one row per food in _NUTRITION_MATRIX, columns in NUTRITION_COLS order
+NUTRITION_COLS = ("calories", "protein_g", "carbs_g", "fat_g", "fiber_g")
+_NUTRITION_ROWS = {
+    "pizza": (266, 11, 33, 10, 2),
+    "sushi": (150, 25, 15, 2, 1),
+    "burger": (295, 17, 30, 12, 2),
+    "pasta": (131, 5, 25, 1, 2),
+    "salad": (20, 2, 4, 0, 2),
+    "steak": (271, 26, 0, 18, 0),
+    "rice": (130, 3, 28, 0, 0),
+    # ...extend as needed
+}
+_NUTRITION_IDX = {name: i for i, name in enumerate(_NUTRITION_ROWS)}
+_NUTRITION_MATRIX = np.array(list(_NUTRITION_ROWS.values()), dtype=np.float64)
+_GENERIC_NUTRITION = np.array((160, 7, 20, 5, 2), dtype=np.float64)  # fallback for unknown foods
+
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def _cpu_has_native_bf16() -> bool:
+    """AMX or AVX512-BF16; elsewhere bf16 autocast is emulated and slower than fp32."""
+    for probe in ("_is_amx_tile_supported", "_is_avx512_bf16_supported"):
+        fn = getattr(torch.cpu, probe, None)
+        try:
+            if fn is not None and fn():
+                return True
+        except Exception:
+            pass
+    return False
+
+
+class _OrtModel:
+    """Callable stand-in for the torch module when the exported ONNX graph is served by ONNX Runtime."""
+
+    training = False
+
+    def __init__(self, path: str, input_dtype: str):
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        so.intra_op_num_threads = torch.get_num_threads()
+        self.session = ort.InferenceSession(path, sess_options=so, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_dtype = input_dtype
+
+    def eval(self):
+        return self
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        x = batch.detach().cpu().contiguous().numpy().astype(self.input_dtype, copy=False)
+        return torch.from_numpy(self.session.run(None, {self.input_name: x})[0])
+
+
+class _TensorTransform:
+    """PIL image -> uint8 tensor on `device`, then Resize(256)/CenterCrop(224) as tensor ops there
+    (transforms.v2 kernels run on GPU too), so a large photo crosses to the device once."""
+
+    def __init__(self, device: torch.device):
+        self.device = device
+        self.ops = v2.Compose([v2.Resize(256, antialias=True), v2.CenterCrop(224)])
+
+    def __call__(self, image: Image.Image) -> torch.Tensor:
+        t = v2.functional.pil_to_tensor(image)
+        if self.device.type != "cpu":
+            t = t.to(self.device, non_blocking=True)
+        return self.ops(t)
+
+
+class _NormalizeInput(torch.nn.Module):
+    """uint8 image batch -> ImageNet-normalized float, as the first op of the model graph.
+    The 1/255 scaling is folded into the buffers, so it is one subtract and one divide.
+    """
+
+    def __init__(self, mean, std):
+        super().__init__()
+        self.register_buffer("mean", torch.tensor(mean).view(1, -1, 1, 1) * 255.0)
+        self.register_buffer("std", torch.tensor(std).view(1, -1, 1, 1) * 255.0)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return (x.float() - self.mean) / self.std
+
 
 class NutriNetVision:
     def __init__(self):
@@ -29,7 +174,27 @@ class NutriNetVision:
         self.suspect_weights = False
         self.weight_overlap = 0.0
         self.arch = "resnet50"  # default
-        self.setup_models()
+        self.input_size = (3, 224, 224)  # overridden by timm's data config
+        self._normalize = None  # set when normalization runs in-graph (torchvision transform)
+        self._channels_last = False  # NHWC inputs/weights for the torchvision ResNet50 path
+        self._autocast_dtype: Optional[torch.dtype] = None  # see _setup_precision
+        # CUDA when present; NUTRINET_FORCE_CPU=1 keeps everything on CPU
+        use_cuda = torch.cuda.is_available() and os.getenv("NUTRINET_FORCE_CPU", "0") != "1"
+        self.device = torch.device("cuda" if use_cuda else "cpu")
+        self._batch_queue: Optional["queue.Queue"] = None
+        self._batch_lock = threading.Lock()
+        # Content-hash LRU caches for per-image logits and analyze_image; disabled if cachetools is missing
+        self._cache_lock = threading.Lock()
+        self._logits_cache = LRUCache(maxsize=RESULT_CACHE_SIZE) if LRUCache else None
+        self._analyze_cache = LRUCache(maxsize=RESULT_CACHE_SIZE) if LRUCache else None
+        # NUTRINET_DISABLE_JIT_OPT=1 trades a few percent steady-state speed for no JIT profiling passes
+        self._jit_opt = os.getenv("NUTRINET_DISABLE_JIT_OPT", "0") != "1"
+        # The model is loaded lazily (see _ensure_model); name/nutrition lookups never pay for it
+        self.model = None
+        self._model_ready = False
+        self._model_lock = threading.Lock()
+        self._load_error: Optional[Exception] = None  # a failed load is not retried
+        self._prepare_meta()
 
     def _load_class_names(self) -> List[str]:
         """Optionally load class names for Food-101 from a text file or checkpoint.
@@ -49,6 +214,13 @@ class NutriNetVision:
             class_names = [f"class_{i}" for i in range(101)]
         return class_names
 
+    def _set_class_names(self, names: List[str]) -> None:
+        """Replace class_names and the name -> index map used by get_class_index."""
+        self.class_names = names
+        self._name_to_idx = {}
+        for i, name in enumerate(names):
+            self._name_to_idx.setdefault(name, i)  # first occurrence wins, like list.index
+
     def _clean_state_key(self, k: str) -> str:
         """Strip common prefixes like 'module.' or 'model.' or 'backbone.'
         from state_dict keys so they match torchvision resnet naming.
@@ -58,68 +230,128 @@ class NutriNetVision:
                 return k[len(prefix) :]
         return k
 
+    def _overlap_stats(self, state_dict: Dict, target_sd: Dict) -> Tuple[int, int]:
+        """(keys in common, keys in common with matching shape) between a checkpoint and a model."""
+        common = state_dict.keys() & target_sd.keys()
+        shape_match = sum(1 for k in common if target_sd[k].shape == state_dict[k].shape)
+        return len(common), shape_match
+
+    def _safetensors_path(self) -> str:
+        return os.path.join("model_weights", "food101.safetensors")
+
+    def _load_checkpoint(self, model_path: str):
+        """Prefer model_weights/food101.safetensors (written by _save_safetensors, not older than the
+        .pth): tensors come straight from the mapped file onto self.device, with no unpickling.
+        Otherwise torch.load with mmap=True and weights_only=True onto self.device. Falls back to a
+        plain load on torch < 2.1, legacy non-zip files, or checkpoints that pickle non-tensor objects.
+        """
+        st_path = self._safetensors_path()
+        if (
+            _SAFETENSORS_AVAILABLE
+            and os.path.exists(st_path)
+            and os.path.getmtime(st_path) >= os.path.getmtime(model_path)
+        ):
+            try:
+                with safe_open(st_path, framework="pt", device=str(self.device)) as f:
+                    ckpt = {"state_dict": {k: f.get_tensor(k) for k in f.keys()}}
+                    meta = f.metadata() or {}
+                if meta.get("arch"):
+                    ckpt["arch"] = meta["arch"]
+                if meta.get("class_names"):
+                    ckpt["class_names"] = json.loads(meta["class_names"])
+                self.load_info["weights_format"] = "safetensors"
+                return ckpt
+            except Exception as e_st:
+                self.load_info["safetensors_error"] = str(e_st)
+        try:
+            return torch.load(model_path, map_location=self.device, mmap=True, weights_only=True)
+        except TypeError:
+            pass
+        except Exception as e_mmap:
+            self.load_info["mmap_error"] = str(e_mmap)
+        return torch.load(model_path, map_location=self.device)
+
+    def _save_safetensors(self, state_dict: Dict) -> None:
+        """One-time conversion of the .pth weights to safetensors for faster later loads.
+        Arch (and class names, when they came from the checkpoint) ride along as header metadata.
+        """
+        if not _SAFETENSORS_AVAILABLE or self.load_info.get("weights_format") == "safetensors":
+            return
+        st_path = self._safetensors_path()
+        try:
+            tensors = {
+                k: v.detach().cpu().contiguous()
+                for k, v in state_dict.items()
+                if isinstance(v, torch.Tensor)
+            }
+            meta = {"arch": self.arch}
+            if self.load_info.get("class_names_source") == "checkpoint":
+                meta["class_names"] = json.dumps(self.class_names)
+            tmp_path = st_path + ".tmp"
+            safetensors_save_file(tensors, tmp_path, metadata=meta)
+            os.replace(tmp_path, st_path)  # atomic, so a concurrent load never sees a partial file
+            self.load_info["safetensors_saved"] = st_path
+        except Exception as e_st:
+            self.load_info["safetensors_error"] = str(e_st)
+
+    def _load_state(self, module: torch.nn.Module, state_dict: Dict):
+        """load_state_dict(strict=False) that adopts the checkpoint tensors (assign=True) instead
+        of copying them into freshly initialized params. Only when every float tensor is already
+        fp32, since assign would otherwise change the module's dtype.
+        """
+        fp32 = all(
+            v.dtype == torch.float32
+            for v in state_dict.values()
+            if isinstance(v, torch.Tensor) and v.is_floating_point()
+        )
+        if fp32:
+            try:
+                return module.load_state_dict(state_dict, strict=False, assign=True)
+            except TypeError:
+                pass
+        return module.load_state_dict(state_dict, strict=False)
+
     def _try_load_class_names_from_ckpt(self, ckpt: Dict) -> None:
         """Attempt to derive class name ordering from checkpoint metadata if available."""
-        def set_if_valid(names: List[str]):
+        if not ckpt:
+            return
+
+        def set_if_valid(names) -> bool:
             if isinstance(names, list) and len(names) == 101 and all(isinstance(x, str) for x in names):
-                self.class_names = names
+                self._set_class_names(names)
+                self.load_info["class_names_source"] = "checkpoint"
                 return True
             return False
 
-        # Direct list
-        for key in ("classes", "class_names", "labels", "labels_map"):
-            if key in ckpt and isinstance(ckpt[key], list):
-                if set_if_valid(ckpt[key]):
-                    return
-        # Nested metadata
-        for meta_key in ("meta", "args", "hparams", "config"):
-            meta = ckpt.get(meta_key)
-            if isinstance(meta, dict):
+        # Direct list, then nested metadata
+        for blob in (ckpt, *(ckpt.get(k) for k in ("meta", "args", "hparams", "config"))):
+            if isinstance(blob, dict):
                 for key in ("classes", "class_names", "labels", "labels_map"):
-                    if key in meta and isinstance(meta[key], list):
-                        if set_if_valid(meta[key]):
-                            return
-        # idx_to_class dict
-        for key in ("idx_to_class", "index_to_class", "itoc"):
-            mapping = ckpt.get(key)
-            if isinstance(mapping, dict):
+                    if set_if_valid(blob.get(key)):
+                        return
+        # idx_to_class / class_to_idx dicts (keys may be str or int): one pass, each name into its slot
+        for keys, by_index in (
+            (("idx_to_class", "index_to_class", "itoc"), True),
+            (("class_to_idx", "cto", "class2idx"), False),
+        ):
+            for key in keys:
+                mapping = ckpt.get(key)
+                if not isinstance(mapping, dict) or len(mapping) != 101:
+                    continue
+                names = [None] * 101
                 try:
-                    # keys may be str or int
-                    pairs = []
                     for k, v in mapping.items():
-                        try:
-                            idx = int(k)
-                        except Exception:
-                            idx = int(k) if isinstance(k, (int, str)) else None
-                        if idx is None:
-                            continue
-                        pairs.append((idx, v))
-                    if pairs:
-                        pairs.sort(key=lambda x: x[0])
-                        names = [str(v) for _, v in pairs]
-                        if set_if_valid(names):
-                            return
-                except Exception:
-                    pass
-        # class_to_idx dict
-        for key in ("class_to_idx", "cto", "class2idx"):
-            mapping = ckpt.get(key)
-            if isinstance(mapping, dict):
-                try:
-                    size = max(int(v) for v in mapping.values()) + 1
-                    names = [None] * size
-                    for cls, idx in mapping.items():
-                        names[int(idx)] = str(cls)
-                    if None not in names and set_if_valid(names):
-                        return
-                except Exception:
-                    pass
+                        idx, name = (k, v) if by_index else (v, k)
+                        names[int(idx)] = str(name)
+                except (TypeError, ValueError, IndexError):
+                    continue
+                if set_if_valid(names):
+                    return
 
     def _load_meta(self) -> Dict:
         """Load sidecar metadata if present: model_weights/food101_meta.json
         Expected fields: {"arch": "tf_efficientnet_b4_ns", "class_names": [..101..]}
         """
-        import json
         meta_path = os.path.join("model_weights", "food101_meta.json")
         if os.path.exists(meta_path):
             try:
@@ -130,37 +362,69 @@ class NutriNetVision:
                 return {}
         return {}
 
+    def _prepare_meta(self) -> None:
+        """Cheap, eager part of setup: check the weights exist and resolve arch and class names.
+        The model itself is materialized on first use by _ensure_model.
+        """
+        model_path = os.path.join("model_weights", "food101_model.pth")
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"Food-101 weights not found at {model_path}. Please add the file."
+            )
+
+        # Load meta (arch, classes) if available
+        meta = self._load_meta()
+        if isinstance(meta, dict):
+            arch_from_meta = meta.get("arch")
+            if isinstance(arch_from_meta, str) and arch_from_meta.strip():
+                self.arch = arch_from_meta.strip()
+
+        # If meta carried class_names, prefer it
+        if isinstance(meta.get("class_names"), list) and len(meta["class_names"]) == 101:
+            self._set_class_names([str(x) for x in meta["class_names"]])
+        else:
+            self._set_class_names(self._load_class_names())
+
+        self.load_info = {"path": model_path, "arch": self.arch}
+
+    def load(self) -> None:
+        """Load the model (checkpoint, INT8/ONNX setup, warmup) now rather than on first use.
+        Call it where a loading indicator is shown; raises if the model cannot be loaded."""
+        self._ensure_model()
+
+    def _ensure_model(self) -> None:
+        """Load the model on first use; later calls return immediately.
+        After a failed load every call raises at once instead of re-reading the checkpoint."""
+        if self._model_ready:
+            return
+        with self._model_lock:
+            if self._load_error is not None:
+                raise RuntimeError(f"Food-101 model failed to load: {self._load_error}") from self._load_error
+            if not self._model_ready:
+                try:
+                    self.setup_models()
+                except Exception as e:
+                    self._load_error = e
+                    raise
+                self._model_ready = True
+
     def setup_models(self):
         """Initialize Food-101 classifier from model_weights/food101_model.pth"""
         try:
-            model_path = os.path.join("model_weights", "food101_model.pth")
-            if not os.path.exists(model_path):
-                raise FileNotFoundError(
-                    f"Food-101 weights not found at {model_path}. Please add the file."
-                )
-
-            # Load meta (arch, classes) if available
-            meta = self._load_meta()
-            if isinstance(meta, dict):
-                arch_from_meta = meta.get("arch")
-                if isinstance(arch_from_meta, str) and arch_from_meta.strip():
-                    self.arch = arch_from_meta.strip()
-
-            self.class_names = self._load_class_names()
-            # If meta carried class_names, prefer it
-            if isinstance(meta.get("class_names"), list) and len(meta["class_names"]) == 101:
-                self.class_names = [str(x) for x in meta["class_names"]]
-
-            self.load_info = {"path": model_path, "arch": self.arch}
+            model_path = self.load_info["path"]
+            _configure_cpu_runtime()
 
             # Option to disable TorchScript path via env
             disable_ts = os.getenv("NUTRINET_DISABLE_TORCHSCRIPT", "0") == "1"
 
-            # Try to load as TorchScript first (if the file is scripted/traced)
             self.model = None
-            if not disable_ts:
+            # INT8 fast path: a previously quantized + scripted ResNet50 (see _quantize_int8)
+            self._load_int8(model_path)
+
+            # Try to load as TorchScript first (if the file is scripted/traced)
+            if self.model is None and not disable_ts:
                 try:
-                    self.model = torch.jit.load(model_path, map_location="cpu")
+                    self.model = torch.jit.load(model_path, map_location=self.device)
                     _ = self.model.eval()
                     self.is_scripted = True
                     self.load_info.update({"mode": "torchscript"})
@@ -168,13 +432,13 @@ class NutriNetVision:
                 except Exception as e_js:
                     self.is_scripted = False
                     self.load_info.update({"torchscript_error": str(e_js)})
-            else:
+            elif self.model is None:
                 self.is_scripted = False
                 self.load_info.update({"torchscript_skipped": True})
 
             # If not TorchScript, try an architecture-aware load
             if self.model is None:
-                ckpt = torch.load(model_path, map_location="cpu")
+                ckpt = self._load_checkpoint(model_path)
                 # Try to discover arch in checkpoint
                 for meta_key in ("arch", "model_name"):
                     if isinstance(ckpt, dict) and meta_key in ckpt and isinstance(ckpt[meta_key], str):
@@ -209,17 +473,12 @@ class NutriNetVision:
                         model = timm.create_model(self.arch, pretrained=False, num_classes=101)
                         # Clean prefixes
                         cleaned = {self._clean_state_key(k): v for k, v in state_dict.items()} if isinstance(state_dict, dict) else state_dict
-                        missing, unexpected = model.load_state_dict(cleaned, strict=False)
+                        missing, unexpected = self._load_state(model, cleaned)
                         self.model = model.eval()
                         used_timm = True
                         # Compute overlap stats
                         target_sd = model.state_dict()
-                        overlap = sum(1 for k in cleaned.keys() if k in target_sd) if isinstance(cleaned, dict) else 0
-                        shape_match = 0
-                        if isinstance(cleaned, dict):
-                            for k, v in cleaned.items():
-                                if k in target_sd and tuple(target_sd[k].shape) == tuple(v.shape):
-                                    shape_match += 1
+                        overlap, shape_match = self._overlap_stats(cleaned, target_sd) if isinstance(cleaned, dict) else (0, 0)
                         total = len(target_sd)
                         self.weight_overlap = shape_match / max(total, 1)
                         self.load_info.update({
@@ -233,6 +492,7 @@ class NutriNetVision:
                         # Transforms from timm config
                         data_cfg = resolve_model_data_config(model)
                         self.transform = timm_create_transform(**data_cfg, is_training=False)
+                        self.input_size = tuple(data_cfg.get("input_size", self.input_size))
                     except Exception as e_timm:
                         self.load_info["timm_error"] = str(e_timm)
 
@@ -247,26 +507,19 @@ class NutriNetVision:
                     except Exception:
                         pass
                     cleaned_state_dict = {self._clean_state_key(k): v for k, v in state_dict.items()} if isinstance(state_dict, dict) else {}
-                    # Remap Sequential FC keys (fc.1.*) -> fc.* as notebook saved Dropout+Linear
-                    remapped_state_dict = {}
-                    for k, v in cleaned_state_dict.items():
-                        if k.startswith("fc.1."):
-                            new_k = "fc." + k[len("fc.1."):]
-                            remapped_state_dict[new_k] = v
-                        else:
-                            remapped_state_dict[k] = v
-                    if any(k.startswith("classifier.") for k in remapped_state_dict.keys()):
-                        if "classifier.weight" in remapped_state_dict and "classifier.bias" in remapped_state_dict:
-                            remapped_state_dict["fc.weight"] = remapped_state_dict["classifier.weight"]
-                            remapped_state_dict["fc.bias"] = remapped_state_dict["classifier.bias"]
+                    # Remap Sequential FC keys (fc.1.*) -> fc.* as notebook saved Dropout+Linear;
+                    # plain torchvision checkpoints skip the rebuild entirely
+                    remapped_state_dict = cleaned_state_dict
+                    if any(k.startswith("fc.1.") for k in cleaned_state_dict):
+                        remapped_state_dict = {
+                            ("fc." + k[len("fc.1."):] if k.startswith("fc.1.") else k): v
+                            for k, v in cleaned_state_dict.items()
+                        }
+                    if "classifier.weight" in remapped_state_dict and "classifier.bias" in remapped_state_dict:
+                        remapped_state_dict["fc.weight"] = remapped_state_dict["classifier.weight"]
+                        remapped_state_dict["fc.bias"] = remapped_state_dict["classifier.bias"]
                     target_sd = backbone.state_dict()
-                    overlap = 0
-                    shape_match = 0
-                    for k, v in remapped_state_dict.items():
-                        if k in target_sd:
-                            overlap += 1
-                            if tuple(target_sd[k].shape) == tuple(v.shape):
-                                shape_match += 1
+                    overlap, shape_match = self._overlap_stats(remapped_state_dict, target_sd)
                     total = len(target_sd)
                     self.weight_overlap = shape_match / max(total, 1)
                     self.load_info.update({
@@ -275,7 +528,7 @@ class NutriNetVision:
                         "shape_match_ratio": round(self.weight_overlap, 3),
                         "total_params_keys": total,
                     })
-                    missing, unexpected = backbone.load_state_dict(remapped_state_dict, strict=False)
+                    missing, unexpected = self._load_state(backbone, remapped_state_dict)
                     self.model = backbone.eval()
                     self.load_info.update({
                         "missing_keys_count": len(missing),
@@ -284,21 +537,250 @@ class NutriNetVision:
                     if self.weight_overlap < 0.5:
                         self.suspect_weights = True
 
-                # If transform not set by timm path, use torchvision default
-                if not hasattr(self, "transform"):
+                if isinstance(state_dict, dict) and not self.suspect_weights:
+                    self._save_safetensors(state_dict)
+
+            # If transform not set by timm path, use torchvision default
+            # (also covers the TorchScript path, which never sets one)
+            # Pre-model work is only resize/crop to uint8; scaling and Normalize run in the model
+            if not hasattr(self, "transform"):
+                if v2 is not None:
+                    self.transform = _TensorTransform(self.device)
+                else:
                     self.transform = T.Compose(
                         [
                             T.Resize(256),
                             T.CenterCrop(224),
-                            T.ToTensor(),
-                            T.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+                            T.PILToTensor(),
                         ]
                     )
+                self._normalize = _NormalizeInput(IMAGENET_MEAN, IMAGENET_STD)
+
+            if self.load_info.get("mode") == "state_dict" and self.device.type == "cpu":
+                self._quantize_int8()
+            if self._normalize is not None:
+                self.model = torch.nn.Sequential(self._normalize, self.model).eval()
+                # oneDNN/cuDNN conv kernels prefer NHWC; timm models keep their own layout
+                try:
+                    self.model = self.model.to(memory_format=torch.channels_last)
+                    self._channels_last = True
+                except Exception as e_cl:
+                    self.load_info["channels_last_error"] = str(e_cl)
+            if self.device.type != "cpu":
+                # Keys missing from the checkpoint (and the normalize buffers) are still on CPU
+                self.model = self.model.to(self.device)
+                self.load_info["device"] = str(self.device)
+            self._load_ort(model_path)
+            self._setup_precision()
+            if not self._compile():
+                self._optimize_jit()
+            self._warmup()
 
         except Exception as e:
             print(f"Error setting up Food-101 model: {str(e)}")
             raise
 
+    def _int8_path(self) -> str:
+        return os.path.join("model_weights", "food101_int8.pt")
+
+    def _load_int8(self, model_path: str) -> None:
+        """Load the cached INT8 model if present and not older than the FP32 weights."""
+        int8_path = self._int8_path()
+        if os.getenv("NUTRINET_DISABLE_INT8", "0") == "1" or not os.path.exists(int8_path):
+            return
+        if self.device.type != "cpu":  # fbgemm/x86 INT8 kernels are CPU-only
+            return
+        if os.path.getmtime(int8_path) < os.path.getmtime(model_path):
+            return
+        try:
+            extra = {"class_names.json": ""}
+            model = torch.jit.load(int8_path, map_location="cpu", _extra_files=extra)
+            raw = extra["class_names.json"]
+            names = json.loads(raw.decode("utf-8") if isinstance(raw, bytes) else raw or "[]")
+            if isinstance(names, list) and len(names) == 101:
+                self._set_class_names([str(x) for x in names])
+            self.model = model.eval()
+            self.is_scripted = True
+            self.load_info.update({"mode": "int8", "int8_path": int8_path})
+        except Exception as e_int8:
+            self.model = None
+            self.load_info["int8_error"] = str(e_int8)
+
+    def _quantize_int8(self) -> None:
+        """Static INT8 quantization (FX graph mode, fbgemm/x86 qconfig) of the ResNet50 backbone,
+        calibrated on up to 64 images from model_weights/calib/. The result is scripted and saved
+        to model_weights/food101_int8.pt for _load_int8. Without calibration images, FP32 is kept.
+        """
+        calib_dir = os.path.join("model_weights", "calib")
+        if os.getenv("NUTRINET_DISABLE_INT8", "0") == "1" or not os.path.isdir(calib_dir):
+            return
+        files = sorted(
+            f for f in os.listdir(calib_dir) if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+        )[:64]
+        if not files:
+            return
+        try:
+            from torch.ao.quantization import get_default_qconfig_mapping
+            from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+            qconfig_mapping = get_default_qconfig_mapping(torch.backends.quantized.engine)
+            example = torch.zeros(1, *self.input_size)
+            prepared = prepare_fx(self.model.eval(), qconfig_mapping, (example,))
+            with torch.no_grad():
+                for name in files:
+                    with Image.open(os.path.join(calib_dir, name)) as im:
+                        prepared(self._normalize(self.transform(im.convert("RGB")).unsqueeze(0)))
+            scripted = torch.jit.script(convert_fx(prepared))
+            torch.jit.save(
+                scripted,
+                self._int8_path(),
+                _extra_files={"class_names.json": json.dumps(self.class_names)},
+            )
+            self.model = scripted.eval()
+            self.is_scripted = True
+            self.load_info.update({"mode": "int8", "calibration_images": len(files)})
+        except Exception as e_q:
+            self.load_info["int8_error"] = str(e_q)
+
+    def _onnx_path(self) -> str:
+        return os.path.join("model_weights", "food101.onnx")
+
+    def _load_ort(self, model_path: str) -> None:
+        """Serve eager FP32 models through ONNX Runtime (graph fusions, MLAS kernels) when installed.
+        The export is cached at model_weights/food101.onnx and redone when the .pth is newer.
+        Scripted/INT8 models stay on torch. NUTRINET_DISABLE_ORT=1 opts out.
+        """
+        if not _ORT_AVAILABLE or os.getenv("NUTRINET_DISABLE_ORT", "0") == "1":
+            return
+        if getattr(self, "is_scripted", False) or self.device.type != "cpu":
+            return
+        onnx_path = self._onnx_path()
+        # The torchvision path feeds uint8 (normalization is in-graph); timm transforms give floats
+        input_dtype = "uint8" if self._normalize is not None else "float32"
+        try:
+            if not os.path.exists(onnx_path) or os.path.getmtime(onnx_path) < os.path.getmtime(model_path):
+                dummy = self._dummy_input()
+                with torch.no_grad():
+                    torch.onnx.export(
+                        self.model.eval(),
+                        dummy,
+                        onnx_path,
+                        opset_version=17,
+                        do_constant_folding=True,
+                        input_names=["input"],
+                        output_names=["logits"],
+                        dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+                    )
+            self.model = _OrtModel(onnx_path, input_dtype)
+            self._channels_last = False  # ORT takes plain NCHW
+            self.load_info.update({"runtime": "onnxruntime", "onnx_path": onnx_path})
+        except Exception as e_ort:
+            self.load_info["onnx_error"] = str(e_ort)
+
+    def _optimize_jit(self) -> None:
+        """Script (if eager), freeze and optimize_for_inference the model when NUTRINET_ENABLE_JIT=1.
+        Freezing inlines weights as constants so conv+bn(+relu) fold into single kernels.
+        Falls back to the unoptimized model if scripting fails (some timm archs are not scriptable).
+        """
+        if os.getenv("NUTRINET_ENABLE_JIT", "0") != "1" or isinstance(self.model, _OrtModel):
+            return
+        try:
+            if self.device.type == "cpu":
+                # oneDNN Graph fuses conv/bn/relu chains in the frozen graph (kicks in during warmup)
+                torch.jit.enable_onednn_fusion(True)
+            model = self.model.eval()
+            if not isinstance(model, torch.jit.ScriptModule):
+                model = torch.jit.script(model)
+            model = torch.jit.freeze(model)
+            model = torch.jit.optimize_for_inference(model)
+            self.model = model
+            self.is_scripted = True
+            self.load_info["jit"] = "frozen+optimized"
+            # Scripted graphs keep their own precision (see _setup_precision)
+            self._autocast_dtype = None
+            self.load_info.pop("autocast", None)
+        except Exception as e_jit:
+            self.load_info["jit_error"] = str(e_jit)
+
+    def _compile(self) -> bool:
+        """torch.compile the eager model (mode="reduce-overhead") when NUTRINET_USE_COMPILE=1.
+        Compilation is lazy, so two dummy forwards with the serving dtype run here: the first
+        compiles and surfaces failures (e.g. timm ops the compiler does not support), the second
+        records the CUDA graph, and dynamic=False guards then match real images. On failure the
+        eager model is restored and the TorchScript path (NUTRINET_ENABLE_JIT) is tried instead.
+        Returns True if the compiled model is in use.
+        """
+        if os.getenv("NUTRINET_USE_COMPILE", "0") != "1" or not hasattr(torch, "compile"):
+            return False
+        if getattr(self, "is_scripted", False) or isinstance(self.model, _OrtModel):
+            return False
+        eager = self.model
+        try:
+            self.model = torch.compile(eager, mode="reduce-overhead", fullgraph=False, dynamic=False)
+            dummy = self._dummy_input()
+            with torch.inference_mode():
+                for _ in range(2):
+                    self._forward(dummy)
+            self.load_info["compile"] = "reduce-overhead"
+            return True
+        except Exception as e_compile:
+            self.model = eager
+            self.load_info["compile_error"] = str(e_compile)
+            return False
+
+    def _setup_precision(self) -> None:
+        """Run eager FP32 models under FP16 autocast on CUDA, or BF16 autocast on CPUs with
+        native BF16 (AMX/AVX512-BF16). Scripted and INT8 models keep their own precision.
+        NUTRINET_DISABLE_BF16=1 forces FP32.
+        """
+        if os.getenv("NUTRINET_DISABLE_BF16", "0") == "1" or getattr(self, "is_scripted", False):
+            return
+        if isinstance(self.model, _OrtModel):
+            return
+        if self.device.type == "cuda":
+            self._autocast_dtype = torch.float16
+            self.load_info["autocast"] = "fp16"
+        elif _cpu_has_native_bf16():
+            self._autocast_dtype = torch.bfloat16
+            self.load_info["autocast"] = "bf16"
+
+    def _forward(self, batch: torch.Tensor) -> torch.Tensor:
+        # Loaded/scripted modules do not always come back in eval mode (dropout/BN would misbehave)
+        if getattr(self, "is_scripted", False) and getattr(self.model, "training", False):
+            self.model.eval()
+        if self.device.type != "cpu":
+            batch = batch.to(self.device, non_blocking=True)
+        if self._channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        amp = (
+            nullcontext()
+            if self._autocast_dtype is None
+            else torch.autocast(self.device.type, dtype=self._autocast_dtype)
+        )
+        with torch.jit.optimized_execution(self._jit_opt), amp:
+            outputs = self.model(batch)
+        # Callers (softmax/logsumexp/std) always see fp32 logits
+        return outputs if self._autocast_dtype is None else outputs.float()
+
+    def _dummy_input(self) -> torch.Tensor:
+        """Zero batch of one with the shape and dtype served at inference: uint8 when
+        normalization runs in-graph (torchvision transform), float32 from timm transforms."""
+        dtype = torch.uint8 if self._normalize is not None else torch.float32
+        return torch.zeros(1, *self.input_size, dtype=dtype)
+
+    def _warmup(self) -> None:
+        """Run two dummy forwards so TorchScript profiling/optimization happens at startup,
+        not on the first user request. Same shape and dtype as real inputs, so nothing
+        re-specializes later.
+        """
+        try:
+            dummy = self._dummy_input()
+            with torch.inference_mode():
+                for _ in range(2):
+                    self._forward(dummy)
+        except Exception as e_warm:
+            self.load_info["warmup_error"] = str(e_warm)
+
     def diagnostics(self) -> Dict:
         info = {
             "is_scripted": getattr(self, "is_scripted", False),
@@ -308,53 +790,137 @@ class NutriNetVision:
         info.update(self.load_info or {})
         return info
 
+    def _prepare(self, image: Image.Image) -> Tuple[torch.Tensor, Optional[bytes]]:
+        """Transformed model input for one image and its cache key (None when caching is off).
+        The key is a BLAKE2b digest of the transformed tensor (224x224 uint8 on the default path),
+        which fully determines the logits and is ~150 KB to hash. Hashing the decoded photo instead
+        cost ~100 ms per call on a 12 MP upload, paid on every miss."""
+        img_tensor = self.transform(image)
+        if self._logits_cache is None:
+            return img_tensor, None
+        data = img_tensor.detach().cpu().contiguous()
+        h = hashlib.blake2b(data.numpy(), digest_size=16)
+        h.update(f"{data.dtype}{tuple(data.shape)}".encode())
+        return img_tensor, h.digest()
+
+    def _cache_get(self, cache, key):
+        if cache is None or key is None:
+            return None
+        with self._cache_lock:
+            return cache.get(key)
+
+    def _cache_put(self, cache, key, value) -> None:
+        if cache is None or key is None:
+            return
+        with self._cache_lock:
+            cache[key] = value
+
     def classify_food(self, food_image: Image.Image) -> Tuple[str, float]:
         """Classify food using the Food-101 model"""
+        self._ensure_model()
+        return self._classify(food_image)
+
+    def _logits(self, img_tensor: torch.Tensor, key: Optional[bytes] = None) -> torch.Tensor:
+        """Forward for one _prepare()d image -> (1, num_classes) fp32 logits on CPU.
+        classify_food, classify_topk, output_variability and analyze_image all post-process this,
+        and it is cached by content hash, so top-1 then top-k of the same image is one forward.
+        """
+        cached = self._cache_get(self._logits_cache, key)
+        if cached is not None:
+            return cached
+        with torch.inference_mode():
+            outputs = self._forward(img_tensor.unsqueeze(0))
+            # Validate output shape
+            if outputs.ndim == 1:
+                outputs = outputs.unsqueeze(0)
+            if outputs.shape[1] != len(self.class_names):
+                # Attempt to adapt if off-by-one; else warn
+                print(f"Model output classes {outputs.shape[1]} != class_names {len(self.class_names)}")
+            logits = outputs.float().cpu()
+        self._cache_put(self._logits_cache, key, logits)
+        return logits
+
+    def _classify(self, food_image: Image.Image) -> Tuple[str, float]:
         try:
-            img_tensor = self.transform(food_image).unsqueeze(0)
-            with torch.no_grad():
-                outputs = self.model(img_tensor)
-                # Validate output shape
-                if outputs.ndim == 1:
-                    outputs = outputs.unsqueeze(0)
-                if outputs.shape[1] != len(self.class_names):
-                    # Attempt to adapt if off-by-one; else warn
-                    print(f"Model output classes {outputs.shape[1]} != class_names {len(self.class_names)}")
-                probs = torch.softmax(outputs, dim=1)
-                conf, idx = torch.max(probs, 1)
-                pred_idx = idx.item()
-                if 0 <= pred_idx < len(self.class_names):
-                    food_name = self.class_names[pred_idx]
-                else:
-                    food_name = f"class_{pred_idx}"
-                return food_name, float(conf.item())
+            pred_idx, conf = self._top1(self._logits(*self._prepare(food_image)))
+            return self._label(pred_idx), conf
         except Exception as e:
             print(f"Error in food classification: {str(e)}")
             return "unknown_food", 0.0
 
+    def _top1(self, outputs: torch.Tensor) -> Tuple[int, float]:
+        """Argmax of the first row and its softmax probability, without materializing the full
+        softmax: exp(logit - logsumexp(logits)) is the same value, numerically stable."""
+        logits = outputs[0].float()
+        pred_idx = int(logits.argmax().item())
+        conf = float(torch.exp(logits[pred_idx] - torch.logsumexp(logits, dim=0)).item())
+        return pred_idx, conf
+
+    def _label(self, idx: int) -> str:
+        return self.class_names[idx] if 0 <= idx < len(self.class_names) else f"class_{idx}"
+
+    def classify_batch(self, images: List[Image.Image]) -> List[Tuple[str, float]]:
+        """Classify several images with one stacked forward pass (same output as classify_food per image)."""
+        if not images:
+            return []
+        self._ensure_model()
+        try:
+            batch = torch.stack([self.transform(im) for im in images], dim=0)
+            with torch.inference_mode():
+                logits = self._forward(batch).float()
+                idx = logits.argmax(dim=1)
+                # softmax probability of the argmax only: exp(logit - logsumexp(logits))
+                conf = torch.exp(logits.gather(1, idx.unsqueeze(1)).squeeze(1) - torch.logsumexp(logits, dim=1))
+            return [(self._label(i), float(c)) for i, c in zip(idx.tolist(), conf.tolist())]
+        except Exception as e:
+            print(f"Error in batch classification: {str(e)}")
+            return [("unknown_food", 0.0)] * len(images)
+
+    def classify_food_batched(self, food_image: Image.Image) -> Tuple[str, float]:
+        """classify_food through a shared queue, so concurrent callers (e.g. several
+        Streamlit sessions) are coalesced into one batched forward."""
+        self._ensure_model()  # load here, never inside the worker thread
+        with self._batch_lock:
+            if self._batch_queue is None:
+                self._batch_queue = queue.Queue()
+                threading.Thread(target=self._batch_worker, name="food-batcher", daemon=True).start()
+        fut: Future = Future()
+        self._batch_queue.put((food_image, fut))
+        return fut.result()
+
+    def _batch_worker(self) -> None:
+        while True:
+            pending = [self._batch_queue.get()]
+            deadline = time.monotonic() + MICROBATCH_WINDOW_S
+            while len(pending) < MICROBATCH_MAX:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending.append(self._batch_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            results = self.classify_batch([image for image, _ in pending])
+            for (_, fut), result in zip(pending, results):
+                fut.set_result(result)
+
     def classify_topk(self, food_image: Image.Image, k: int = 5) -> List[Tuple[int, str, float]]:
         """Return top-k predictions as (index, class_name, probability)."""
+        self._ensure_model()
         try:
-            img_tensor = self.transform(food_image).unsqueeze(0)
-            with torch.no_grad():
-                outputs = self.model(img_tensor)
-                probs = torch.softmax(outputs, dim=1)[0]
-                k = max(1, min(int(k), probs.shape[0]))
-                top_p, top_i = torch.topk(probs, k)
-                result: List[Tuple[int, str, float]] = []
-                for idx, p in zip(top_i.tolist(), top_p.tolist()):
-                    name = self.class_names[idx] if 0 <= idx < len(self.class_names) else f"class_{idx}"
-                    result.append((idx, name, float(p)))
-                return result
+            return self._topk(self._logits(*self._prepare(food_image)), k)
         except Exception as e:
             print(f"Error in top-k classification: {str(e)}")
             return []
 
+    def _topk(self, logits: torch.Tensor, k: int) -> List[Tuple[int, str, float]]:
+        probs = torch.softmax(logits, dim=1)[0]
+        k = max(1, min(int(k), probs.shape[0]))
+        top_p, top_i = torch.topk(probs, k)
+        return [(idx, self._label(idx), float(p)) for idx, p in zip(top_i.tolist(), top_p.tolist())]
+
     def get_class_index(self, class_name: str) -> Optional[int]:
-        try:
-            return self.class_names.index(class_name)
-        except ValueError:
-            return None
+        return self._name_to_idx.get(class_name)
 
     def estimate_portion(self, image: Image.Image) -> float:
         """Simple portion heuristic without detection: assume medium portion (grams)."""
@@ -367,65 +933,67 @@ class NutriNetVision:
     def get_nutrition_info(self, food_name: str, portion_g: float) -> Dict:
         """Get nutrition information for detected food (scaled by portion)."""
         try:
-            # Basic nutrition estimates (extend/replace with your DB as needed)
-            nutrition_data = {
-                "pizza": {"calories": 266, "protein_g": 11, "carbs_g": 33, "fat_g": 10, "fiber_g": 2},
-                "sushi": {"calories": 150, "protein_g": 25, "carbs_g": 15, "fat_g": 2, "fiber_g": 1},
-                "burger": {"calories": 295, "protein_g": 17, "carbs_g": 30, "fat_g": 12, "fiber_g": 2},
-                "pasta": {"calories": 131, "protein_g": 5, "carbs_g": 25, "fat_g": 1, "fiber_g": 2},
-                "salad": {"calories": 20, "protein_g": 2, "carbs_g": 4, "fat_g": 0, "fiber_g": 2},
-                "steak": {"calories": 271, "protein_g": 26, "carbs_g": 0, "fat_g": 18, "fiber_g": 0},
-                "rice": {"calories": 130, "protein_g": 3, "carbs_g": 28, "fat_g": 0, "fiber_g": 0},
-                # ...extend as needed
-            }
-            base = nutrition_data.get(food_name)
-            if base is None:
-                # Generic fallback per 100g
-                base = {"calories": 160, "protein_g": 7, "carbs_g": 20, "fat_g": 5, "fiber_g": 2}
-            scale = portion_g / 100.0
-            return {k: round(v * scale, 1) for k, v in base.items()}
+            idx = _NUTRITION_IDX.get(food_name)
+            base = _GENERIC_NUTRITION if idx is None else _NUTRITION_MATRIX[idx]
+            # builtin round() on the scaled row keeps the exact rounding of the scalar version
+            return dict(zip(NUTRITION_COLS, (round(v, 1) for v in (base * (portion_g / 100.0)).tolist())))
         except Exception as e:
             print(f"Error getting nutrition info: {str(e)}")
             return {"error": "Nutrition data unavailable"}
 
+    # (nutrient, threshold, tip): a tip applies when the scaled nutrient exceeds its threshold
+    _RULES = (
+        ("calories", 300, "High calorie - consider portion control"),
+        ("protein_g", 20, "Good protein source"),
+        ("carbs_g", 50, "High in carbs - good for energy"),
+        ("fat_g", 15, "Moderate fat - balance with other meals"),
+    )
+
     def get_health_recommendations(self, food_name: str, nutrition: Dict) -> str:
         """Basic health recommendations"""
         try:
-            calories = nutrition.get("calories", 0)
-            protein = nutrition.get("protein_g", 0)
-            carbs = nutrition.get("carbs_g", 0)
-            fat = nutrition.get("fat_g", 0)
-            tips = []
-            if calories > 300:
-                tips.append("High calorie - consider portion control")
-            if protein > 20:
-                tips.append("Good protein source")
-            if carbs > 50:
-                tips.append("High in carbs - good for energy")
-            if fat > 15:
-                tips.append("Moderate fat - balance with other meals")
-            if not tips:
-                tips.append("Balanced choice")
-            return " | ".join(tips)
+            tips = [tip for key, threshold, tip in self._RULES if nutrition.get(key, 0) > threshold]
+            return " | ".join(tips or ["Balanced choice"])
         except Exception:
             return "Health recommendations unavailable"
 
     def analyze_image(self, image: Image.Image) -> List[Dict]:
         """Analyze a single food image using Food-101 classifier only."""
+        self._ensure_model()
         try:
-            food_name, confidence = self.classify_food(image)
-            portion = self.estimate_portion(image)
-            nutrition = self.get_nutrition_info(food_name, portion)
-            advice = self.get_health_recommendations(food_name, nutrition)
-            return [
-                {
+            try:
+                img_tensor, key = self._prepare(image)
+            except Exception as e:
+                print(f"Error in food classification: {str(e)}")
+                img_tensor, key = None, None
+            cached = self._cache_get(self._analyze_cache, key)
+            if cached is None:
+                food_name, confidence, alternatives = "unknown_food", 0.0, []
+                if img_tensor is not None:
+                    # One forward for both the prediction and its runner-up alternatives
+                    try:
+                        logits = self._logits(img_tensor, key)
+                        pred_idx, confidence = self._top1(logits)
+                        food_name = self._label(pred_idx)
+                        alternatives = [(name, p) for _, name, p in self._topk(logits, 5)]
+                    except Exception as e:
+                        print(f"Error in food classification: {str(e)}")
+                        food_name, confidence, alternatives = "unknown_food", 0.0, []
+                portion = self.estimate_portion(image)
+                nutrition = self.get_nutrition_info(food_name, portion)
+                advice = self.get_health_recommendations(food_name, nutrition)
+                cached = {
                     "name": food_name,
                     "confidence": confidence,
                     "portion": portion,
                     "nutrition": nutrition,
                     "health_advice": advice,
+                    "alternatives": alternatives,
                 }
-            ]
+                if confidence > 0.0:  # don't pin a failed classification
+                    self._cache_put(self._analyze_cache, key, cached)
+            # Callers may mutate the result; hand out copies of the cached entry
+            return [{**cached, "nutrition": dict(cached["nutrition"]), "alternatives": list(cached["alternatives"])}]
         except Exception as e:
             print(f"Error in image analysis: {str(e)}")
             return []
@@ -434,14 +1002,10 @@ class NutriNetVision:
         """Return the standard deviation of logits as a quick variability sanity check.
         Very low values across different images may indicate a broken or constant model.
         """
+        self._ensure_model()
         try:
-            img_tensor = self.transform(food_image).unsqueeze(0)
-            with torch.no_grad():
-                outputs = self.model(img_tensor)
-                if outputs.ndim == 1:
-                    outputs = outputs.unsqueeze(0)
-                logits = outputs[0].float().cpu()
-                return float(torch.std(logits).item())
+            logits = self._logits(*self._prepare(food_image))[0]
+            return float(torch.std(logits).item())
         except Exception:
             return 0.0
 
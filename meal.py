@@ -1,10 +1,14 @@
 from mistralai import Mistral
+import asyncio
+import copy
+import hashlib
 import os
+import threading
 from dotenv import load_dotenv
 import json
 import re
 from typing import Dict, Any, Optional, List
-from utils import calculate_bmr, calculate_tdee
+import numpy as np
 import sys
 
 # Allow importing provider-agnostic LLM getter from rag/src
@@ -16,6 +20,35 @@ try:
 except Exception:
     get_llm = None  # type: ignore
 
+# Optional: orjson (C JSON) for reply parsing and plan serialization
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+
+    def _json_dumps(obj: Any) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except Exception:
+    _json_loads = json.loads
+
+    def _json_dumps(obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+# Optional plan caches: in-process LRU and a cross-process disk cache
+try:
+    from cachetools import LRUCache
+except Exception:
+    LRUCache = None
+try:
+    import diskcache
+except Exception:
+    diskcache = None
+# Optional: Numba compiles the deterministic fallback macros to native code
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
 load_dotenv()
 # Initialize Mistral client only if a key is available; otherwise use fallback
 _MISTRAL_KEY = (
@@ -25,17 +58,57 @@ _MISTRAL_KEY = (
 )
 client = Mistral(api_key=_MISTRAL_KEY) if _MISTRAL_KEY else None
 
+# Max LLM requests in flight in get_plans_json_batch / batch_score_csv
+MEAL_BATCH_CONCURRENCY = int(os.getenv("MEAL_BATCH_CONCURRENCY", "16"))
+
+# Model-generated plans are cached per normalized profile (see _plan_cache_key); MEAL_PLAN_CACHE=0 disables
+PLAN_CACHE_ENABLED = os.getenv("MEAL_PLAN_CACHE", "1") != "0"
+PLAN_CACHE_DIR = os.path.join(os.path.dirname(__file__), ".meal_cache")
+PLAN_CACHE_TTL_S = 7 * 24 * 3600
+_plan_cache_lock = threading.Lock()
+_plan_memo = LRUCache(maxsize=1024) if (LRUCache and PLAN_CACHE_ENABLED) else None
+_plan_disk = None
+
 # SCHEMA = '{"calories": int, "protein_g": int, "carbs_g": int, "fats_g": int, "meals": {"breakfast": str, "lunch": str, "snack": str, "dinner": str}, "notes": str}'
 
 SCHEMA = '{"calories": int, "protein_g": int, "carbs_g": int, "fats_g": int, "meals": {"breakfast": str, "lunch": str, "snack": str, "dinner": str}}'
 
-INSTRUCTION = (
+_TASK = (
     "You are a nutrition assistant. Given the user's profile, recommend a daily macro breakdown and food suggestions. "
     "Respect allergies, current goals, and dietary preferences (e.g., halal). Keep outputs consistent and realistic. "
-    f"Return ONLY minified JSON (no markdown, no commentary) with this schema: {SCHEMA}. "
-    "All numbers should be whole integers. Ensure calories ≈ 4*protein_g + 4*carbs_g + 9*fats_g (±10%)."
+)
+_NUMBERS = "All numbers should be whole integers. Ensure calories ≈ 4*protein_g + 4*carbs_g + 9*fats_g (±10%)."
+_CONSTRAINTS = " Ensure halal compliance when requested and strictly avoid listed allergens. If fat loss is the goal, set calories below maintenance."
+
+INSTRUCTION = (
+    _TASK
+    + f"Return ONLY minified JSON (no markdown, no commentary) with this schema: {SCHEMA}. "
+    + _NUMBERS
+)
+
+# Several profiles in one request (see get_plans_json_batch). The profile count goes in the
+# user message, so this text stays a fixed, cacheable prefix.
+BATCH_INSTRUCTION = (
+    _TASK.replace("the user's profile", "each user's profile")
+    + "The input starts with the number of profiles N, then each profile introduced by a ---USER i--- line. "
+    + f"Return ONLY a minified JSON array (no markdown, no commentary) of exactly N objects, one per user in input order, each with this schema: {SCHEMA}. "
+    + _NUMBERS
+)
+
+# Static worked example appended to the system prompt: helps format adherence and lengthens the
+# fixed prefix that provider-side prompt caching can reuse across requests
+PLAN_EXAMPLE = (
+    "Example profile:\n"
+    "Age: 30\nGender: Female\nHeight_cm: 165\nWeight_kg: 60\nBMI: 22.0\nAllergies: Peanuts\n"
+    "Current_Goals: Fat loss\nDietary_Preferences: Vegetarian\n"
+    "Example plan object for it:\n"
+    '{"calories":1700,"protein_g":100,"carbs_g":190,"fats_g":60,"meals":{"breakfast":"Greek yogurt with oats and berries",'
+    '"lunch":"Chickpea and quinoa salad with feta","snack":"Apple with pumpkin seeds","dinner":"Tofu stir-fry with brown rice and vegetables"}}'
 )
 
+# Completion budget per plan when several plans share one response
+PLAN_MAX_TOKENS = 250
+
 PROMPT_TMPL = """Below is an instruction that describes a task, paired with an input that provides further context. Write a response that appropriately completes the request.
 
 ### Instruction:
@@ -47,16 +120,37 @@ PROMPT_TMPL = """Below is an instruction that describes a task, paired with an i
 ### Response:
 """
 
+# PROMPT_TMPL with the (constant) instruction already filled in; only the profile varies per call
+_PROMPT_HEAD, _PROMPT_MID, _PROMPT_SUFFIX = PROMPT_TMPL.split("{}")
+_PROMPT_PREFIX = _PROMPT_HEAD + INSTRUCTION + _CONSTRAINTS + _PROMPT_MID
+
 def _to_int(value: Any, default: Optional[int] = None) -> Optional[int]:
+    # Exact int/float first; strings and other types take the generic path
+    if value is None:
+        return default
+    t = type(value)
+    if t is int:
+        return value
+    if t is float:
+        # value - value is 0.0 only for finite floats (NaN/inf give NaN)
+        return int(round(value)) if value - value == 0.0 else default
     try:
-        if value is None or value == "":
+        if value == "":
             return default
         return int(round(float(value)))
     except Exception:
         return default
 
+class _ValidatedFields(dict):
+    """A profile already passed through validate_and_defaults (or _validate_frame)."""
+
+# Clamp ranges for the integer profile fields
+_INT_RANGES = {"Age": (10, 100), "Height_cm": (120, 220), "Weight_kg": (35, 250)}
+
 def validate_and_defaults(fields: Dict[str, Any]) -> Dict[str, Any]:
     """Coerce types, clamp ranges, and provide sensible defaults."""
+    if isinstance(fields, _ValidatedFields):
+        return dict(fields)
     f = dict(fields or {})
     f.setdefault("Allergies", "None")
     f.setdefault("Dietary_Preferences", "")
@@ -74,15 +168,48 @@ def validate_and_defaults(fields: Dict[str, Any]) -> Dict[str, Any]:
         f["BMI"] = ""
 
     # Clamp simple ranges
-    if f.get("Age") is not None:
-        f["Age"] = max(10, min(100, f["Age"]))
-    if f.get("Height_cm") is not None:
-        f["Height_cm"] = max(120, min(220, f["Height_cm"]))
-    if f.get("Weight_kg") is not None:
-        f["Weight_kg"] = max(35, min(250, f["Weight_kg"]))
+    for k, (lo, hi) in _INT_RANGES.items():
+        if f.get(k) is not None:
+            f[k] = max(lo, min(hi, f[k]))
 
     return f
 
+def _validate_frame(df):
+    """validate_and_defaults for every row of a DataFrame, as column-wise vectorized ops."""
+    import pandas as pd
+
+    out = df.copy()
+    for col, default in (("Allergies", "None"), ("Dietary_Preferences", ""), ("Current_Goals", "General health")):
+        if col not in out.columns:
+            out[col] = default
+    for col, (lo, hi) in _INT_RANGES.items():
+        if col not in out.columns:
+            out[col] = None
+            continue
+        num = pd.to_numeric(out[col], errors="coerce").to_numpy(dtype=np.float64)
+        ok = np.isfinite(num)
+        # Bounds are integers, so clamping before rounding gives the same result as after
+        vals = np.rint(np.clip(num, lo, hi))
+        out[col] = pd.Series([int(v) if good else None for v, good in zip(vals.tolist(), ok.tolist())],
+                             index=out.index, dtype=object)
+    if "BMI" not in out.columns:
+        out["BMI"] = ""
+    else:
+        raw = out["BMI"]
+        num = pd.to_numeric(raw, errors="coerce")
+        # Unparseable text becomes "", while empty/NaN cells stay NaN (as float(nan) does per row)
+        bad = (num.isna() & raw.notna() & (raw != "")).tolist()
+        empty = (raw == "").tolist()
+        out["BMI"] = pd.Series(
+            ["" if b or e else round(v, 1) for v, b, e in zip(num.tolist(), bad, empty)],
+            index=out.index, dtype=object,
+        )
+    return out
+
+def _validated_records(vdf) -> List[Dict[str, Any]]:
+    """Row dicts of a _validate_frame result, marked so validate_and_defaults does not redo the work."""
+    return [_ValidatedFields(row) for row in vdf.to_dict(orient="records")]
+
 def serialize_input(fields: dict) -> str:
     # fields keys: Age, Gender, Height_cm, Weight_kg, BMI, Allergies, Daily_Steps, Sleep_Hours,
     # Current_Goals, Dietary_Preferences, Exercise_Frequency, Preferred_Cuisine, Food_Aversions,
@@ -110,111 +237,475 @@ def serialize_input(fields: dict) -> str:
     ]
     return "\n".join(parts)
 
-def _extract_json(text: str) -> Optional[Dict[str, Any]]:
-    # Try direct parse
+# Greedy first-open..last-close spans; only used when the balanced scan finds nothing parseable
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+_JSON_ARRAY_RE = re.compile(r"\[.*\]", re.DOTALL)
+
+def _balanced_span(text: str, open_ch: str, close_ch: str) -> Optional[str]:
+    """First balanced open_ch..close_ch span of text, ignoring brackets inside JSON strings.
+    A single linear scan, so malformed replies cannot trigger regex backtracking.
+    """
+    start = text.find(open_ch)
+    if start == -1:
+        return None
+    depth = 0
+    in_str = False
+    escaped = False
+    for i in range(start, len(text)):
+        c = text[i]
+        if in_str:
+            if escaped:
+                escaped = False
+            elif c == "\\":
+                escaped = True
+            elif c == '"':
+                in_str = False
+        elif c == '"':
+            in_str = True
+        elif c == open_ch:
+            depth += 1
+        elif c == close_ch:
+            depth -= 1
+            if depth == 0:
+                return text[start : i + 1]
+    return None
+
+def _parse_embedded_json(text: str, open_ch: str, close_ch: str, fallback_re: "re.Pattern") -> Any:
+    """Direct parse, then the first balanced span, then the greedy regex span; None if all fail."""
     try:
-        return json.loads(text)
+        return _json_loads(text)
     except Exception:
         pass
-    # Try to find the first {...} block
-    m = re.search(r"\{[\s\S]*\}", text)
-    if m:
+    span = _balanced_span(text, open_ch, close_ch)
+    if span is not None:
+        try:
+            return _json_loads(span)
+        except Exception:
+            pass
+    m = fallback_re.search(text)
+    if m and m.group(0) != span:
         try:
-            return json.loads(m.group(0))
+            return _json_loads(m.group(0))
         except Exception:
             return None
     return None
 
+def _extract_json(text: str) -> Optional[Dict[str, Any]]:
+    return _parse_embedded_json(text, "{", "}", _JSON_OBJECT_RE)
+
+class _JsonObjectStream:
+    """Incremental _balanced_span for streamed replies: feed() text chunks as they arrive and
+    it returns the first complete top-level {...} that parses as a JSON object (None until then).
+    Scanning resumes where the previous chunk stopped, so the reply is walked once overall.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_str = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._depth == 0:
+                if c == "{":
+                    self._start, self._depth = i, 1
+            elif self._in_str:
+                if self._escaped:
+                    self._escaped = False
+                elif c == "\\":
+                    self._escaped = True
+                elif c == '"':
+                    self._in_str = False
+            elif c == '"':
+                self._in_str = True
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        obj = _json_loads(text[self._start : i + 1])
+                    except Exception:
+                        obj = None
+                    if isinstance(obj, dict):
+                        self._pos = i + 1
+                        return obj
+        self._pos = len(text)
+        return None
+
+def _chunk_text(chunk: Any) -> str:
+    content = getattr(chunk, "content", chunk)
+    if isinstance(content, str):
+        return content
+    # Content-block lists (e.g. Anthropic models): keep the text blocks
+    return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content or [])
+
+def _stream_plan(llm: Any, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Stream the reply and stop generation as soon as the plan object closes: whatever the model
+    would write after it is discarded by the parser anyway. Falls back to parsing the full text."""
+    parser = _JsonObjectStream()
+    stream = llm.stream(messages)
+    try:
+        for chunk in stream:
+            plan = parser.feed(_chunk_text(chunk))
+            if plan is not None:
+                return plan
+    finally:
+        # Closing the generator closes the HTTP response, cancelling the rest of the generation
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+    return _plan_from_content(parser.text)
+
+def _plan_prompt(fields: dict) -> str:
+    user_input = serialize_input(fields)
+    return _PROMPT_PREFIX + user_input + _PROMPT_SUFFIX
+
+def _chat_messages(instruction: str, user_input: str, model_name: str) -> List[Dict[str, Any]]:
+    """System/user message pair for the provider-agnostic LLM. The system prompt is identical on
+    every call, so providers with prefix caching reuse it; Anthropic models behind OpenRouter only
+    cache when the block is marked, hence the cache_control hint for them.
+    """
+    system_block: Dict[str, Any] = {"type": "text", "text": instruction + _CONSTRAINTS + "\n\n" + PLAN_EXAMPLE}
+    if (model_name or "").startswith("anthropic/"):
+        system_block["cache_control"] = {"type": "ephemeral"}
+    return [
+        {"role": "system", "content": [system_block]},
+        {"role": "user", "content": user_input},
+    ]
+
+def _plan_messages(fields: dict, model_name: str) -> List[Dict[str, Any]]:
+    return _chat_messages(INSTRUCTION, serialize_input(fields), model_name)
+
+def _batch_messages(fields_list: List[dict], model_name: str) -> List[Dict[str, Any]]:
+    profiles = "".join(f"\n---USER {i}---\n{serialize_input(f)}" for i, f in enumerate(fields_list, 1))
+    return _chat_messages(BATCH_INSTRUCTION, f"N = {len(fields_list)}{profiles}", model_name)
+
+def _plans_from_batch_content(content: str, n: int) -> Optional[List[Dict[str, Any]]]:
+    """Parse a JSON array of exactly n plan objects; None if the reply doesn't match."""
+    parsed = _parse_embedded_json(content, "[", "]", _JSON_ARRAY_RE)
+    if isinstance(parsed, list) and len(parsed) == n and all(isinstance(p, dict) for p in parsed):
+        return parsed
+    return None
+
+def _llm_configured() -> bool:
+    provider_configured = bool(os.getenv("LLM_PROVIDER") or os.getenv("PLAN_LLM_MODEL") or os.getenv("LLM_MODEL"))
+    api_available = bool(os.getenv("OPENROUTER_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+    return get_llm is not None and (provider_configured or api_available)
+
+def _plan_from_content(content: str) -> Dict[str, Any]:
+    parsed = _extract_json(content)
+    return parsed if parsed is not None else {"raw": content}
+
+def _plan_cache_key(fields: dict, model: str, backend: Optional[str] = None) -> Optional[str]:
+    """Cache key for a model-generated plan: the normalized profile (weight/height rounded to
+    the nearest 2) plus the backend/model that answered. `backend` is "llm" or "mistral";
+    by default the one tried first. None when only the deterministic fallback is available
+    (it is cheap and must not shadow a model configured later).
+    """
+    if not PLAN_CACHE_ENABLED:
+        return None
+    if backend is None:
+        backend = "llm" if _llm_configured() else "mistral"
+    if backend == "llm":
+        backend = "llm:" + (os.getenv("PLAN_LLM_MODEL") or os.getenv("LLM_MODEL") or model)
+    elif client is not None:
+        backend = "mistral:" + model
+    else:
+        return None
+    f = validate_and_defaults(fields or {})
+    for k in ("Weight_kg", "Height_cm"):
+        if f.get(k) is not None:
+            f[k] = 2 * round(f[k] / 2)
+    blob = json.dumps([backend, f], sort_keys=True, default=str)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=16).hexdigest()
+
+def _plan_disk_cache():
+    global _plan_disk
+    if _plan_disk is None and diskcache is not None and PLAN_CACHE_ENABLED:
+        with _plan_cache_lock:
+            if _plan_disk is None:
+                try:
+                    _plan_disk = diskcache.Cache(PLAN_CACHE_DIR)
+                except Exception:
+                    return None
+    return _plan_disk
+
+def _plan_cache_get(key: Optional[str]) -> Optional[Dict[str, Any]]:
+    if key is None:
+        return None
+    plan = None
+    if _plan_memo is not None:
+        with _plan_cache_lock:
+            plan = _plan_memo.get(key)
+    if plan is None:
+        disk = _plan_disk_cache()
+        if disk is not None:
+            try:
+                plan = disk.get(key)
+            except Exception:
+                plan = None
+            if plan is not None and _plan_memo is not None:
+                with _plan_cache_lock:
+                    _plan_memo[key] = plan
+    # Callers may edit the plan (e.g. the plan page); never hand out the cached object
+    return copy.deepcopy(plan) if plan is not None else None
+
+def _plan_cache_put(key: Optional[str], plan: Dict[str, Any]) -> Dict[str, Any]:
+    """Store a parsed plan (unparseable {"raw": ...} replies are not cached) and return it."""
+    if key is None or not isinstance(plan, dict) or "raw" in plan:
+        return plan
+    stored = copy.deepcopy(plan)
+    if _plan_memo is not None:
+        with _plan_cache_lock:
+            _plan_memo[key] = stored
+    disk = _plan_disk_cache()
+    if disk is not None:
+        try:
+            disk.set(key, stored, expire=PLAN_CACHE_TTL_S)
+        except Exception:
+            pass
+    return plan
+
 def get_plan_json(fields: dict, model: str = "ft:ministral-3b-latest:df8cc3b5:20250821:100048bc") -> Dict[str, Any]:
     """Return a daily plan JSON.
     Order of preference:
+      0) Plan cache hit for an equivalent profile and the same backend/model
       1) Provider-agnostic LLM (OpenRouter/Gemini) if configured or PLAN_LLM_MODEL set
       2) Mistral SDK (if key present)
       3) Deterministic fallback
     """
+    key = _plan_cache_key(fields, model)
+    cached = _plan_cache_get(key)
+    if cached is not None:
+        return cached
     # 1) Provider-agnostic LLM first when configured
     try:
-        provider_configured = bool(os.getenv("LLM_PROVIDER") or os.getenv("PLAN_LLM_MODEL") or os.getenv("LLM_MODEL"))
-        api_available = bool(os.getenv("OPENROUTER_API_KEY") or os.getenv("GOOGLE_API_KEY"))
-        if get_llm is not None and (provider_configured or api_available):
-            user_input = serialize_input(fields)
-            constrained_instruction = INSTRUCTION + " Ensure halal compliance when requested and strictly avoid listed allergens. If fat loss is the goal, set calories below maintenance."
-            prompt = PROMPT_TMPL.format(constrained_instruction, user_input, "")
+        if _llm_configured():
             chosen_model = os.getenv("PLAN_LLM_MODEL") or os.getenv("LLM_MODEL") or model
             llm = get_llm(model_name=chosen_model)
-            llm_resp = llm.invoke(prompt)
-            content = getattr(llm_resp, "content", None) or str(llm_resp)
-            parsed = _extract_json(content)
-            if parsed is not None:
-                return parsed
-            return {"raw": content}
+            return _plan_cache_put(key, _stream_plan(llm, _plan_messages(fields, chosen_model)))
     except Exception:
         pass
-
-    # 2) Mistral SDK as secondary option
+    # 2) Mistral SDK as secondary option, cached under its own key: a transient LLM failure
+    # must not pin the Mistral answer to the LLM's entry
     if client is not None:
-        user_input = serialize_input(fields)
-        constrained_instruction = INSTRUCTION + " Ensure halal compliance when requested and strictly avoid listed allergens. If fat loss is the goal, set calories below maintenance."
-        prompt = PROMPT_TMPL.format(constrained_instruction, user_input, "")
-        resp = client.chat.complete(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        content = resp.choices[0].message.content
-        parsed = _extract_json(content)
-        return parsed if parsed is not None else {"raw": content}
+        return _mistral_plan_cached(fields, model)
+    return _fallback_plan(fields)
 
-    # Fallback: compute macros deterministically from profile
-    f = validate_and_defaults(fields or {})
-    weight = f.get("Weight_kg") or 70
-    height = f.get("Height_cm") or 170
-    age = f.get("Age") or 25
-    gender = (f.get("Gender") or "male").lower()
-    goal = (f.get("Current_Goals") or "Maintenance").lower()
+def _mistral_plan_cached(fields: dict, model: str) -> Dict[str, Any]:
+    key = _plan_cache_key(fields, model, "mistral")
+    cached = _plan_cache_get(key)
+    if cached is not None:
+        return cached
+    return _plan_cache_put(key, _mistral_plan(fields, model))
 
-    bmr = calculate_bmr(weight, height, age, gender)
-    # Map activity label loosely
-    activity = (f.get("Exercise_Frequency") or "moderately_active").replace(" ", "_").lower()
-    tdee = calculate_tdee(bmr, activity)
-    if "loss" in goal:
-        calories = int(max(1200, tdee - 400))
-    elif "gain" in goal:
+def _plan_without_llm(fields: dict, model: str) -> Dict[str, Any]:
+    """Steps 2) and 3) of get_plan_json: Mistral SDK if a key is present (cached under the
+    Mistral key), else deterministic macros."""
+    return _mistral_plan_cached(fields, model) if client is not None else _fallback_plan(fields)
+
+def _mistral_plan(fields: dict, model: str) -> Dict[str, Any]:
+    resp = client.chat.complete(
+        model=model,
+        messages=[{"role": "user", "content": _plan_prompt(fields)}],
+    )
+    return _plan_from_content(resp.choices[0].message.content)
+
+_FALLBACK_MEALS = {
+    "breakfast": "Oats + yogurt + fruit",
+    "lunch": "Lean protein + rice + vegetables",
+    "snack": "Nuts or yogurt",
+    "dinner": "Chicken/tofu + salad + sweet potato",
+}
+
+# Activity multipliers from utils.calculate_tdee, indexed by _ACTIVITY_CODES
+# (unknown labels get moderately_active's 1.55, as there)
+_ACTIVITY_MULTIPLIERS = np.array([1.2, 1.375, 1.55, 1.725, 1.9])
+_ACTIVITY_CODES = {"sedentary": 0, "lightly_active": 1, "moderately_active": 2, "very_active": 3, "extremely_active": 4}
+_GOAL_MAINTAIN, _GOAL_LOSS, _GOAL_GAIN = 0, 1, 2
+
+def _fallback_macros(weight, height, age, gender_code, activity_code, goal_code):
+    """(calories, protein_g, fats_g, carbs_g) for the deterministic plan; int-coded inputs so
+    the body compiles under Numba. gender_code 0 is male (Mifflin-St Jeor, as utils.calculate_bmr).
+    np.rint rounds half to even like the builtin round() it replaces.
+    """
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + (5.0 if gender_code == 0 else -161.0)
+    tdee = bmr * _ACTIVITY_MULTIPLIERS[activity_code]
+    if goal_code == _GOAL_LOSS:
+        calories = int(max(1200.0, tdee - 400))
+    elif goal_code == _GOAL_GAIN:
         calories = int(tdee + 250)
     else:
         calories = int(tdee)
 
     # Protein 1.6 g/kg, Fat 0.8 g/kg, Carbs = remaining
-    protein_g = int(round(1.6 * weight))
-    fat_g = int(round(0.8 * weight))
+    protein_g = int(np.rint(1.6 * weight))
+    fat_g = int(np.rint(0.8 * weight))
     remaining_kcal = calories - (protein_g * 4 + fat_g * 9)
-    carbs_g = int(max(0, round(remaining_kcal / 4)))
+    carbs_g = int(max(0.0, np.rint(remaining_kcal / 4)))
+    return calories, protein_g, fat_g, carbs_g
+
+if njit is not None:
+    try:
+        _fallback_macros = njit(cache=True)(_fallback_macros)
+    except Exception:
+        pass
+
+def _label(value: Any, default: str) -> str:
+    # Empty and non-text cells (e.g. NaN from a CSV) fall back to the default label
+    return value if isinstance(value, str) and value else default
+
+# Label -> int code for _fallback_macros, per profile field: (default label, encoder of the lowercased label)
+_FALLBACK_LABELS = {
+    "Gender": ("male", lambda g: 0 if g == "male" else 1),
+    # Map activity label loosely
+    "Exercise_Frequency": ("moderately_active", lambda a: _ACTIVITY_CODES.get(a.replace(" ", "_"), 2)),
+    "Current_Goals": ("Maintenance", lambda g: _GOAL_LOSS if "loss" in g else _GOAL_GAIN if "gain" in g else _GOAL_MAINTAIN),
+}
+
+def _fallback_codes(f: Dict[str, Any]):
+    """Encode gender, activity and goal labels of a validated profile for _fallback_macros."""
+    return tuple(encode(_label(f.get(col), default).lower()) for col, (default, encode) in _FALLBACK_LABELS.items())
+
+def _fallback_plan(fields: dict) -> Dict[str, Any]:
+    # Fallback: compute macros deterministically from profile
+    f = validate_and_defaults(fields or {})
+    weight = f.get("Weight_kg") or 70
+    height = f.get("Height_cm") or 170
+    age = f.get("Age") or 25
+    gender_code, activity_code, goal_code = _fallback_codes(f)
+    calories, protein_g, fat_g, carbs_g = _fallback_macros(
+        float(weight), float(height), float(age), gender_code, activity_code, goal_code
+    )
 
-    meals = {
-        "breakfast": "Oats + yogurt + fruit",
-        "lunch": "Lean protein + rice + vegetables",
-        "snack": "Nuts or yogurt",
-        "dinner": "Chicken/tofu + salad + sweet potato",
-    }
     return {
         "calories": calories,
         "protein_g": protein_g,
         "carbs_g": carbs_g,
         "fats_g": fat_g,
-        "meals": meals,
+        "meals": dict(_FALLBACK_MEALS),
     }
 
+def _fallback_plans(vdf) -> List[Dict[str, Any]]:
+    """_fallback_plan for every row of a _validate_frame result in one pass of NumPy column math."""
+    import pandas as pd
+
+    def num(col: str, default: float) -> np.ndarray:
+        return pd.to_numeric(vdf[col], errors="coerce").fillna(default).to_numpy(dtype=np.float64)
+
+    def codes(col: str) -> np.ndarray:
+        # Each distinct label is encoded once (pd.factorize), then gathered by code;
+        # code -1 (missing) picks the trailing default entry
+        default, encode = _FALLBACK_LABELS[col]
+        if col not in vdf.columns:
+            return np.full(len(vdf), encode(default.lower()), dtype=np.int64)
+        idx, uniques = pd.factorize(vdf[col])
+        table = np.array([encode(_label(u, default).lower()) for u in uniques] + [encode(default.lower())], dtype=np.int64)
+        return table[idx]
+
+    weight, height, age = num("Weight_kg", 70), num("Height_cm", 170), num("Age", 25)
+    male = codes("Gender") == 0
+    activity_codes = codes("Exercise_Frequency")
+    goal = codes("Current_Goals")
+    loss, gain = goal == _GOAL_LOSS, goal == _GOAL_GAIN
+
+    # Same expressions as _fallback_macros, column-wise
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + np.where(male, 5.0, -161.0)
+    tdee = bmr * _ACTIVITY_MULTIPLIERS[activity_codes]
+    calories = np.trunc(np.where(loss, np.maximum(1200.0, tdee - 400), np.where(gain, tdee + 250, tdee))).astype(np.int64)
+    protein_g = np.rint(1.6 * weight).astype(np.int64)
+    fat_g = np.rint(0.8 * weight).astype(np.int64)
+    remaining_kcal = calories - (protein_g * 4 + fat_g * 9)
+    carbs_g = np.maximum(0.0, np.rint(remaining_kcal / 4)).astype(np.int64)
+
+    return [
+        {"calories": c, "protein_g": p, "carbs_g": cb, "fats_g": fg, "meals": dict(_FALLBACK_MEALS)}
+        for c, p, cb, fg in zip(calories.tolist(), protein_g.tolist(), carbs_g.tolist(), fat_g.tolist())
+    ]
+
+async def _score_rows(rows: List[dict], model: str, batch_size: int = 1) -> List[Dict[str, Any]]:
+    """get_plan_json for every row with up to MEAL_BATCH_CONCURRENCY requests in flight.
+    The LLM path awaits ainvoke on one shared client, sending batch_size profiles per request
+    (a chunk whose reply is not a matching JSON array is retried row by row); the sync
+    Mistral SDK and the deterministic fallback run in worker threads.
+    """
+    sem = asyncio.Semaphore(max(1, MEAL_BATCH_CONCURRENCY))
+    llm = None
+    chosen_model = ""
+    if _llm_configured():
+        try:
+            chosen_model = os.getenv("PLAN_LLM_MODEL") or os.getenv("LLM_MODEL") or model
+            llm = get_llm(model_name=chosen_model)
+        except Exception:
+            llm = None
+
+    async def _score_row(fields: dict, key: Optional[str]) -> Dict[str, Any]:
+        async with sem:
+            if llm is not None:
+                try:
+                    llm_resp = await llm.ainvoke(_plan_messages(fields, chosen_model))
+                    return _plan_cache_put(key, _plan_from_content(getattr(llm_resp, "content", None) or str(llm_resp)))
+                except Exception:
+                    pass
+            # Cached by _plan_without_llm under the Mistral key, never under the LLM's `key`
+            return await asyncio.to_thread(_plan_without_llm, fields, model)
+
+    async def _score_chunk(chunk: List[dict]) -> List[Dict[str, Any]]:
+        keys = [_plan_cache_key(fields, model) for fields in chunk]
+        plans: List[Optional[Dict[str, Any]]] = [_plan_cache_get(key) for key in keys]
+        todo = [i for i, plan in enumerate(plans) if plan is None]
+        if llm is not None and len(todo) > 1:
+            async with sem:
+                try:
+                    try:
+                        batch_llm = llm.bind(max_tokens=PLAN_MAX_TOKENS * len(todo))
+                    except Exception:
+                        batch_llm = llm
+                    llm_resp = await batch_llm.ainvoke(_batch_messages([chunk[i] for i in todo], chosen_model))
+                    batch = _plans_from_batch_content(getattr(llm_resp, "content", None) or str(llm_resp), len(todo))
+                    if batch is not None:
+                        for i, plan in zip(todo, batch):
+                            plans[i] = _plan_cache_put(keys[i], plan)
+                        todo = []
+                except Exception:
+                    pass
+        for i, plan in zip(todo, await asyncio.gather(*[_score_row(chunk[i], keys[i]) for i in todo])):
+            plans[i] = plan
+        return plans
+
+    size = max(1, batch_size)
+    chunks = await asyncio.gather(*[_score_chunk(rows[i : i + size]) for i in range(0, len(rows), size)])
+    return [plan for chunk in chunks for plan in chunk]
+
+def get_plans_json_batch(fields_list: List[dict], batch_size: int = 8, model: str = "ft:ministral-3b-latest:df8cc3b5:20250821:100048bc") -> List[Dict[str, Any]]:
+    """Plans for many profiles, in input order. With the provider-agnostic LLM configured,
+    batch_size profiles share one request (one JSON array reply), amortizing the shared
+    instruction and per-call overhead; otherwise, or on a malformed reply, rows go one by one.
+    """
+    return asyncio.run(_score_rows(list(fields_list), model, batch_size))
+
 def batch_score_csv(input_csv: str, output_csv: str, model: str = "ft:ministral-3b-latest:df8cc3b5:20250821:100048bc") -> None:
     """Read user rows from CSV and write a CSV with a plan_json column for QA."""
     import pandas as pd
     df = pd.read_csv(input_csv)
-    plans: List[str] = []
-    for _, row in df.iterrows():
-        fields = row.to_dict()
-        plan = get_plan_json(fields, model=model)
-        plans.append(json.dumps(plan, ensure_ascii=False))
+    # Validated column-wise up front, then one C-level pass instead of a pandas Series per row
+    vdf = _validate_frame(df)
+    if not _llm_configured() and client is None:
+        # Every row would take the deterministic fallback: compute them all column-wise
+        scored = _fallback_plans(vdf)
+    else:
+        scored = get_plans_json_batch(_validated_records(vdf), model=model)
+    plans: List[str] = [_json_dumps(plan) for plan in scored]
     df_out = df.copy()
     df_out["plan_json"] = plans
-    df_out.to_csv(output_csv, index=False)
+    df_out.to_csv(output_csv, index=False, chunksize=1024)
 
 # Example usage from your UI form (single request):
 if __name__ == "__main__":
@@ -224,6 +715,6 @@ if __name__ == "__main__":
         "Current_Goals": "Muscle gain", "Dietary_Preferences": "High-protein, halal",
     }
     result = get_plan_json(sample)
-    print(json.dumps(result, ensure_ascii=False))
+    print(_json_dumps(result))
     # Batch scoring example (uncomment to run):
     # batch_score_csv("diet_data.csv", "diet_plans_scored.csv")
\ No newline at end of file
@@ -1,53 +1,187 @@
+import mmap
+import multiprocessing
 import os
-from typing import List, Dict, Any
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterator, List, Dict, Any, Optional, Tuple
 from langchain_community.document_loaders import PyPDFLoader, CSVLoader, DirectoryLoader, TextLoader, WebBaseLoader
 from langchain_core.documents import Document
 import frontmatter
 
+# Threads for I/O-bound loading (sources, Markdown files, web pages)
+IO_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Processes for PDF parsing, which is pure-Python and holds the GIL
+PDF_WORKERS = os.cpu_count() or 1
+
+
+def _load_pdf(path: str) -> List[Document]:
+    return PyPDFLoader(path).load()
+
+
+def _load_pdfs(paths: List[str]) -> List[Document]:
+    if len(paths) < 2:
+        return [d for p in paths for d in _load_pdf(p)]
+    try:
+        # Spawned, not forked: this runs on a thread of load_documents_from_sources' pool,
+        # and forking a multi-threaded process can deadlock the child
+        with ProcessPoolExecutor(
+            max_workers=min(PDF_WORKERS, len(paths)), mp_context=multiprocessing.get_context("spawn")
+        ) as ex:
+            results = list(ex.map(_load_pdf, paths))
+    except (BrokenProcessPool, OSError):
+        # No usable process pool (e.g. restricted sandbox): parse in this process.
+        # Parse errors propagate as they do for a single PDF.
+        results = [_load_pdf(p) for p in paths]
+    return [d for docs in results for d in docs]
+
+
+# Opening fences of the YAML, TOML and JSON front matter formats python-frontmatter detects
+_FRONT_MATTER_FENCES = ("---", "+++", ";;;")
+
+
+# python-frontmatter's YAML delimiter line
+_FM_BOUNDARY = re.compile(r"^-{3,}\s*$", re.MULTILINE)
+_FM_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_-]*$")
+# First characters that make YAML read a value as something other than a plain string
+# (quotes, flow/block syntax, anchors, tags, numbers, dates, .inf/.nan, ...)
+_FM_SPECIAL_START = set("-?:,[]{}#&*!|>'\"%@`=+.0123456789")
+# YAML 1.1 words that resolve to booleans or null, as keys or values
+_FM_RESERVED = {"true", "false", "yes", "no", "on", "off", "null", "~"}
+
+
+def _fm_plain(value: str) -> bool:
+    return (
+        bool(value)
+        and value[0] not in _FM_SPECIAL_START
+        and value.lower() not in _FM_RESERVED
+        and ": " not in value
+        and " #" not in value
+        and not value.endswith(":")
+        and value.isprintable()
+    )
+
+
+def _parse_flat_front_matter(text: str) -> Optional[Tuple[Dict[str, Any], str]]:
+    """
+    (metadata, content) for YAML front matter made only of `key: value` lines whose values YAML
+    would read as plain strings, parsed by hand with the same split and strip as python-frontmatter.
+    Returns None for anything else (nesting, lists, quoting, typed scalars, comments) so the
+    caller can hand it to frontmatter.
+    """
+    parts = _FM_BOUNDARY.split(text, 2)
+    if len(parts) != 3 or parts[0]:
+        return None
+    _, header, content = parts
+    meta: Dict[str, Any] = {}
+    for line in header.splitlines():
+        if not line.strip():
+            continue
+        if line[0] in " \t":
+            return None
+        key, sep, value = line.partition(":")
+        if value[:1] not in ("", " ", "\t"):
+            # "a:b" is a plain scalar line, not a key
+            return None
+        key, value = key.rstrip(), value.strip()
+        if not sep or not _FM_KEY.match(key) or key.lower() in _FM_RESERVED or key in meta or not _fm_plain(value):
+            return None
+        meta[key] = value
+    return meta, content.strip()
+
+
+def _iter_md(root: str) -> Iterator[str]:
+    """Yield .md file paths under `root`, walking with os.scandir and an explicit stack.
+    DirEntry type checks use the cached d_type, so entries are not stat()ed again."""
+    stack = [root]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(".md") and entry.is_file():
+                        yield entry.path
+        except OSError:
+            continue
+
+
+def _load_markdown_file(fp: str) -> List[Document]:
+    try:
+        with open(fp, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    # Decode straight from the mapping, no intermediate bytes copy. Normalize
+                    # newlines as text-mode open() did, so CRLF files still split on "\n\n"
+                    text = str(mm, "utf-8").replace("\r\n", "\n").replace("\r", "\n").strip()
+            else:
+                text = ""
+        parsed = _parse_flat_front_matter(text) if text.startswith("---") else None
+        if parsed is not None:
+            meta, content = parsed
+        elif text.startswith(_FRONT_MATTER_FENCES):
+            post = frontmatter.loads(text)
+            content = post.content or ""
+            meta = post.metadata or {}
+        else:
+            # No front matter: skip the parser and its format detection entirely
+            content, meta = text, {}
+        # Always include path for traceability
+        meta.setdefault("source_path", fp)
+        # Normalize common metadata keys
+        if "title" in meta:
+            meta["title"] = str(meta["title"]).strip()
+        if "url" in meta:
+            meta["source"] = meta.get("source") or meta.get("domain") or meta.get("publisher")
+        return [Document(page_content=content, metadata=meta)]
+    except Exception:
+        # Skip malformed files gracefully
+        return []
+
+
+def _load_source(source: Dict[str, Any]) -> List[Document]:
+    docs: List[Document] = []
+    stype = source.get("type")
+    if stype == "pdf" and (p := source.get("path")):
+        if os.path.isdir(p):
+            paths = sorted(
+                os.path.join(p, fn) for fn in os.listdir(p) if fn.endswith(".pdf") and os.path.isfile(os.path.join(p, fn))
+            )
+            docs.extend(_load_pdfs(paths))
+        elif os.path.isfile(p):
+            docs.extend(_load_pdf(p))
+    elif stype == "csv" and (p := source.get("path")) and os.path.isfile(p):
+        docs.extend(CSVLoader(file_path=p, encoding="utf-8").load())
+    elif stype == "text" and (p := source.get("path")):
+        if os.path.isdir(p):
+            docs.extend(DirectoryLoader(p, glob="*.txt", loader_cls=TextLoader, use_multithreading=True).load())
+        elif os.path.isfile(p):
+            docs.extend(TextLoader(p).load())
+    elif stype == "markdown" and (p := source.get("path")):
+        # Load Markdown files with YAML front matter and convert to Documents
+        if os.path.isdir(p):
+            file_paths = _iter_md(p)
+        elif os.path.isfile(p) and p.lower().endswith(".md"):
+            file_paths = iter([p])
+        else:
+            file_paths = iter(())
+
+        with ThreadPoolExecutor(max_workers=IO_WORKERS) as ex:
+            for file_docs in ex.map(_load_markdown_file, file_paths):
+                docs.extend(file_docs)
+    elif stype == "website" and (urls := source.get("urls")):
+        # One loader per URL so the page fetches overlap
+        with ThreadPoolExecutor(max_workers=min(IO_WORKERS, len(urls))) as ex:
+            for page_docs in ex.map(lambda url: WebBaseLoader(web_paths=[url]).load(), urls):
+                docs.extend(page_docs)
+    return docs
+
+
 def load_documents_from_sources(sources_config: List[Dict[str, Any]]):
+    # Sources load concurrently; results keep the configured order
     docs = []
-    for source in sources_config:
-        stype = source.get("type")
-        if stype == "pdf" and (p := source.get("path")):
-            if os.path.isdir(p):
-                docs.extend(DirectoryLoader(p, glob="*.pdf", loader_cls=PyPDFLoader).load())
-            elif os.path.isfile(p):
-                docs.extend(PyPDFLoader(p).load())
-        elif stype == "csv" and (p := source.get("path")) and os.path.isfile(p):
-            docs.extend(CSVLoader(file_path=p, encoding="utf-8").load())
-        elif stype == "text" and (p := source.get("path")):
-            if os.path.isdir(p):
-                docs.extend(DirectoryLoader(p, glob="*.txt", loader_cls=TextLoader).load())
-            elif os.path.isfile(p):
-                docs.extend(TextLoader(p).load())
-        elif stype == "markdown" and (p := source.get("path")):
-            # Load Markdown files with YAML front matter and convert to Documents
-            file_paths: List[str] = []
-            if os.path.isdir(p):
-                for root, _, filenames in os.walk(p):
-                    for fn in filenames:
-                        if fn.lower().endswith(".md"):
-                            file_paths.append(os.path.join(root, fn))
-            elif os.path.isfile(p) and p.lower().endswith(".md"):
-                file_paths.append(p)
-
-            for fp in file_paths:
-                try:
-                    with open(fp, "r", encoding="utf-8") as f:
-                        post = frontmatter.load(f)
-                    content = post.content or ""
-                    meta = post.metadata or {}
-                    # Always include path for traceability
-                    meta.setdefault("source_path", fp)
-                    # Normalize common metadata keys
-                    if "title" in meta:
-                        meta["title"] = str(meta["title"]).strip()
-                    if "url" in meta:
-                        meta["source"] = meta.get("source") or meta.get("domain") or meta.get("publisher")
-                    docs.append(Document(page_content=content, metadata=meta))
-                except Exception:
-                    # Skip malformed files gracefully
-                    continue
-        elif stype == "website" and (urls := source.get("urls")):
-            docs.extend(WebBaseLoader(web_paths=urls).load())
+    with ThreadPoolExecutor(max_workers=min(IO_WORKERS, max(1, len(sources_config)))) as ex:
+        for source_docs in ex.map(_load_source, sources_config):
+            docs.extend(source_docs)
     return docs
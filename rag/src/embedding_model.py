@@ -1,4 +1,5 @@
 from typing import Optional
+import functools
 import os
 
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
@@ -8,13 +9,20 @@ try:
 except Exception:  # pragma: no cover - optional dependency
     OpenAIEmbeddings = None  # type: ignore
 
+from llm_model import get_http_client
+
 
 def get_gemini_embeddings(model_name: str = "text-embedding-004", api_key: Optional[str] = None):
     key = api_key or os.getenv("GOOGLE_API_KEY")
     if not key:
         raise ValueError("GOOGLE_API_KEY is not set.")
-    emb = GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=key)
-    return emb
+    return _gemini_embeddings(model_name, key)
+
+
+@functools.lru_cache(maxsize=8)
+def _gemini_embeddings(model_name: str, api_key: str):
+    # Cached per (model, key) like the LLM getters, so callers share one client
+    return GoogleGenerativeAIEmbeddings(model=model_name, google_api_key=api_key)
 
 
 def get_openrouter_embeddings(model_name: str = "openai/text-embedding-3-small", api_key: Optional[str] = None):
@@ -29,12 +37,17 @@ def get_openrouter_embeddings(model_name: str = "openai/text-embedding-3-small",
     if not key:
         raise ValueError("OPENROUTER_API_KEY is not set.")
     base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
-    emb = OpenAIEmbeddings(
+    return _openrouter_embeddings(model_name, key, base_url)
+
+
+@functools.lru_cache(maxsize=8)
+def _openrouter_embeddings(model_name: str, api_key: str, base_url: str):
+    return OpenAIEmbeddings(
         model=model_name,
-        api_key=key,
+        api_key=api_key,
         base_url=base_url,
+        http_client=get_http_client(),
     )
-    return emb
 
 
 def get_embeddings(model_name: Optional[str] = None, api_key: Optional[str] = None):
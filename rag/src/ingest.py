@@ -1,12 +1,41 @@
+import asyncio
 import os
-from typing import Optional
+from typing import List, Optional
 from config_loader import load_config
 from embedding_model import get_gemini_embeddings
-from vector_store import get_vector_store
+from vector_store import bulk_insert_embeddings, get_vector_store
 from document_loader import load_documents_from_sources
 from text_splitter import get_text_splitter
 from dotenv import load_dotenv
 
+# Chunks per embeddings request, and embeddings requests in flight during ingest
+EMBED_BATCH_SIZE = 128
+EMBED_CONCURRENCY = 8
+
+
+async def _aembed_batches(emb, texts: List[str]) -> List[List[float]]:
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+
+    async def _embed(batch: List[str]) -> List[List[float]]:
+        async with sem:
+            return await emb.aembed_documents(batch)
+
+    batches = [texts[i : i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    results = await asyncio.gather(*[_embed(batch) for batch in batches])
+    return [vec for batch in results for vec in batch]
+
+
+def embed_splits(emb, splits) -> List[List[float]]:
+    """Embed all chunks with EMBED_CONCURRENCY batched requests in flight (network-bound, so
+    concurrency rather than one request after another). Falls back to the provider's own
+    sequential embed_documents if the async path fails."""
+    texts = [s.page_content for s in splits]
+    try:
+        return asyncio.run(_aembed_batches(emb, texts))
+    except Exception as e:
+        print(f"Concurrent embedding failed ({e}); embedding sequentially")
+        return emb.embed_documents(texts)
+
 
 def ingest(config_path: str = os.path.join(os.path.dirname(__file__), "..", "config.yaml"), api_key: Optional[str] = None):
     # Load .env (GOOGLE_API_KEY, etc.)
@@ -38,8 +67,16 @@ def ingest(config_path: str = os.path.join(os.path.dirname(__file__), "..", "con
         embedding_function=emb,
     )
 
-    # Add to store
-    vs.add_documents(splits)
+    # Add to store: embed concurrently here, then insert the precomputed vectors,
+    # with one COPY over a direct Postgres connection when SUPABASE_DB_URL is set
+    if hasattr(vs, "add_vectors"):
+        vectors = embed_splits(emb, splits)
+        texts = [s.page_content for s in splits]
+        metadatas = [s.metadata for s in splits]
+        if not bulk_insert_embeddings(vs_cfg, texts, vectors, metadatas):
+            vs.add_vectors(vectors, splits)
+    else:
+        vs.add_documents(splits)
     # Persist and report stats
     try:
         count = vs._collection.count() if hasattr(vs, "_collection") else None  # internal but useful for verification
@@ -1,4 +1,5 @@
 from typing import Optional
+import functools
 import os
 
 try:
@@ -7,6 +8,26 @@ try:
 except Exception:  # pragma: no cover - optional dependency
     ChatOpenAI = None  # type: ignore
 
+try:
+    import httpx
+except Exception:  # pragma: no cover - optional dependency
+    httpx = None  # type: ignore
+
+
+@functools.lru_cache(maxsize=1)
+def get_http_client():
+    """Process-wide keep-alive httpx client shared by the OpenRouter chat and embedding clients,
+    so TLS handshakes are paid once and requests multiplex over HTTP/2. HTTP/2 needs the 'h2'
+    package; without it the client stays on HTTP/1.1 keep-alive. Returns None if httpx is missing.
+    """
+    if httpx is None:
+        return None
+    limits = httpx.Limits(max_connections=128, max_keepalive_connections=64, keepalive_expiry=30)
+    try:
+        return httpx.Client(http2=True, timeout=60, limits=limits)
+    except ImportError:
+        return httpx.Client(timeout=60, limits=limits)
+
 
 def get_openrouter_llm(model_name: Optional[str] = None, api_key: Optional[str] = None):
     """
@@ -23,14 +44,22 @@ def get_openrouter_llm(model_name: Optional[str] = None, api_key: Optional[str]
     if not chosen_model:
         raise ValueError("OpenRouter model not specified. Set LLM_MODEL or pass model_name explicitly.")
     # Note: Use model ids as listed by OpenRouter, e.g. 'openai/gpt-4o-mini', 'anthropic/claude-3.5-haiku', 'qwen/qwen2.5-7b-instruct'
-    llm = ChatOpenAI(
-        model=chosen_model,
-        api_key=key,
+    return _openrouter_llm(chosen_model, key, base_url)
+
+
+@functools.lru_cache(maxsize=8)
+def _openrouter_llm(model: str, api_key: str, base_url: str):
+    """One client per (model, key, base_url): repeat callers reuse its HTTP session instead of
+    building a new client (and connection pool) per request. Arguments are resolved from env
+    by the caller, so a changed env var yields a new client rather than a stale one."""
+    return ChatOpenAI(
+        model=model,
+        api_key=api_key,
         base_url=base_url,
         temperature=0.1,
         max_tokens=500,
+        http_client=get_http_client(),
     )
-    return llm
 
 
 def get_llm(model_name: Optional[str] = None, api_key: Optional[str] = None):
@@ -1,7 +1,94 @@
+import io
+import json
 import os
+import uuid
+import numpy as np
 from langchain_community.vectorstores import SupabaseVectorStore
 from supabase import create_client
 
+# Default dimensionality of the configured embedding model (openai/text-embedding-3-small)
+EMBEDDING_DIM = 1536
+
+
+def _halfvec_schema_ddl(table_name: str, query_name: str, dim: int):
+    """
+    Table, index and match function for embeddings stored as pgvector halfvec (fp16, pgvector 0.7+).
+
+    Same columns and RPC signature SupabaseVectorStore expects, at half the bytes per row that
+    vector(dim) costs on disk, in the index and per similarity search. The RPC still takes a
+    full-precision query vector and casts it, so the client side is unchanged. Only run for a
+    table and function that do not exist yet (see _check_halfvec_schema).
+    """
+    return (
+        "CREATE EXTENSION IF NOT EXISTS vector",
+        f"""
+        CREATE TABLE IF NOT EXISTS "{table_name}" (
+            id uuid PRIMARY KEY,
+            content text,
+            metadata jsonb,
+            embedding halfvec({dim})
+        )
+        """,
+        f"""
+        CREATE INDEX IF NOT EXISTS "{table_name}_embedding_hnsw"
+        ON "{table_name}" USING hnsw (embedding halfvec_cosine_ops)
+        """,
+        f"""
+        CREATE FUNCTION "{query_name}" (
+            query_embedding vector({dim}),
+            match_count int DEFAULT NULL,
+            filter jsonb DEFAULT '{{}}'
+        ) RETURNS TABLE (id uuid, content text, metadata jsonb, similarity float)
+        LANGUAGE sql STABLE AS $$
+            SELECT t.id, t.content, t.metadata,
+                   1 - (t.embedding <=> query_embedding::halfvec({dim})) AS similarity
+            FROM "{table_name}" t
+            WHERE t.metadata @> filter
+            ORDER BY t.embedding <=> query_embedding::halfvec({dim})
+            LIMIT match_count
+        $$
+        """,
+    )
+
+
+def _check_halfvec_schema(cur, table_name: str, query_name: str) -> bool:
+    """
+    Whether the halfvec table still needs creating (True) or is already in place (False).
+
+    Raises ValueError instead of touching an existing schema it did not create: a table whose
+    embedding column is not halfvec (e.g. the default vector(1536) "embeddings" table), or a
+    match function of the same name serving another table.
+    """
+    cur.execute(
+        """
+        SELECT udt_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'embedding'
+        """,
+        (table_name,),
+    )
+    row = cur.fetchone()
+    if row is not None:
+        if row[0] != "halfvec":
+            raise ValueError(
+                f'embedding_type is halfvec but table "{table_name}" already stores {row[0]} embeddings. '
+                "halfvec needs a fresh table: set a new table_name and query_name in the vector_store config."
+            )
+        return False
+    cur.execute(
+        """
+        SELECT 1 FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace
+        WHERE n.nspname = current_schema() AND p.proname = %s
+        """,
+        (query_name,),
+    )
+    if cur.fetchone() is not None:
+        raise ValueError(
+            f'Function "{query_name}" already exists and would not search the new halfvec table '
+            f'"{table_name}": set a new query_name in the vector_store config.'
+        )
+    return True
+
+
 def get_vector_store(config, embedding_function):
     """
     Get a vector store based on the configuration.
@@ -30,6 +117,7 @@ def get_vector_store(config, embedding_function):
             or config.get("supabase_key")
         )
         table_name = config.get("table_name", "embeddings")
+        query_name = config.get("query_name", "match_documents")
 
         if not supabase_url or not supabase_key:
             raise ValueError(
@@ -44,6 +132,70 @@ def get_vector_store(config, embedding_function):
             client=supabase_client,
             embedding=embedding_function,
             table_name=table_name,
+            query_name=query_name,
         )
     else:
         raise ValueError(f"Unsupported vector store type: {vector_store_type}")
+
+
+def _copy_text(value: str) -> str:
+    """Escape a field for COPY ... FROM STDIN text format (Postgres text cannot hold NUL)."""
+    return (
+        value.replace("\x00", "")
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def bulk_insert_embeddings(config, texts, vectors, metadatas) -> bool:
+    """
+    Insert precomputed embeddings with a single Postgres COPY instead of batched REST calls.
+
+    Uses the direct database connection in SUPABASE_DB_URL (the pooler/Postgres URI from the
+    Supabase dashboard). With `embedding_type: halfvec` in the config, the halfvec table, index
+    and match function are created if missing and vectors are sent at fp16 precision; an
+    existing non-halfvec table or match function raises ValueError before any DDL runs. Returns
+    False without touching the database when the URL is unset, so callers can fall back to the
+    vector store's own insert path.
+    """
+    db_url = os.getenv("SUPABASE_DB_URL") or config.get("db_url")
+    if not db_url:
+        return False
+
+    import psycopg2
+
+    table_name = config.get("table_name", "embeddings")
+    halfvec = config.get("embedding_type", "vector").lower() == "halfvec"
+    buf = io.StringIO()
+    for text, vec, meta in zip(texts, vectors, metadatas):
+        if halfvec:
+            # Shortest fp16 repr: what the column will store anyway, in fewer bytes on the wire
+            vec_literal = "[" + ",".join(map(str, np.asarray(vec, dtype=np.float16))) + "]"
+        else:
+            vec_literal = "[" + ",".join(map(repr, map(float, vec))) + "]"
+        buf.write(
+            f"{uuid.uuid4()}\t{_copy_text(text)}\t{_copy_text(json.dumps(meta or {}, default=str))}\t{vec_literal}\n"
+        )
+    buf.seek(0)
+
+    conn = psycopg2.connect(db_url)
+    try:
+        with conn, conn.cursor() as cur:
+            query_name = config.get("query_name", "match_documents")
+            if halfvec and _check_halfvec_schema(cur, table_name, query_name):
+                ddl = _halfvec_schema_ddl(
+                    table_name,
+                    query_name,
+                    int(config.get("embedding_dim", EMBEDDING_DIM)),
+                )
+                for stmt in ddl:
+                    cur.execute(stmt)
+            cur.copy_expert(
+                f'COPY "{table_name}" (id, content, metadata, embedding) FROM STDIN',
+                buf,
+            )
+    finally:
+        conn.close()
+    return True
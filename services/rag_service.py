@@ -50,3 +50,21 @@ def init_rag(cfg_path: str) -> Dict[str, Any]:
         return_source_documents=True,
     )
     return {"qa_chain": qa_chain, "llm": llm, "retriever": retriever}
+
+
+def warmup(cfg_path: str) -> None:
+    """
+    Build the embedding and LLM clients for this config ahead of the first RAG request.
+    Both getters cache their clients per process, so init_rag later reuses these instances.
+    Best effort: any failure is left for init_rag to surface in the UI.
+    """
+    try:
+        from config_loader import load_config as _load_config
+        from embedding_model import get_embeddings as _get_emb
+        from llm_model import get_llm as _get_llm
+
+        cfg = _load_config(cfg_path)
+        _get_emb(model_name=cfg["gemini"]["embedding_model"])
+        _get_llm(model_name=cfg["gemini"]["llm_model"])
+    except Exception:
+        pass
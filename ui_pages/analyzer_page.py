@@ -97,13 +97,10 @@ def render_analyzer_page(db_manager: Any):
             )
 
             if st.session_state.user_data and details:
-                meal_log_id = db_manager.save_meal_log(
+                db_manager.save_meal_with_analysis(
                     st.session_state.user_data["id"],
                     meal_description,
                     uploaded_file.name if uploaded_file else None,
-                )
-                db_manager.save_nutrition_analysis(
-                    meal_log_id,
                     calories=totals.get("calories", 0),
                     protein=totals.get("protein_g", 0),
                     carbs=totals.get("carbs_g", 0),
@@ -120,7 +117,9 @@ def render_analyzer_page(db_manager: Any):
             try:
                 if "nutrinet_vision" not in st.session_state:
                     with st.spinner("Loading food vision model..."):
+                        # Stored before loading so a failed load is remembered, not retried per click
                         st.session_state.nutrinet_vision = NutriNetVision()
+                        st.session_state.nutrinet_vision.load()
 
                 image = Image.open(uploaded_file).convert("RGB")
                 st.image(image, caption="Meal photo", width=400)
@@ -179,7 +178,7 @@ def render_analyzer_page(db_manager: Any):
 
                     if st.session_state.user_data:
                         meal_desc = meal_description or f"Image: {name}"
-                        meal_log_id = db_manager.save_meal_log(
+                        db_manager.save_meal_with_analysis(
                             st.session_state.user_data["id"],
                             meal_desc,
                             (
@@ -187,9 +186,6 @@ def render_analyzer_page(db_manager: Any):
                                 if hasattr(uploaded_file, "name")
                                 else None
                             ),
-                        )
-                        db_manager.save_nutrition_analysis(
-                            meal_log_id,
                             calories=float(nutrition.get("calories", 0) or 0),
                             protein=float(nutrition.get("protein_g", 0) or 0),
                             carbs=float(nutrition.get("carbs_g", 0) or 0),
@@ -0,0 +1,64 @@
+import threading
+from typing import Optional
+
+import numpy as np
+
+
+class AudioRingBuffer:
+    """Preallocated int16 ring buffer between a sounddevice callback and the STT loop.
+
+    Single producer (the PortAudio callback) and single consumer. The callback
+    only copies samples into the preallocated array; bytes are materialized on
+    the consumer side, at the Vosk boundary. On overrun the oldest audio is dropped.
+    """
+
+    def __init__(self, blocksize: int, blocks: int = 32):
+        self._capacity = blocksize * blocks
+        self._buf = np.zeros(self._capacity, dtype=np.int16)
+        self._written = 0  # total samples written
+        self._read = 0  # total samples consumed
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def write(self, indata) -> None:
+        """Copy one callback block (raw int16 buffer) into the ring."""
+        samples = np.frombuffer(indata, dtype=np.int16)
+        n = min(samples.shape[0], self._capacity)
+        samples = samples[-n:]
+        start = self._written % self._capacity
+        first = min(n, self._capacity - start)
+        np.copyto(self._buf[start : start + first], samples[:first])
+        if first < n:
+            np.copyto(self._buf[: n - first], samples[first:])
+        with self._cond:
+            self._written += n
+            if self._written - self._read > self._capacity:
+                self._read = self._written - self._capacity
+            self._cond.notify()
+
+    def read(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        """Block until samples are available and return them as PCM bytes.
+        Returns None on timeout, or once the buffer is closed and drained.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._written != self._read or self._closed, timeout)
+            start, end = self._read, self._written
+            self._read = end
+        if start == end:
+            return None
+        lo = start % self._capacity
+        hi = lo + (end - start)
+        if hi <= self._capacity:
+            return self._buf[lo:hi].tobytes()
+        return self._buf[lo:].tobytes() + self._buf[: hi - self._capacity].tobytes()
+
+    def close(self) -> None:
+        """Wake any blocked reader; subsequent reads return None once drained."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def clear(self) -> None:
+        """Discard everything buffered so far."""
+        with self._cond:
+            self._read = self._written
@@ -0,0 +1,124 @@
+import glob
+import hashlib
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from semantic_cache import SentenceTransformer, encoder_identity, load_encoder
+
+try:
+    import faiss
+except Exception:
+    faiss = None
+
+# Below this many foods an exact flat scan is as fast as HNSW and never misses
+HNSW_MIN_ITEMS = 10_000
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 64
+HNSW_EF_SEARCH = 64
+
+
+class FoodEmbeddingIndex:
+    """Nearest KB food to an utterance by sentence-embedding similarity.
+
+    Catches paraphrases the substring scan misses ("an apple" vs "apples"). All food names
+    are batch-encoded once into L2-normalized float32 vectors. With faiss installed they go
+    into an inner-product index (HNSW for large KBs), saved as `<cache_prefix>.<digest>.faiss`
+    (digest of the encoder identity and the names) and memory-mapped on later starts so the
+    names are not re-encoded. Without faiss a lookup is one matrix-vector product followed by
+    argmax.
+    """
+
+    def __init__(
+        self,
+        names: List[str],
+        encoder: Optional[SentenceTransformer] = None,
+        threshold: float = 0.6,
+        cache_prefix: Optional[str] = None,
+    ):
+        self.encoder = encoder if encoder is not None else load_encoder()
+        self.threshold = threshold
+        self._size = len(names)
+        self._embs = None
+        self._faiss = None
+        if not names:
+            return
+        path = None
+        if faiss is not None and cache_prefix:
+            # Keyed on the encoder actually in use: the int8 ONNX and fp32 models (or a caller's
+            # own encoder) embed into different spaces, so their indexes are not interchangeable
+            key = "\n".join([encoder_identity(self.encoder), *names])
+            digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            path = f"{cache_prefix}.{digest}.faiss"
+            self._faiss = self._read_index(path)
+        if self._faiss is not None:
+            return
+        embs = self.encoder.encode(
+            names, batch_size=256, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32, copy=False)
+        if faiss is None:
+            self._embs = embs
+            return
+        self._faiss = self._build_index(embs)
+        if path is not None:
+            self._write_index(path, cache_prefix)
+
+    @staticmethod
+    def _build_index(embs: np.ndarray):
+        dim = embs.shape[1]
+        if len(embs) >= HNSW_MIN_ITEMS:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        else:
+            index = faiss.IndexFlatIP(dim)
+        index.add(np.ascontiguousarray(embs))
+        return index
+
+    def _read_index(self, path: str):
+        if not os.path.exists(path):
+            return None
+        try:
+            # Memory-mapped so processes share the pages; not every faiss build supports it
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except Exception:
+            try:
+                index = faiss.read_index(path)
+            except Exception:
+                return None
+        if index.ntotal != self._size:
+            return None
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+
+    def _write_index(self, path: str, cache_prefix: str) -> None:
+        try:
+            faiss.write_index(self._faiss, path)
+        except Exception as e:
+            print(f"⚠️  Could not write food index {path}: {e}")
+            return
+        # Indexes for earlier versions of the KB are never read again
+        for stale in glob.glob(glob.escape(cache_prefix) + ".*.faiss"):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def match(self, text: str) -> Optional[Tuple[int, float]]:
+        """(food index, cosine score) of the best match, or None below the threshold."""
+        if not self._size:
+            return None
+        q = self.encoder.encode(text, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)
+        if self._faiss is not None:
+            scores, ids = self._faiss.search(q.reshape(1, -1), 1)
+            best, score = int(ids[0, 0]), float(scores[0, 0])
+            if best < 0:
+                return None
+        else:
+            sims = self._embs @ q
+            best = int(np.argmax(sims))
+            score = float(sims[best])
+        return (best, score) if score >= self.threshold else None
@@ -0,0 +1,106 @@
+import hashlib
+import platform
+import threading
+from typing import Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+DEFAULT_ENCODER = "sentence-transformers/all-MiniLM-L6-v2"
+# int8-quantized ONNX exports shipped in the all-MiniLM-L6-v2 repo (VNNI kernels on x86)
+_QUANTIZED_FILE = (
+    "onnx/model_qint8_arm64.onnx"
+    if platform.machine().lower() in ("arm64", "aarch64")
+    else "onnx/model_qint8_avx512_vnni.onnx"
+)
+
+
+def load_encoder(model_name: str = DEFAULT_ENCODER, quantized: bool = True) -> SentenceTransformer:
+    """CPU sentence encoder: the int8 ONNX export through onnxruntime when the
+    sentence-transformers onnx backend is installed, else the fp32 PyTorch model."""
+    if quantized:
+        try:
+            encoder = SentenceTransformer(
+                model_name,
+                device="cpu",
+                backend="onnx",
+                model_kwargs={"file_name": _QUANTIZED_FILE, "provider": "CPUExecutionProvider"},
+            )
+            encoder.encoder_id = f"{model_name}:onnx:{_QUANTIZED_FILE}"
+            return encoder
+        except Exception:
+            pass
+    encoder = SentenceTransformer(model_name, device="cpu")
+    encoder.encoder_id = f"{model_name}:torch"
+    return encoder
+
+
+# Fixed input whose embedding fingerprints an encoder that was not built by load_encoder
+_PROBE_TEXT = "grilled chicken breast with brown rice"
+
+
+def encoder_identity(encoder: SentenceTransformer) -> str:
+    """Identifies the embedding space an encoder produces, for keying persisted vectors.
+    Model name plus backend/file for load_encoder() encoders; otherwise a digest of the
+    encoder's own (rounded) embedding of a fixed probe sentence."""
+    encoder_id = getattr(encoder, "encoder_id", None)
+    if encoder_id:
+        return encoder_id
+    probe = encoder.encode(_PROBE_TEXT, normalize_embeddings=True, convert_to_numpy=True)
+    digest = hashlib.sha1(np.round(probe.astype(np.float32), 4).tobytes()).hexdigest()[:16]
+    return f"{type(encoder).__name__}:probe:{digest}"
+
+
+class SemanticCache:
+    """Reuses answers for near-duplicate questions ("calories in an apple" vs "how many
+    calories does an apple have") by cosine similarity of sentence embeddings.
+
+    Entries are only compared within the same context key (the matched KB food), so a close
+    paraphrase about a different food never hits. Embeddings are L2-normalized rows of a
+    preallocated float32 matrix used as a ring; a lookup is one matrix-vector product.
+    """
+
+    def __init__(
+        self,
+        encoder: Optional[SentenceTransformer] = None,
+        threshold: float = 0.92,
+        maxsize: int = 512,
+    ):
+        self.model = encoder if encoder is not None else load_encoder()
+        self.threshold = threshold
+        dim = self.model.get_sentence_embedding_dimension()
+        self._embs = np.zeros((maxsize, dim), dtype=np.float32)
+        self._ctx = np.full(maxsize, -1, dtype=np.int32)
+        self._answers = [None] * maxsize
+        self._ctx_ids: Dict[Hashable, int] = {}
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.model.encode(text, normalize_embeddings=True, convert_to_numpy=True).astype(np.float32, copy=False)
+
+    def get(self, text: str, context: Hashable) -> Tuple[Optional[str], np.ndarray]:
+        """Return (cached answer or None, the question's embedding for a later put())."""
+        q = self.embed(text)
+        with self._lock:
+            cid = self._ctx_ids.get(context)
+            if cid is None or not self._size:
+                return None, q
+            n = self._size
+            sims = self._embs[:n] @ q
+            sims[self._ctx[:n] != cid] = -1.0
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                return self._answers[best], q
+        return None, q
+
+    def put(self, embedding: np.ndarray, context: Hashable, answer: str) -> None:
+        with self._lock:
+            cid = self._ctx_ids.setdefault(context, len(self._ctx_ids))
+            slot = self._next
+            self._embs[slot] = embedding
+            self._ctx[slot] = cid
+            self._answers[slot] = answer
+            self._next = (slot + 1) % len(self._answers)
+            self._size = min(self._size + 1, len(self._answers))
@@ -16,5 +16,9 @@ class VoskSTT:
     def get_result(self) -> dict:
         return json.loads(self.recognizer.Result())
 
+    def get_final_result(self) -> dict:
+        """Flush the recognizer and return the transcript of the current utterance."""
+        return json.loads(self.recognizer.FinalResult())
+
     def get_partial(self) -> dict:
         return json.loads(self.recognizer.PartialResult())
@@ -0,0 +1,73 @@
+import collections
+from typing import Tuple
+
+import numpy as np
+import torch
+from silero_vad import load_silero_vad
+
+
+class SileroVAD:
+    """Speech gate in front of the recognizer so silence never reaches Vosk.
+
+    Audio is scored in 512-sample windows (32 ms at 16 kHz, the size Silero expects).
+    A segment opens after `min_speech_ms` of consecutive speech (the pre-roll that
+    triggered it is emitted too) and closes after `min_silence_ms` of silence.
+    """
+
+    def __init__(
+        self,
+        samplerate: int = 16000,
+        threshold: float = 0.5,
+        min_speech_ms: int = 250,
+        min_silence_ms: int = 500,
+    ):
+        self.model = load_silero_vad()
+        self.samplerate = samplerate
+        self.threshold = threshold
+        self.frame = 512 if samplerate == 16000 else 256
+        frame_ms = self.frame * 1000 / samplerate
+        self._min_speech = max(1, int(min_speech_ms / frame_ms))
+        self._min_silence = max(1, int(min_silence_ms / frame_ms))
+        self._preroll = collections.deque(maxlen=self._min_speech)
+        self._carry = b""
+        self._speech_run = 0
+        self._silence_run = 0
+        self.active = False
+
+    def _is_speech(self, chunk: bytes) -> bool:
+        x = torch.from_numpy(np.frombuffer(chunk, dtype=np.int16).astype(np.float32) / 32768.0)
+        with torch.no_grad():
+            return self.model(x, self.samplerate).item() >= self.threshold
+
+    def process(self, pcm_bytes: bytes) -> Tuple[bytes, bool]:
+        """Gate one block of int16 mono PCM.
+        Returns (speech_bytes, ended): audio to feed the recognizer, and whether a
+        speech segment closed in this block (caller should finalize the transcript).
+        """
+        buf = self._carry + pcm_bytes
+        step = self.frame * 2
+        usable = len(buf) - len(buf) % step
+        self._carry = buf[usable:]
+        out = []
+        for off in range(0, usable, step):
+            chunk = buf[off : off + step]
+            speech = self._is_speech(chunk)
+            if self.active:
+                out.append(chunk)
+                self._silence_run = 0 if speech else self._silence_run + 1
+                if self._silence_run >= self._min_silence:
+                    # Segment closed: keep the rest for the next call so segments never mix
+                    self._carry = buf[off + step : usable] + self._carry
+                    self.active = False
+                    self._speech_run = 0
+                    self._silence_run = 0
+                    self.model.reset_states()
+                    return b"".join(out), True
+            else:
+                self._preroll.append(chunk)
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self._min_speech:
+                    self.active = True
+                    out.extend(self._preroll)
+                    self._preroll.clear()
+        return b"".join(out), False